@@ -0,0 +1,12 @@
+"""hdldepends: dependency and compile order analysis of HDL projects, see Project for the Python API"""
+
+__all__ = ["Project", "HdlFile", "ProjectIndex", "set_log_level"]
+
+
+def __getattr__(name):
+    # imported on first use so `python -m hdldepends.hdldepends` does not import the module twice
+    if name in __all__:
+        from . import hdldepends
+
+        return getattr(hdldepends, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
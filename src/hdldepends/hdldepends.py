@@ -1,31 +1,33 @@
 # vi: foldmethod=marker
 import os
+import gc
+import io
 import re
 import sys
+import copy
 import glob
-import json
+import stat
+import time
+import struct
 import pickle
-import argparse
-import subprocess
-import xml.etree.ElementTree as xml_et
-
-tomllib = None
-try:
-    import tomllib
-except ModuleNotFoundError:
-    try:
-        import tomli as tomllib # type: ignore
-    except ModuleNotFoundError:
-        pass
+import fnmatch
+import hashlib
+import threading
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
 
-yaml = None
-try:
-    import yaml # type: ignore
-except ModuleNotFoundError:
-    pass
+# xml, subprocess, tomllib and yaml are only imported by the code that needs them, as are the modules of the optional
+# index, bundle and serve features (sqlite3, tarfile, socket), so warm cache runs do not pay for them. argparse, json,
+# shlex and tempfile are only needed by the command line, some outputs and writing files, so the Python API does not
+# import them. The modules above are needed to load any project (concurrent.futures by the sub config loads, hashlib
+# by the config and summary checks, array by the dependency graph) or are imported by pathlib anyway (re, fnmatch).
+# test/test_startup_time.py checks the time of a warm cache run stays within its budget.
 
+tomllib = None  # only imported once a TOML config is loaded see import_tomllib()
+yaml = None  # optional, only imported once a YAML config is loaded see import_yaml()
 
-from pathlib import Path
+
+from pathlib import Path, PurePath
 from enum import Enum, auto
 from dataclasses import dataclass
 from typing import Optional, Union, List, Tuple, Set, Dict
@@ -37,9 +39,15 @@ log_level = 0
 
 
 class log:
+    lock = threading.Lock()  # configs are loaded in threads, each line is written whole
+
     @staticmethod
     def _log(severity, *args, **kwargs):
-        print(f"[{severity}]", *args, **kwargs, file=sys.stderr)
+        line = io.StringIO()
+        print(f"[{severity}]", *args, **kwargs, file=line)
+        with log.lock:
+            sys.stderr.write(line.getvalue())
+            sys.stderr.flush()
 
     @staticmethod
     def error(*args, **kwargs):
@@ -65,7 +73,7 @@ class log:
 
 TOML_KEY_VER_SEP = "@"
 
-HDL_DEPENDS_VERSION_NUM = 1.04
+HDL_DEPENDS_VERSION_NUM = 1.08
 
 
 
@@ -93,6 +101,132 @@ def get_file_modification_time(f: Path):
     return f.lstat().st_mtime
 
 
+def get_input_state(loc: Union[str, Path], content: bool = False) -> Optional[str]:
+    """State of an input used to check it has not changed, None if it is missing. For a directory the names in
+    it (hidden files, like the caches written next to the configs, are ignored). For a file its modification
+    time, or with content the hash of its content (for config files a pre_cmd may write again unchanged)
+    """
+    try:
+        st = os.lstat(loc)  # one system call for the common case of a source file
+        if stat.S_ISDIR(st.st_mode) or (stat.S_ISLNK(st.st_mode) and os.path.isdir(loc)):
+            names = sorted(name for name in os.listdir(loc) if not name.startswith("."))
+            return "dir:" + hashlib.sha1("\n".join(names).encode()).hexdigest()
+        if content:
+            return "sha1:" + hashlib.sha1(Path(loc).read_bytes()).hexdigest()
+        return "mtime:" + str(st.st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+def get_input_states(locs: List[Path], content: bool = False) -> Dict[Path, Optional[str]]:
+    return {loc: get_input_state(loc, content) for loc in locs}
+
+
+def input_states_unchanged(states: Dict[Path, Optional[str]]) -> bool:
+    for loc, state in states.items():
+        content = state is not None and state.startswith("sha1:")
+        if get_input_state(loc, content) != state:
+            return False
+    return True
+
+
+class LazyRegex:
+    """A regex that is only compiled when first used, so runs that parse nothing do not pay for compiling it"""
+
+    def __init__(self, pattern: str, flags: int = 0):
+        self.pattern = pattern
+        self.flags = flags
+        self.regex: Optional[re.Pattern] = None
+
+    def __getattr__(self, name):
+        if self.regex is None:
+            self.regex = re.compile(self.pattern, self.flags)
+        return getattr(self.regex, name)
+
+
+_default_file_mode: Optional[int] = None
+
+
+def default_file_mode() -> int:
+    """Mode of a new file under the process umask, read once as reading the umask briefly changes it for every thread"""
+    global _default_file_mode
+    if _default_file_mode is None:
+        umask = os.umask(0)
+        os.umask(umask)
+        _default_file_mode = 0o666 & ~umask
+    return _default_file_mode
+
+
+def atomic_write(loc: Path, write, binary: bool = True, mode: Optional[int] = None, replace_if=None) -> bool:
+    """Call write(f) on a temporary file next to loc which then replaces loc, so readers never see a partial file and a
+    failed write leaves loc as it was. mode defaults to the mode of a new file. replace_if is called just before the
+    replace, if it returns False loc is left as it was. Returns True if loc was replaced
+    """
+    import tempfile
+
+    if mode is None:
+        mode = default_file_mode()
+    fd, tmp_loc = tempfile.mkstemp(prefix=f".{loc.name}.", suffix=".tmp", dir=loc.parent)
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            write(f)
+        if replace_if is not None and not replace_if():
+            os.unlink(tmp_loc)
+            return False
+        os.chmod(tmp_loc, mode)
+        os.replace(tmp_loc, loc)
+    except BaseException:
+        os.unlink(tmp_loc)
+        raise
+    return True
+
+
+def write_text_file(loc: Path, text: str) -> bool:
+    """Write text to loc. If the file already has this content it is not touched (keeping its modification time).
+    The text is written to a temporary file next to loc which then replaces loc, so readers never see a partial file.
+    Returns True if the file was written
+    """
+    loc = Path(loc)
+    try:
+        with open(loc, "r") as f:
+            if f.read() == text:
+                log.debug(f"{loc} unchanged")
+                return False
+        mode = loc.stat().st_mode & 0o777
+    except (FileNotFoundError, UnicodeDecodeError):
+        mode = None
+    return atomic_write(loc, lambda f: f.write(text), binary=False, mode=mode)
+
+
+def write_bytes_file(loc: Path, data: bytes):
+    """Write data to loc through a temporary file next to it, so readers never see a partial file"""
+    atomic_write(loc, lambda f: f.write(data))
+
+
+def file_sha256(loc: Path) -> str:
+    h = hashlib.sha256()
+    with open(loc, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def interface_fingerprint(text: str) -> str:
+    """Fingerprint of a design unit's interface text, ignoring whitespace changes"""
+    text = " ".join(text.split())
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def glob_pattern_root(base_path: Path, pattern: str) -> Path:
+    """The directory a glob pattern starts searching from (the path before the first wildcard)"""
+    root = base_path
+    for part in Path(pattern).parts[:-1]:
+        if glob.has_magic(part):
+            break
+        root = root / part
+    return resolve_abs_path(root)
+
+
 def str_to_name(s: str):
     l = s.split(".")
     if len(l) == 1:  # no lib use default
@@ -167,6 +301,84 @@ def read_text_file_contents(loc: Path):
 # }}}
 
 
+# Relocatable cache files {{{
+# Paths in the cache files (pickles, journals and snapshots) under an anchor directory are stored relative to it and
+# joined to the anchor again when loading, so the caches are still hits when the workspace is moved or restored
+# somewhere else (e.g. CI jobs each in their own directory). The anchor is the project root if one is given (see
+# cache_project_root, it is passed along with the other load options) otherwise the directory of the cache file.
+# Paths outside the anchor are stored as is.
+
+
+def cache_project_root(project_root: Optional[Path]) -> Optional[Path]:
+    """The project root cache contents are stored relative to, None uses $HDL_DEPENDS_PROJECT_ROOT if set"""
+    if project_root is None and os.environ.get("HDL_DEPENDS_PROJECT_ROOT"):
+        project_root = Path(os.environ["HDL_DEPENDS_PROJECT_ROOT"])
+    return None if project_root is None else resolve_abs_path(project_root)
+
+
+def get_cache_anchor(cache_loc: Path, project_root: Optional[Path] = None) -> Path:
+    if project_root is not None:
+        return project_root
+    return resolve_abs_path(cache_loc.parent)
+
+
+def relocated_path(rel: str) -> Path:
+    """Stands in for a path stored relative to the anchor, CacheUnpickler joins it to its anchor"""
+    raise pickle.UnpicklingError(f"relative cache path {rel} loaded without an anchor")
+
+
+class CachePickler(pickle.Pickler):
+    def __init__(self, file, cache_loc: Path, project_root: Optional[Path] = None):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        anchor = str(get_cache_anchor(cache_loc, project_root))
+        self.anchor_prefix = anchor if anchor.endswith(os.sep) else anchor + os.sep
+
+    def reducer_override(self, obj):
+        if isinstance(obj, PurePath):
+            loc = str(obj)
+            if loc.startswith(self.anchor_prefix):
+                return relocated_path, (loc[len(self.anchor_prefix) :],)
+        return NotImplemented
+
+
+class CacheUnpickler(pickle.Unpickler):
+    def __init__(self, file, cache_loc: Path, project_root: Optional[Path] = None):
+        super().__init__(file)
+        self.anchor = get_cache_anchor(cache_loc, project_root)
+
+    # only the types a cache is made of are loaded, so a cache (e.g. from a bundle) can not call any other function
+    PATH_TYPES = {"Path", "PosixPath", "WindowsPath", "PurePath", "PurePosixPath", "PureWindowsPath"}
+    CACHE_TYPE_NAMES = {
+        "Name", "FileObjType", "EdgeKind", "ResolvedDeps", "ConflictFileObj", "ResolveMiss", "EntityFilter", "FileLists", "LookupSummary", "LazyLookup"
+    }
+
+    def find_class(self, module, name):
+        if name == relocated_path.__name__ and module in ("__main__", "hdldepends.hdldepends", __name__):
+            return self.relocate
+        if module in ("__main__", "hdldepends.hdldepends", __name__):
+            # the same classes whether the caches were written by the hdldepends script, python -m or the Python API
+            obj = globals().get(name)
+            if isinstance(obj, type) and (issubclass(obj, (FileObj, Lookup)) or name in CacheUnpickler.CACHE_TYPE_NAMES):
+                return obj
+        elif module == "pathlib" and name in CacheUnpickler.PATH_TYPES:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a cache")
+
+    def relocate(self, rel: str) -> Path:
+        return self.anchor / rel
+
+
+def dump_cache(obj, f, cache_loc: Path, project_root: Optional[Path] = None):
+    CachePickler(f, cache_loc, project_root).dump(obj)
+
+
+def load_cache(f, cache_loc: Path, project_root: Optional[Path] = None):
+    return CacheUnpickler(f, cache_loc, project_root).load()
+
+
+# }}}
+
+
 def process_glob_patterns(patterns: List[str], base_path: Path = Path(".")) -> List[Path]:  # {{{
     """
     Process a list of glob patterns sequentially, including exclusion patterns (starting with '!'),
@@ -250,20 +462,161 @@ class Lookup:  # {{{
         self.x_tool_version = ""
         self.x_device = ""
         self.loc_2_file_obj: dict[Path, FileObj] = {}
+        # generation is bumped whenever the name indices change, it invalidates the resolution caches
+        self._generation = 0
+        self._generation_sum = 0  # of a LookupMulti, its generation plus those of its subs at _generation_sum_epoch
+        self._generation_sum_epoch = -1
+        self._resolve_cache: dict = {}
+        self._resolve_cache_generation = -1
+        self._file_deps_cache: dict = {}
+        self._file_deps_cache_generation = -1
+        self._x_entities_by_name: Dict[str, List[FileObj]] = {}
+        self._x_entities_generation = -1
+        self._entity_filter: Optional[EntityFilter] = None
+        self._entity_filter_generation = -1
+        self._dependency_graph: Optional[DependencyGraph] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_generation_sum_epoch"] = -1
+        state["_resolve_cache"] = {}
+        state["_resolve_cache_generation"] = -1
+        state["_file_deps_cache"] = {}
+        state["_file_deps_cache_generation"] = -1
+        state["_x_entities_by_name"] = {}
+        state["_x_entities_generation"] = -1
+        state["_entity_filter"] = None
+        state["_entity_filter_generation"] = -1
+        state["_dependency_graph"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_generation", 0)
+        self.__dict__.setdefault("_generation_sum", 0)
+        self.__dict__.setdefault("_generation_sum_epoch", -1)
+        self.__dict__.setdefault("_resolve_cache", {})
+        self.__dict__.setdefault("_resolve_cache_generation", -1)
+        self.__dict__.setdefault("_file_deps_cache", {})
+        self.__dict__.setdefault("_file_deps_cache_generation", -1)
+        self.__dict__.setdefault("_x_entities_by_name", {})
+        self.__dict__.setdefault("_x_entities_generation", -1)
+        self.__dict__.setdefault("_entity_filter", None)
+        self.__dict__.setdefault("_entity_filter_generation", -1)
+        self.__dict__.setdefault("_dependency_graph", None)
+
+    # bumped with the generation of any lookup, a LookupMulti only sums the generations of its subs again after it changed
+    generation_epoch = 0
+
+    def bump_generation(self):
+        self._generation += 1
+        Lookup.generation_epoch += 1
+
+    def get_generation(self) -> int:
+        return self._generation
 
     def loc_to_file_obj(self, loc) -> Optional["FileObj"]:
         raise Exception("Virtual called")
         return None
 
-    def get_vhdl_package(self, name: Name, f_obj_required_by: Optional["FileObjVhdl"]) -> Optional["FileObjVhdl"]:
+    def _resolve_vhdl_package(self, name: Name) -> "ResolveResult":
         raise Exception("Virtual called")
 
-    def get_verilog_package(self, name: Name, f_obj_required_by: Optional["FileObjVerilog"]) -> Optional["FileObjVerilog"]:
+    def _resolve_verilog_package(self, name: Name) -> "ResolveResult":
         raise Exception("Virtual called")
 
-    def get_entity(self, name: Name, f_obj_required_by: Optional["FileObj"], ignore_lib=False) -> Optional["FileObj"]:
+    def _resolve_entity(self, name: Name, ignore_lib=False) -> "ResolveResult":
         raise Exception("Virtual called")
 
+    def _cached_resolve(self, key: Tuple, resolve_func) -> "ResolveResult":
+        generation = self.get_generation()
+        if generation != self._resolve_cache_generation:
+            self._resolve_cache = {}
+            self._resolve_cache_generation = generation
+        if key in self._resolve_cache:
+            return self._resolve_cache[key]
+        result = resolve_func()
+        # found items are cached too, through a LookupMulti they are only found after searching the subs
+        self._resolve_cache[key] = result
+        return result
+
+    # Internal resolution API: returns the FileObj, None if the name is ignored or a ResolveMiss. Never raises.
+    def resolve_vhdl_package(self, name: Name) -> "ResolveResult":
+        return self._cached_resolve(("vhdl_package", name), lambda: self._resolve_vhdl_package(name))
+
+    def resolve_verilog_package(self, name: Name) -> "ResolveResult":
+        return self._cached_resolve(("verilog_package", name), lambda: self._resolve_verilog_package(name))
+
+    def resolve_entity(self, name: Name, ignore_lib=False) -> "ResolveResult":
+        return self._cached_resolve(("entity", name, ignore_lib), lambda: self._resolve_entity(name, ignore_lib))
+
+    def resolve_file_deps(self, f_obj: "FileObj") -> "ResolvedDeps":
+        """Resolved dependency edges of f_obj, computed once per lookup generation"""
+        generation = self.get_generation()
+        if generation != self._file_deps_cache_generation:
+            self._file_deps_cache = {}
+            self._file_deps_cache_generation = generation
+        resolved = self._file_deps_cache.get(f_obj)
+        if resolved is None:
+            resolved = f_obj._resolve_file_deps(self)
+            self._file_deps_cache[f_obj] = resolved
+        return resolved
+
+    def iter_file_objs(self):
+        """Yields every FileObj known to the lookup (including sub lookups), may yield a file more than once"""
+        return iter(())
+
+    def iter_entity_names(self):
+        """Yields the name of every entity/module known to the lookup (including sub lookups)"""
+        return iter(())
+
+    def get_dependency_graph(self, roots: Optional[List["FileObj"]] = None) -> "DependencyGraph":
+        """The explicit dependency graph of every file in the lookup, or with roots of at least the files they reach
+        (which does not load the sub lookups they do not need). Rebuilt when the name indices change
+        """
+        graph = self._dependency_graph
+        if graph is not None and graph.generation == self.get_generation():
+            if graph.roots is None or (roots is not None and all(root in graph.f_obj_2_id for root in roots)):
+                return graph
+        graph = DependencyGraph.build(self, roots)
+        self._dependency_graph = graph
+        return graph
+
+    def miss_to_key_error(self, item_ref: str, name: Name, f_obj_required_by: Optional["FileObj"], miss: "ResolveMiss") -> KeyError:
+        miss.log_conflicts()
+        loc_str = "None"
+        if f_obj_required_by is not None:
+            loc_str = str(f_obj_required_by.loc)
+        return KeyError(f"ERROR: {miss.reason} {item_ref} {name} required by {loc_str}{miss.detail}")
+
+    # Public resolution API: raises KeyError if the name cannot be resolved
+    def get_vhdl_package(self, name: Name, f_obj_required_by: Optional["FileObjVhdl"]) -> Optional["FileObjVhdl"]:
+        result = self.resolve_vhdl_package(name)
+        if isinstance(result, ResolveMiss):
+            raise self.miss_to_key_error("package", name, f_obj_required_by, result)
+        assert result is None or isinstance(result, FileObjVhdl)
+        return result
+
+    def get_verilog_package(self, name: Name, f_obj_required_by: Optional["FileObjVerilog"]) -> Optional["FileObjVerilog"]:
+        result = self.resolve_verilog_package(name)
+        if isinstance(result, ResolveMiss):
+            raise self.miss_to_key_error("package", name, f_obj_required_by, result)
+        assert result is None or isinstance(result, FileObjVerilog)
+        return result
+
+    def get_entity(self, name: Name, f_obj_required_by: Optional["FileObj"], ignore_lib=False) -> Optional["FileObj"]:
+        result = self.resolve_entity(name, ignore_lib=ignore_lib)
+        if isinstance(result, ResolveMiss):
+            raise self.miss_to_key_error("entity", name, f_obj_required_by, result)
+        return result
+
+    def find_entity_required(self, name: Name) -> "FileObj":
+        """The file declaring entity/module name, raises KeyError if it cannot be found or is ignored"""
+        f_obj = self.get_entity(name, f_obj_required_by=None)
+        if f_obj is None:
+            raise KeyError(f"entity {name} is ignored (ignore_libs / ignore_entities)")
+        return f_obj
+
     def add_loc(self, loc: Path, f_obj: "FileObj"):
         pass
 
@@ -273,6 +626,14 @@ class Lookup:  # {{{
     def check_if_skip_from_order(self, loc: Path) -> bool:
         raise Exception("Virtual called")
 
+    def get_skip_locs(self) -> Set[Path]:
+        """Every location check_if_skip_from_order is True for"""
+        raise Exception("Virtual called")
+
+    def check_summary_sources(self) -> bool:
+        """See LookupMulti.check_summary_sources, a lookup without subs has no summaries to check"""
+        return False
+
     def add_verilog_file_name(self, file_name: str, f_obj: "FileObjVerilog"):
         pass
 
@@ -282,11 +643,11 @@ class Lookup:  # {{{
     def add_verilog_package(self, name: Name, f_obj: "FileObjVerilog"):
         pass
 
-    def write_file_list(self, f_loc, f_type: Optional["FileObjType"] = None, lib: Optional[str] = None):
-        pass
+    def format_file_list(self, f_type: Optional["FileObjType"] = None, lib: Optional[str] = None) -> str:
+        return ""
 
-    def write_ext_file_list(self, f_loc: Path, tag: Optional[str] = None):
-        pass
+    def format_ext_file_list(self, tag: Optional[str] = None) -> str:
+        return ""
 
     def has_top_file(self) -> bool:
         return False
@@ -298,6 +659,7 @@ class Lookup:  # {{{
         return []
 
     def set_x_tool_version(self, x_tool_version: str):
+        self.bump_generation()  # conflict resolution depends on the tool version
         if len(self.x_tool_version) != 0:
             if x_tool_version != self.x_tool_version:
                 log.warning(f"Lookup::set_x_tool_version({x_tool_version}) was previously {self.x_tool_version}")
@@ -308,6 +670,7 @@ class Lookup:  # {{{
         self.x_tool_version = x_tool_version
 
     def set_x_device(self, x_device: str):
+        self.bump_generation()  # conflict resolution depends on the device
         if len(self.x_device) != 0:
             if x_device != self.x_device:
                 log.warning(f"Lookup::set_x_device({x_device}) was previously {self.x_device}")
@@ -352,6 +715,58 @@ def string_to_FileObjType(s: str) -> FileObjType:
         raise ValueError(f"Unknown file type: {s}")
 
 
+class EdgeKind(Enum):
+    ENTITY = auto()
+    PACKAGE = auto()
+    COMPONENT = auto()
+    INCLUDE = auto()
+    DIRECT = auto()
+
+
+class ResolvedDeps:
+    """The resolved dependency edges of one file, cached by Lookup.resolve_file_deps.
+
+    Resolving is side effect free, the warnings and errors found while resolving are kept
+    and only reported (see report) when a traversal reaches the file.
+    """
+
+    def __init__(self):
+        self.f_objs: List["FileObj"] = []
+        self.kinds: List[EdgeKind] = []
+        self._seen: Set["FileObj"] = set()
+        self.entity_misses: List[Tuple[Name, "ResolveMiss"]] = []
+        self.conflict_misses: List["ResolveMiss"] = []
+        self.missed_components: List[str] = []
+        self.error: Optional[Tuple[str, Name, "ResolveMiss"]] = None
+        self.error_log: Optional[str] = None
+
+    def add(self, f_obj: "FileObj", kind: EdgeKind):
+        if f_obj not in self._seen:
+            self._seen.add(f_obj)
+            self.f_objs.append(f_obj)
+            self.kinds.append(kind)
+
+    def set_error(self, item_ref: str, name: Name, miss: "ResolveMiss", error_log: Optional[str] = None):
+        self.error = (item_ref, name, miss)
+        self.error_log = error_log
+
+    def report(self, look: "Lookup", f_obj: "FileObj", components_missed: Set[str]):
+        """Log the warnings found while resolving and raise KeyError if resolving failed"""
+        for miss in self.conflict_misses:
+            miss.log_conflicts()
+        for name, miss in self.entity_misses:
+            log.warning(f"Verilog:{look.miss_to_key_error('entity', name, f_obj, miss)}")
+        for component in self.missed_components:
+            if component not in components_missed:
+                log.warning(f"File {f_obj.loc} cannot find component declartion for component dependency {component}")
+                components_missed.add(component)
+        if self.error is not None:
+            if self.error_log is not None:
+                log.error(self.error_log)
+            item_ref, name, miss = self.error
+            raise look.miss_to_key_error(item_ref, name, f_obj, miss)
+
+
 class FileObj:
     def __init__(self, loc: Path, ver: Optional[str] = None):
         self.loc : Path = resolve_abs_path(loc)
@@ -366,6 +781,10 @@ class FileObj:
         self.direct_deps : List = []
         self.x_tool_version = ''
         self.x_device = ''
+        # fingerprint of each design unit interface ("entity:name", "package:name", "module:name"), a unit without
+        # a fingerprint (VHDL primary units) changes whenever its file is compiled again.
+        # None if the interface of the file is unknown, then any change to the file changes its interface
+        self.interface_fingerprints: Optional[Dict[str, Optional[str]]] = None
         self.update_modification_time()
 
     def update_modification_time(self):
@@ -375,10 +794,35 @@ class FileObj:
         except FileNotFoundError:
             self.exists = False
             self.modification_time = None
+        # hashed when first needed, see get_content_hash
+        self.content_hash: Optional[str] = None
+
+    def get_content_hash(self) -> Optional[str]:
+        """SHA-256 of the file as it was parsed, None if the file changed since (or does not exist).
+        Only computed when a cache is written, so a file whose content did not change can be recognised later
+        """
+        if self.content_hash is None and self.exists:
+            try:
+                if self.get_modification_time_on_disk() == self.modification_time:
+                    content_hash = file_sha256(self.loc)
+                    # not if the file was written while hashing it
+                    if self.get_modification_time_on_disk() == self.modification_time:
+                        self.content_hash = content_hash
+            except FileNotFoundError:
+                pass
+        return self.content_hash
+
+    def __getstate__(self):
+        self.get_content_hash()
+        return self.__dict__
 
     def requires_update(self):
         return self.get_modification_time_on_disk() != self.modification_time
 
+    def content_unchanged(self) -> bool:
+        """True if the file only has a new modification time, e.g. the workspace was checked out or restored again"""
+        return self.content_hash is not None and file_sha256(self.loc) == self.content_hash
+
     def get_modification_time_on_disk(self):
         return get_file_modification_time(self.loc)
 
@@ -421,28 +865,55 @@ class FileObj:
         """Allow subclasses to inherit library from parent. Default does nothing."""
         pass
 
-    def get_file_deps(self, look: Lookup) -> List['FileObj']:
-        file_deps = []
+    def clear_inherited_library(self):
+        """Undo inherit_library_if_needed so another top can be evaluated from a clean state"""
+        pass
+
+    def _resolve_file_deps(self, look: Lookup) -> ResolvedDeps:
+        resolved = ResolvedDeps()
+        self._resolve_entity_deps(look, resolved)
+        return resolved
+
+    def _resolve_entity_deps(self, look: Lookup, resolved: ResolvedDeps):
         for e in self.entity_deps:
-            try:
-                f_obj = look.get_entity(e, self)
-            except KeyError as err:
-                f_obj = look.get_entity(e, self, ignore_lib=True)
+            f_obj = look.resolve_entity(e)
+            if isinstance(f_obj, ResolveMiss):
+                miss = f_obj
+                f_obj = look.resolve_entity(e, ignore_lib=True)
+                if isinstance(f_obj, ResolveMiss):
+                    resolved.set_error("entity", e, f_obj)
+                    return
                 if isinstance(f_obj, FileObjVhdl) and isinstance(self, FileObjVhdl):
-                    log.error(f'{f_obj.loc} appers to be in wrong library wanted {e.lib} but got {f_obj.lib}. Requesting file is {self.loc}')
-                    raise err
+                    error_log = f'{f_obj.loc} appers to be in wrong library wanted {e.lib} but got {f_obj.lib}. Requesting file is {self.loc}'
+                    resolved.set_error("entity", e, miss, error_log)
+                    return
 
             if f_obj is not None:
-                # Allow the dependency to inherit library from this file if applicable
-                if self.lib is not None:
+                resolved.add(f_obj, EdgeKind.ENTITY)
+
+    def get_file_deps(self, look: Lookup, components_missed: Optional[Set[str]] = None) -> List['FileObj']:
+        if components_missed is None:
+            components_missed = set()
+        resolved = look.resolve_file_deps(self)
+        self.use_file_deps(look, resolved, components_missed)
+        return list(resolved.f_objs)
+
+    def use_file_deps(self, look: Lookup, resolved: ResolvedDeps, components_missed: Set[str]):
+        """Called when a compile order reaches this file, raises KeyError if its dependencies could not be resolved"""
+        if self.lib is not None:
+            # Allow the dependency to inherit library from this file if applicable
+            for f_obj, kind in zip(resolved.f_objs, resolved.kinds):
+                if kind is EdgeKind.ENTITY or kind is EdgeKind.COMPONENT:
                     f_obj.inherit_library_if_needed(self.lib, self.loc)
-                self._add_to_f_deps(file_deps, f_obj)
-
-        return file_deps
+        resolved.report(look, self, components_missed)
 
     def parse_file_again(self) -> "FileObj":
         raise Exception("must be overloaded should be unreachable")
 
+    def consumed_unit_names(self) -> Set[str]:
+        """Names of the design units (from other files) this file uses"""
+        return {name.name for name in self.entity_deps if name.name is not None}
+
     def equivalent(self, other: "FileObj"):
         result = (
             self.loc == other.loc
@@ -454,36 +925,43 @@ class FileObj:
         )
         return result
 
-    def _get_compile_order(self, look: Lookup, files_passed=[], components_missed=[], level=0) -> List["FileObj"]:
-        files_passed.append(self)
-        if look.check_if_skip_from_order(self.loc):
-            # if self.loc in look.files_2_skip_from_order:
-            return []
-        order: List[FileObj] = []
-        for f_obj in self.get_file_deps(look):
-            if f_obj not in files_passed:
-                order += f_obj._get_compile_order(look, files_passed, components_missed=components_missed, level=level + 1)
+    def _get_compile_order(self, look: Lookup) -> Tuple["DependencyGraph", "CompileOrderIds"]:
+        """The compile order of this file walked on the dependency graph of look (see DependencyGraph.compile_order_ids).
 
-        for ddep_loc in self.direct_deps:
-            ddep = look.loc_to_file_obj(ddep_loc)
-            assert(ddep is not None)
-            ddep.level = level + 1
-            order.append(ddep)
-        order.append(self)
-        self.level = level
-        return order
+        The files reached use their dependencies (see use_file_deps) in the order they were reached, the files in
+        the order get their level and any dependency cycles found are logged.
+        """
+        graph = look.get_dependency_graph(roots=[self])
+        order_ids = graph.compile_order_ids(graph.id_of(self))
+        f_objs = graph.f_objs
+        components_missed: Set[str] = set()
+        for file_id in order_ids.reached:
+            f_objs[file_id].use_file_deps(look, graph.resolved[file_id], components_missed)
+        for file_id, level in zip(order_ids.order, order_ids.levels):
+            f_objs[file_id].level = level
+        for cycle in order_ids.cycles:
+            cycle_str = " -> ".join(str(f_objs[file_id].loc) for file_id in reversed(cycle))
+            log.warning(f"Dependency cycle, compile order may be incorrect for files: {cycle_str}")
+        return graph, order_ids
 
     def get_compile_order(self, look: Lookup) -> List["FileObj"]:
-        return self._get_compile_order(look)
+        graph, order_ids = self._get_compile_order(look)
+        return [graph.f_objs[file_id] for file_id in order_ids.order]
 
     def update(self) -> Tuple[bool, bool]:
         """Returns True if the dependencies have changed, Returns True if file was modified"""
         if self.requires_update():
+            if self.content_unchanged():
+                log.debug(f"file {self.loc} has a new modification time but the same content")
+                self.modification_time = self.get_modification_time_on_disk()
+                return False, True
             f_obj = self.parse_file_again()
             equivalent = f_obj.equivalent(self)
             if equivalent:
                 log.info(f"file {self.loc} updated but dependencies remain unchanaged")
                 self.modification_time = f_obj.modification_time
+                self.content_hash = f_obj.content_hash
+                self.interface_fingerprints = f_obj.interface_fingerprints
                 return False, True
             else:
                 log.info(f"file {self.loc} is updated and dependencies have changed")
@@ -576,7 +1054,7 @@ class FileObjXBd(FileObjX):
 
     def parse_file_again(self) -> FileObj:
         assert self.loc is Path
-        assert self.ver is str or self.ver is None
+        assert isinstance(self.ver, str) or self.ver is None
         return parse_x_bd_file(None, loc=self.loc, ver=self.ver)
 
 
@@ -594,6 +1072,7 @@ class FileObjXXci(FileObjX):
         if self.lib is None or self.lib == LIB_DEFAULT:
             if self.lib_inherited_from is None:
                 log.info(f"XCI {self.loc} inheriting library '{parent_lib}' from {parent_loc}")
+                self.lib_before_inherit = self.lib
                 self.lib = parent_lib
                 self.lib_inherited_from = parent_loc
             elif self.lib != parent_lib:
@@ -601,6 +1080,11 @@ class FileObjXXci(FileObjX):
                     f"XCI {self.loc} already inherited library '{self.lib}' from {self.lib_inherited_from}, ignoring '{parent_lib}' from {parent_loc}"
                 )
 
+    def clear_inherited_library(self):
+        if self.lib_inherited_from is not None:
+            self.lib = getattr(self, "lib_before_inherit", None)
+            self.lib_inherited_from = None
+
     def parse_file_again(self)->FileObj:
         assert isinstance(self.loc,Path), f'{self.loc=}'
         assert isinstance(self.ver, str) or self.ver is None, f'{self.ver=}'
@@ -628,22 +1112,26 @@ class FileObjVerilog(FileObj):
         for p in self.verilog_package:
             look.add_verilog_package(p, self)
 
-    def get_file_deps(self, look: Lookup) -> List[FileObj]:
-        file_deps = []
+    def _resolve_file_deps(self, look: Lookup) -> ResolvedDeps:
+        resolved = ResolvedDeps()
         for e in self.entity_deps:
-            f_obj = None
-            try:
-                f_obj = look.get_entity(e, self, ignore_lib=True)
-            except KeyError as e:
-                log.warning(f"Verilog:{e}")
-            if f_obj is not None:
-                self._add_to_f_deps(file_deps, f_obj)
+            f_obj = look.resolve_entity(e, ignore_lib=True)
+            if isinstance(f_obj, ResolveMiss):
+                resolved.entity_misses.append((e, f_obj))
+            elif f_obj is not None:
+                resolved.add(f_obj, EdgeKind.ENTITY)
 
-        file_deps += self.get_verilog_include_deps(look)
-        file_deps += self.get_verilog_package_deps(look)
+        for f_obj in self.verilog_include_deps:
+            resolved.add(f_obj, EdgeKind.INCLUDE)
 
-
-        return file_deps
+        for p in self.verilog_package_deps:
+            f_obj = look.resolve_verilog_package(p)
+            if isinstance(f_obj, ResolveMiss):
+                resolved.set_error("package", p, f_obj)
+                return resolved
+            if f_obj is not None:
+                resolved.add(f_obj, EdgeKind.PACKAGE)
+        return resolved
 
     def get_verilog_include_deps(self, look: Lookup) -> List[FileObjVerilogInclude]:
         return self.verilog_include_deps
@@ -658,9 +1146,14 @@ class FileObjVerilog(FileObj):
         return file_deps
 
     def parse_file_again(self) -> FileObj:
-        assert self.ver is str or self.ver is None
+        assert isinstance(self.ver, str) or self.ver is None
         return parse_verilog_file(None, loc=self.loc, ver=self.ver, old_file=self)
 
+    def consumed_unit_names(self) -> Set[str]:
+        names = FileObj.consumed_unit_names(self)
+        names.update(name.name for name in self.verilog_package_deps if name.name is not None)
+        return names
+
     def equivalent(self, other: FileObj):
         if not isinstance(other, FileObjVerilog):
             return False
@@ -695,43 +1188,47 @@ class FileObjVhdl(FileObj):
         for p in self.vhdl_packages:
             look.add_vhdl_package(p, self)
 
-    def get_file_deps(self, look: Lookup, components_missed=[]) -> List[FileObj]:
-        file_deps = super().get_file_deps(look)
-        file_deps += self.get_vhdl_package_deps(look)
+    def _resolve_file_deps(self, look: Lookup) -> ResolvedDeps:
+        resolved = ResolvedDeps()
+        self._resolve_entity_deps(look, resolved)
+        if resolved.error is not None:
+            return resolved
 
-        if len(self.vhdl_component_deps) > 0:
-            file_package_deps = self.get_vhdl_package_deps(look)
-            for component in self.vhdl_component_deps:
-                if component in look.ignore_components:
-                    continue
-                found = False
-                f_obj = None
-                try:
-                    f_obj = look.get_entity(Name(self.lib, component), self)
-                except KeyError:
-                    pass
-                if f_obj is None:
-                    try:
-                        f_obj = look.get_entity(Name(LIB_DEFAULT, component), self)
-                    except KeyError:
-                        pass
-                if f_obj is not None:
-                    found = True
-                    # Allow the dependency to inherit library from this VHDL file
-                    if self.lib is not None:
-                        f_obj.inherit_library_if_needed(self.lib, self.loc)
-                    file_deps.append(f_obj)
-                else:
-                    for f_obj in file_package_deps:
-                        if isinstance(f_obj, FileObjVhdl):
-                            if component in f_obj.vhdl_component_decl:
-                                found = True
-                                break
-                if not found:
-                    if component not in components_missed:
-                        log.warning(f"File {self.loc} cannot find component declartion for component dependency {component}")
-                        components_missed.append(component)
-        return file_deps
+        package_deps = []
+        for p in self.vhdl_package_deps:
+            f_obj = look.resolve_vhdl_package(p)
+            if isinstance(f_obj, ResolveMiss):
+                resolved.set_error("package", p, f_obj)
+                return resolved
+            if f_obj is not None:
+                package_deps.append(f_obj)
+                resolved.add(f_obj, EdgeKind.PACKAGE)
+
+        if len(self.vhdl_component_deps) == 0:
+            return resolved
+
+        components_declared: Set[str] = set()
+        for f_obj in package_deps:
+            if isinstance(f_obj, FileObjVhdl):
+                components_declared.update(f_obj.vhdl_component_decl)
+
+        for component in self.vhdl_component_deps:
+            if component in look.ignore_components:
+                continue
+            f_obj = look.resolve_entity(Name(self.lib, component))
+            if isinstance(f_obj, ResolveMiss) and f_obj.conflicts:
+                resolved.conflict_misses.append(f_obj)
+            if not isinstance(f_obj, FileObj):
+                f_obj = look.resolve_entity(Name(LIB_DEFAULT, component))
+                if isinstance(f_obj, ResolveMiss):
+                    if f_obj.conflicts:
+                        resolved.conflict_misses.append(f_obj)
+                    f_obj = None
+            if f_obj is not None:
+                resolved.add(f_obj, EdgeKind.COMPONENT)
+            elif component not in components_declared:
+                resolved.missed_components.append(component)
+        return resolved
 
     def get_vhdl_package_deps(self, look: Lookup) -> List[FileObj]:
         file_deps = []
@@ -745,6 +1242,12 @@ class FileObjVhdl(FileObj):
     def parse_file_again(self) -> FileObj:
         return parse_vhdl_file(None, self.loc, self.lib, self.ver)
 
+    def consumed_unit_names(self) -> Set[str]:
+        names = FileObj.consumed_unit_names(self)
+        names.update(name.name for name in self.vhdl_package_deps if name.name is not None)
+        names.update(component.lower() for component in self.vhdl_component_deps)
+        return names
+
     def equivalent(self, other: FileObj):
         if not isinstance(other, FileObjVhdl):
             return False
@@ -880,8 +1383,45 @@ class ConflictFileObj:
         return chosen
 
 
+class ResolveMiss:
+    """Returned by the Lookup.resolve_* methods when a name cannot be resolved.
+
+    Misses are cheap to create and can be cached, the KeyError is only created
+    (and any conflicts logged) once a miss reaches one of the public get_* methods.
+    """
+
+    def __init__(self, reason: str = "Could not find", detail: str = "", conflicts: Optional[List[Tuple[Name, ConflictFileObj]]] = None):
+        self.reason = reason
+        self.detail = detail
+        self.conflicts: List[Tuple[Name, ConflictFileObj]] = [] if conflicts is None else conflicts
+
+    def log_conflicts(self):
+        for name, conflict in self.conflicts:
+            conflict.log_confict(name)
+
 
 FileObjLookup = Union[ConflictFileObj, FileObj]
+ResolveResult = Union[FileObj, ResolveMiss, None]
+
+
+@dataclass
+class EntityFilter:
+    """The entity names (without library), ignored libraries and ignored entities of a lookup and its subs.
+    A name none of them match cannot be resolved by the lookup, so it does not have to be asked.
+    resolved holds the names the lookup resolves straight to a file (no conflict, ignore or X file search by name
+    involved), most names are, so resolving them is a single dict lookup.
+    """
+
+    names: Set[str]
+    ignore_libs: Set[str]
+    ignore_entities: Set[Name]
+    x_names: Set[str]  # entity names of the X files (XCI or BD), which are also searched for by name only
+    resolved: Dict[Name, "FileObj"]
+    subs: Optional[List["EntityFilter"]] = None  # the filter of each sub of a LookupMulti
+
+    def might_resolve(self, name: Name) -> bool:
+        # names are compared without the library to cover ignore_lib and the X file search by name only
+        return name.name in self.names or name.lib in self.ignore_libs or name in self.ignore_entities
 
 # }}}
 
@@ -921,31 +1461,31 @@ def vhdl_remove_protected_code(vhdl_code: str) -> str:
 
 
 vhdl_regex_patterns = {
-    "package_decl": re.compile(
+    "package_decl": LazyRegex(
         r"(?<!:)\bpackage\s+(\w+)\s+is.*?end(?:\s+(?:package|\1)|;)",
         re.DOTALL | re.IGNORECASE | re.MULTILINE,
     ),
-    "entity_decl": re.compile(
+    "entity_decl": LazyRegex(
         r"(?<!:)\Wentity\s+(\w+)\s+is.*?end\s+(?:entity|\1|;)",
         re.DOTALL | re.IGNORECASE | re.MULTILINE,
     ),
-    "vhdl_component_decl": re.compile(
+    "vhdl_component_decl": LazyRegex(
         r"(?<!:)\Wcomponent\s+(\w+)\s+(?:is|).*?end\s+(?:component|\1|;)",
         re.DOTALL | re.IGNORECASE | re.MULTILINE,
     ),
-    "component_inst": re.compile(
+    "component_inst": LazyRegex(
         r"\s*(\w+)\s*:(?:\s*component)\s*(\w+)(?:\s*generic\s*map\s*\(.*?\))?\s*port\s*map\s*\(.*?\)\s*;",
         re.DOTALL | re.IGNORECASE | re.MULTILINE,
     ),
-    "direct_inst": re.compile(
+    "direct_inst": LazyRegex(
         # r"\s*(\w+)\s*:\s*(?:entity\s+)?(\w+)\.(\w+)(?:\s*generic\s*map\s*\(.*?\))?\s*port\s*map\s*\(.*?\)\s*;",
         r"\s*(\w+)\s*:\s*(?:entity\s+)?(\w+)\.(\w+)(?:\s*\(\s*\w+\s*\))?(?:\s*generic\s*map\s*\(.*?\))?\s*port\s*map\s*\(.*?\)\s*;",
         # r"\w+\s*:\s*entity\s+[\w.]+(?:\(\w+\))?\s*(?:generic\s+map\s*\([^)]*(?:\([^)]*\)[^)]*)*\))?\s*port\s+map\s*\([^)]*(?:\([^)]*\)[^)]*)*\)\s*;",
         re.DOTALL | re.IGNORECASE | re.MULTILINE,
     ),
-    "package_use": re.compile(r"\buse\s+(\w+)\.(\w+)(?:\.\w+)?\s*;", re.IGNORECASE | re.MULTILINE),
-    "c_coef_file": re.compile(r'_?attribute\s+C_COEF_FILE?\s+of\s+(\w+)\s*:\s*label\s+is\s+"([^"]+)"\s*;', re.IGNORECASE),
-    "is_du_within_envelope": re.compile(r'_?attribute\s+is_du_within_envelope?\s+of\s+(\w+)\s*:\s*label\s+is\s+"true"\s*;', re.IGNORECASE),
+    "package_use": LazyRegex(r"\buse\s+(\w+)\.(\w+)(?:\.\w+)?\s*;", re.IGNORECASE | re.MULTILINE),
+    "c_coef_file": LazyRegex(r'_?attribute\s+C_COEF_FILE?\s+of\s+(\w+)\s*:\s*label\s+is\s+"([^"]+)"\s*;', re.IGNORECASE),
+    "is_du_within_envelope": LazyRegex(r'_?attribute\s+is_du_within_envelope?\s+of\s+(\w+)\s*:\s*label\s+is\s+"true"\s*;', re.IGNORECASE),
 }
 
 
@@ -966,6 +1506,13 @@ def parse_vhdl_file(look: Optional[Lookup], loc: Path, lib=LIB_DEFAULT, ver=None
     matches = {}
     for key, pattern in vhdl_regex_patterns.items():
         matches[key] = pattern.findall(vhdl)
+
+    # analysing an entity or package again obsoletes the units using it whether its declaration changed or not,
+    # so they have no fingerprint. Files holding only architectures or package bodies have no units
+    f_obj.interface_fingerprints = {}
+    for unit, key in [("entity", "entity_decl"), ("package", "package_decl")]:
+        for name in matches[key]:
+            f_obj.interface_fingerprints[f"{unit}:{name.lower()}"] = None
     for construct, found in matches.items():
         if construct == "package_decl":
             for item in found:
@@ -1353,6 +1900,29 @@ def verilog_extract_module_declarations(verilog_code):
     return declarations
 
 
+verilog_module_header_regex = LazyRegex(r"\bmodule\s+(\w+)")
+verilog_package_regex = LazyRegex(r"\bpackage\s+(\w+)\s*;.*?\bendpackage\b", re.DOTALL)
+verilog_port_direction_regex = LazyRegex(r"\b(?:input|output|inout|ref)\b")
+
+
+def verilog_interface_fingerprints(verilog_code) -> Optional[Dict[str, str]]:
+    """Fingerprints of each module header (parameters and ports up to the first ';') and package.
+    Returns None for non ANSI style port lists, as the port declarations are then in the module body.
+    """
+    fingerprints = {}
+    for match in verilog_module_header_regex.finditer(verilog_code):
+        end = verilog_code.find(";", match.end())
+        if end < 0:
+            end = len(verilog_code)
+        header = verilog_code[match.start() : end + 1]
+        if "(" in header and verilog_port_direction_regex.search(header) is None:
+            return None
+        fingerprints[f"module:{match.group(1).lower()}"] = interface_fingerprint(header)
+    for match in verilog_package_regex.finditer(verilog_code):
+        fingerprints[f"package:{match.group(1).lower()}"] = interface_fingerprint(match.group(0))
+    return fingerprints
+
+
 def parse_verilog_file(look: Optional[Lookup], loc: Path, ver: Optional[str], old_file : Optional[FileObjVerilog] = None) -> FileObjVerilog:
     if look is not None:
         verilog_include_dir_list = look.get_verilog_include_dir_list()
@@ -1420,6 +1990,10 @@ def parse_verilog_file(look: Optional[Lookup], loc: Path, ver: Optional[str], ol
             log.debug(f"Verilog {loc} requires module {module_name}")
             f_obj.entity_deps.append(name)
 
+    if len(f_obj.verilog_include_deps) == 0:
+        # with includes the header can depend on macros defined elsewhere, so any change is an interface change
+        f_obj.interface_fingerprints = verilog_interface_fingerprints(clean_code)
+
     if look is not None:
         f_obj.register_with_lookup(look)
     return f_obj
@@ -1432,6 +2006,8 @@ def parse_verilog_file(look: Optional[Lookup], loc: Path, ver: Optional[str], ol
 def parse_x_xci_file_xml(look: Optional[Lookup], loc: Path, xci_f, ver: Optional[str]) -> Optional[FileObjXXci]:
 
     log.debug(f"called parse_x_xci_file_xml({loc=})")
+    import xml.etree.ElementTree as xml_et
+
     try:
         etree = xml_et.parse(xci_f)  # raises xml_et.ParseError
     except xml_et.ParseError as e:
@@ -1554,6 +2130,8 @@ def parse_x_xci_file_xml(look: Optional[Lookup], loc: Path, xci_f, ver: Optional
 
 
 def parse_x_xci_file_json(look: Optional[Lookup], loc: Path, xci_f, ver: Optional[str]) -> Optional[FileObjXXci]:
+    import json
+
     try:
         xci_dict = json.load(xci_f)  # throws json.decoder.JSONDecodeError
     except json.decoder.JSONDecodeError as e:
@@ -1640,6 +2218,8 @@ def parse_x_xci_file(look: Optional[Lookup], loc: Path, ver: Optional[str]) -> F
 
 # Parse X_BD: Xilinx Block Digarm File {{{
 def parse_x_bd_file(look: Optional[Lookup], loc: Path, ver: Optional[str]) -> FileObjXBd:
+    import json
+
     log.info(f"parsing Xilinx BD file {loc}:")
     with open(loc, "rb") as json_f:
         bd_dict = json.load(json_f)
@@ -1759,6 +2339,7 @@ class LookupSingular(Lookup):  # {{{
         self.ignore_set_entities: set[Name] = set()
         self.toml_loc: Optional[Path] = None
         self.toml_modification_time: Optional[float] = None
+        self.toml_hash: Optional[str] = None
         self.top_lib: Optional[str] = None
         self.ignore_components: set[str] = set()
         self.files_2_skip_from_order: set[Path] = set()
@@ -1777,6 +2358,79 @@ class LookupSingular(Lookup):  # {{{
             return self.loc_2_file_obj[loc]
         return None
 
+    def iter_file_objs(self):
+        for f_obj_l in self.loc_2_file_obj.values():
+            if isinstance(f_obj_l, ConflictFileObj):
+                yield from f_obj_l.get_f_objs()
+            else:
+                yield f_obj_l
+
+    def iter_entity_names(self):
+        return iter(self.entity_name_2_file_obj.keys())
+
+    def iter_lookups(self):
+        """Yields this lookup and every sub lookup"""
+        yield self
+
+    def get_config_input_locs(self) -> Tuple[List[Path], List[Path]]:
+        """Returns the files the config of this lookup reads (the config file and any *_files_file lists)
+        and the directories its *_files_glob patterns search (including sub directories of recursive patterns)
+        """
+        if self.toml_loc is None:
+            return [], []
+        config = load_config(self.toml_loc)
+        work_dir = self.toml_loc.parent
+        files = [resolve_abs_path(self.toml_loc)]
+        dirs = []
+        for key in sorted({key_split_opt_ver(config_key)[0] for config_key in config.keys()}):
+            if key.endswith("_files_file"):
+
+                def add_file(lib, f_str, ver):
+                    files.append(path_abs_from_dir(work_dir, Path(f_str)))
+
+                LookupSingular._process_config_opt_lib(config, key, with_ver=True, callback=add_file, top_lib=self.top_lib)
+            elif key.endswith("_files_glob"):
+
+                def add_glob(lib, glob_str, ver):
+                    if glob_str.startswith("!"):
+                        return
+                    root = glob_pattern_root(work_dir, glob_str)
+                    dirs.append(root)
+                    if "**" in glob_str:
+                        for dir_path, _, _ in os.walk(root):
+                            dirs.append(Path(dir_path))
+
+                LookupSingular._process_config_opt_lib(config, key, with_ver=True, callback=add_glob, top_lib=self.top_lib)
+        return list(dict.fromkeys(files)), list(dict.fromkeys(dirs))
+
+    def get_input_locs(self) -> Tuple[List[Path], List[Path]]:
+        """Returns every file the lookup (including sub lookups) was created from: config files, file lists,
+        parsed sources, include headers and direct dependencies. Along with the directories searched by glob patterns
+        """
+        files, dirs = self.get_config_input_locs()
+        for f_obj in LookupSingular.iter_file_objs(self):
+            files.append(f_obj.loc)
+            files += f_obj.direct_deps
+        return list(dict.fromkeys(files)), dirs
+
+    def configs_unchanged(self) -> bool:
+        """True if the config files and file lists of the lookup (including sub lookups) have not changed"""
+        return self.toml_loc is None or self.config_unchanged(self.toml_loc, self.top_lib, FileLists())
+
+    def update_src_files(self):
+        """Parse the changed source files of the lookup (including loaded sub lookups) again"""
+        self.check_for_src_files_updates()
+
+    def revalidate(self) -> bool:
+        """Bring an in memory lookup up to date with the disk.
+        Returns False if a config file or file list has changed and the lookup has to be created again,
+        otherwise any changed source files are parsed again and True is returned.
+        """
+        if not self.configs_unchanged():
+            return False
+        self.update_src_files()
+        return True
+
     def get_init_files(self) -> List[FileObj]:
         return self.init_files
 
@@ -1791,6 +2445,7 @@ class LookupSingular(Lookup):  # {{{
 
     def _add_to_dict(self, d: dict, key, f_obj: FileObj):
         log.info(f"Adding {key} to dict")
+        self.bump_generation()
         if key in d:
             if not self.allow_duplicates:
                 raise Exception(f"ERROR: tried to add {key} twice")
@@ -1832,6 +2487,7 @@ class LookupSingular(Lookup):  # {{{
                     for entity in resolved.entities:
                         if entity in self.entity_name_2_file_obj:
                             self.entity_name_2_file_obj[entity] = resolved
+                    self.bump_generation()
                 else:
                     # Could not resolve - warn about all conflicting files
                     for f_obj in f_obj_lookup.get_f_objs():
@@ -1849,7 +2505,9 @@ class LookupSingular(Lookup):  # {{{
         return pickle_loc
 
     @staticmethod
-    def atempt_to_load_from_pickle(pickle_loc: Path, toml_loc: Path, top_lib: Optional[str]) -> Tuple[Optional[Lookup], FileLists]:
+    def atempt_to_load_from_pickle(
+        pickle_loc: Path, toml_loc: Path, top_lib: Optional[str], project_root: Optional[Path] = None
+    ) -> Tuple[Optional[Lookup], FileLists]:
         file_lists = FileLists()
 
         assert toml_loc.is_file()
@@ -1860,141 +2518,410 @@ class LookupSingular(Lookup):  # {{{
         pickle_mod_time = get_file_modification_time(pickle_loc)
 
         with open(pickle_loc, "rb") as pickle_f:
-            inst = pickle.load(pickle_f)
+            inst = load_cache(pickle_f, pickle_loc, project_root)
 
         if LookupSingular.VERSION != inst.version:
             log.info(f"hdldepends version { LookupSingular.VERSION} but pickle top_lib {inst.version} will not load from pickle")
             return None, file_lists
 
-        toml_modification_time = get_file_modification_time(toml_loc)
-        if toml_modification_time != inst.toml_modification_time:
-            log.info(f"will not load from pickle as {toml_loc} out of date")
+        if not inst.config_unchanged(toml_loc, top_lib, file_lists):
             return None, file_lists
 
-        if top_lib != inst.top_lib:
-            log.info(f"requested top_lib {top_lib} but pickle top_lib {inst.top_lib} will not load from pickle")
-            return None, file_lists
+        log.info(f"loaded from {pickle_loc}, updating required files")
+        journal_loc = LookupSingular.pickle_loc_to_journal_loc(pickle_loc)
+        inst.replay_journal(journal_loc, pickle_loc, project_root=project_root)
+        changed: List[FileObj] = []
+        any_changes = inst.check_for_src_files_updates(changed)
+        if any_changes:
+            log.info(f"Journaling the changes detected on disk to {journal_loc}")
+            inst.append_to_journal(journal_loc, pickle_loc, changed, project_root)
+            LookupSingular.compact_journal_if_needed(journal_loc, pickle_loc, project_root=project_root)
+        return inst, file_lists
+
+    def config_unchanged(self, toml_loc: Path, top_lib: Optional[str], file_lists: FileLists) -> bool:
+        """Returns True if the config file and the file lists it produces match this lookup.
+        file_lists is filled in with the lists read so far, so they can be reused when creating the lookup again
+        """
+        toml_modification_time = get_file_modification_time(toml_loc)
+        if toml_modification_time != self.toml_modification_time:
+            if file_sha256(toml_loc) != self.toml_hash:
+                log.info(f"will not load from pickle as {toml_loc} out of date")
+                return False
+            self.toml_modification_time = toml_modification_time
+
+        if top_lib != self.top_lib:
+            log.info(f"requested top_lib {top_lib} but pickle top_lib {self.top_lib} will not load from pickle")
+            return False
 
         config = load_config(toml_loc)
 
         file_lists.vhdl = LookupSingular.get_vhdl_file_list_from_config_dict(config, toml_loc.parent, top_lib)
-        if file_lists.vhdl != inst.vhdl_file_list:
+        if file_lists.vhdl != self.vhdl_file_list:
             log.info(f"Will not load from pickle as vhdl_file_list has changed")
-            return None, file_lists
+            return False
 
         #verilog include fikles effect the way verilog files are passed
         file_lists.verilog_include_dir = LookupSingular.get_verilog_include_dir_list_from_config_dict(config, toml_loc.parent, top_lib)
-        if file_lists.verilog_include_dir != inst.verilog_include_dir_list:
+        if file_lists.verilog_include_dir != self.verilog_include_dir_list:
             log.info(f"Will not load from pickle as verilog_include_dir_list has changed")
-            return None, file_lists
+            return False
 
         file_lists.verilog_include = LookupSingular.get_verilog_include_file_list_from_config_dict(config, toml_loc.parent, top_lib)
-        if file_lists.verilog_include != inst.verilog_include_file_list:
+        if file_lists.verilog_include != self.verilog_include_file_list:
             log.info(f"Will not load from pickle as verilog_include_file_list has changed")
-            return None, file_lists
+            return False
 
         file_lists.verilog = LookupSingular.get_verilog_file_list_from_config_dict(config, toml_loc.parent, top_lib)
-        if file_lists.verilog != inst.verilog_file_list:
+        if file_lists.verilog != self.verilog_file_list:
             log.info(f"Will not load from pickle as verilog_file_list has changed")
-            return None, file_lists
+            return False
 
         file_lists.other = LookupSingular.get_other_file_list_from_config_dict(config, toml_loc.parent, top_lib=top_lib)
 
-        if file_lists.other != inst.other_file_list:
+        if file_lists.other != self.other_file_list:
             log.info(f"Will not load from pickle as other_file_list has changed")
-            return None, file_lists
+            return False
 
         file_lists.x_bd = LookupSingular.get_x_bd_file_list_from_config_dict(config, toml_loc.parent, top_lib=top_lib)
 
-        if file_lists.x_bd != inst.x_bd_file_list:
+        if file_lists.x_bd != self.x_bd_file_list:
             log.info(f"Will not load from pickle as x_bd_file_list has changed")
-            return None, file_lists
+            return False
 
         file_lists.x_xci = LookupSingular.get_x_xci_file_list_from_config_dict(config, toml_loc.parent, top_lib=top_lib)
 
-        if file_lists.x_xci != inst.x_xci_file_list:
+        if file_lists.x_xci != self.x_xci_file_list:
             log.info(f"Will not load from pickle as x_xci_file_list has changed")
-            return None, file_lists
+            return False
 
         ext_file_list = LookupSingular.get_ext_file_list_from_config_dict(config, toml_loc.parent, top_lib=top_lib)
         log.debug(f"New ext_file_list {ext_file_list}")
         file_lists.tag_2_ext = LookupSingular.ext_file_list_2_dict(ext_file_list)
 
-        if file_lists.tag_2_ext != inst.tag_2_ext_file:
+        if file_lists.tag_2_ext != self.tag_2_ext_file:
             log.info(f"Will not load from pickle as ext_file_list has changed")
-            return None, file_lists
-
-        log.info(f"loaded from {pickle_loc}, updating required files")
-        any_changes = inst.check_for_src_files_updates()
-        if any_changes:
-            log.info(f"Updating pickle with the changes detected on disk")
-            inst.save_to_pickle(pickle_loc)
-        return inst, file_lists
+            return False
+        return True
 
-    def save_to_pickle(self, pickle_loc: Path):
+    def save_to_pickle(self, pickle_loc: Path, project_root: Optional[Path] = None):
         log.info(f"Caching to {pickle_loc}")
-        with open(pickle_loc, "wb") as pickle_f:
-            pickle.dump(self, pickle_f, protocol=pickle.HIGHEST_PROTOCOL)
-
-    def check_for_src_files_updates(self) -> bool:
-        """Returns True if there where any changes"""
-        compile_order_out_of_date = False
-        any_changes = False
-        for _, f_obj_l in self.loc_2_file_obj.items():
+        LookupSingular.write_pickle_file(pickle_loc, self, project_root=project_root)
+        # the journal held changes to the previous pickle
+        LookupSingular.pickle_loc_to_journal_loc(pickle_loc).unlink(missing_ok=True)
 
-            if isinstance(f_obj_l, ConflictFileObj):
-                # temp = ','.join([str(cf_obj.loc) for cf_obj in f_obj.get_f_objs()])
-                # log.warning("Conflicted file objects: "+temp) #HERE
-                # return True
-                f_objs = f_obj_l.get_f_objs()
-            else:
-                f_objs = make_list(f_obj_l)
-
-            for f_obj in f_objs:
-                dependency_changes, changes = f_obj.update()
+    @staticmethod
+    def write_pickle_file(pickle_loc: Path, inst: "LookupSingular", replace_if=None, project_root: Optional[Path] = None) -> bool:
+        """Written to a temporary file that replaces the pickle, so a failed write never leaves a broken pickle.
+        replace_if is called just before replacing, the pickle is not written if it returns False
+        """
+        return atomic_write(pickle_loc, lambda pickle_f: dump_cache(inst, pickle_f, pickle_loc, project_root), replace_if=replace_if)
+
+    # Journal of changed files {{{
+    # Instead of saving the whole pickle again when a source file changes, the changed FileObjs are appended to a
+    # journal next to it (.<config>.journal), which is replayed when the pickle is loaded. Once the journal is large
+    # compared to the pickle it is folded back into the pickle in a background thread.
+    # The journal starts with a fixed size header holding the identity (size, mtime) of the pickle it applies to and is
+    # ignored for any other. The header is not a pickle, so nothing is unpickled before the identity is checked.
+    # Each record is (loc, index in the files at loc, FileObj state). References to other FileObjs of the lookup
+    # are stored as their (loc, index) so replaying them keeps sharing those objects.
+    # Other processes (and watch/serve) append to the journal and save the pickle at any time, so compacting holds a
+    # lock file (.<config>.journal.lock), only replaces a pickle that is unchanged since it was read and keeps the
+    # records appended after the replayed ones.
+
+    JOURNAL_COMPACT_RATIO = 0.25  # compact once the journal is this fraction of the pickle size
+    JOURNAL_COMPACT_MIN_SIZE = 256 * 1024  # and at least this many bytes, replaying a small journal is cheap
+    JOURNAL_LOCK_STALE = 600  # seconds after which the lock of a compaction that never finished is taken over
+
+    JOURNAL_HEADER = struct.Struct("<4sQq")  # magic, pickle size, pickle mtime in ns
+    JOURNAL_MAGIC = b"HDLJ"
 
-                if dependency_changes:
-                    compile_order_out_of_date = True
-                if changes:
-                    any_changes = True
+    @staticmethod
+    def pickle_loc_to_journal_loc(pickle_loc: Path) -> Path:
+        return pickle_loc.with_suffix(".journal")
 
-        if compile_order_out_of_date:
-            log.info("Compile order has change")
-            # brute force update of dict because resolving a conflict is annoying
-            self.vhdl_package_name_2_file_obj = {}
-            self.verilog_package_name_2_file_obj = {}
-            self.entity_name_2_file_obj = {}
-            self.verilog_file_name_2_file_obj = {}
-            for _, f_obj in self.loc_2_file_obj.items():
-                assert isinstance(f_obj, FileObj)
-                f_obj.register_with_lookup(self, skip_loc=True)
+    @staticmethod
+    def journal_header(identity: Tuple[int, int]) -> bytes:
+        return LookupSingular.JOURNAL_HEADER.pack(LookupSingular.JOURNAL_MAGIC, *identity)
 
-        return any_changes
+    @staticmethod
+    def read_journal_header(journal_f) -> Optional[Tuple[int, int]]:
+        """The pickle identity in the header of an open journal, None if it has no valid header"""
+        data = journal_f.read(LookupSingular.JOURNAL_HEADER.size)
+        if len(data) != LookupSingular.JOURNAL_HEADER.size:
+            return None
+        magic, size, mtime_ns = LookupSingular.JOURNAL_HEADER.unpack(data)
+        if magic != LookupSingular.JOURNAL_MAGIC:
+            return None
+        return size, mtime_ns
 
     @staticmethod
-    def _process_config_opt_lib(config: dict, key: str, callback, with_ver: bool, top_lib: Optional[str]):
-        if top_lib is None:
-            top_lib = LIB_DEFAULT
+    def pickle_identity(pickle_loc: Path) -> Tuple[int, int]:
+        stat = pickle_loc.stat()
+        return stat.st_size, stat.st_mtime_ns
 
-        ver = None
+    def _f_objs_at(self, loc: Path) -> List[FileObj]:
+        f_obj_l = self.loc_2_file_obj.get(loc)
+        if f_obj_l is None:
+            return []
+        if isinstance(f_obj_l, ConflictFileObj):
+            return list(f_obj_l.get_f_objs())
+        return make_list(f_obj_l)
+
+    def _f_obj_key(self, f_obj: FileObj) -> Optional[Tuple[Path, int]]:
+        for index, other in enumerate(self._f_objs_at(f_obj.loc)):
+            if other is f_obj:
+                return f_obj.loc, index
+        return None
 
-        def cb(lib, val, ver):
-            if with_ver:
-                callback(lib, val, ver)
-            else:
-                assert ver is None
-                callback(lib, val)
+    def append_to_journal(self, journal_loc: Path, pickle_loc: Path, f_objs: List[FileObj], project_root: Optional[Path] = None):
+        look = self
 
-        for config_key in config.keys():
-            if with_ver:
-                k, ver = key_split_opt_ver(config_key)
-            else:
-                k = config_key
+        class JournalPickler(CachePickler):
+            def persistent_id(self, obj):
+                if isinstance(obj, FileObj) and obj is not self.root:
+                    return look._f_obj_key(obj)
+                return None
 
-            if k != key:
-                continue
+        identity = LookupSingular.pickle_identity(pickle_loc)
+        if LookupSingular.read_journal_identity(journal_loc) != identity:
+            journal_loc.unlink(missing_ok=True)
+        with open(journal_loc, "ab") as journal_f:
+            if journal_f.tell() == 0:
+                journal_f.write(LookupSingular.journal_header(identity))
+            for f_obj in f_objs:
+                key = self._f_obj_key(f_obj)
+                if key is None:
+                    continue
+                pickler = JournalPickler(journal_f, journal_loc, project_root)
+                pickler.root = f_obj
+                pickler.dump((key[0], key[1], f_obj.__getstate__()))
 
-            c_val = config[config_key]
+    @staticmethod
+    def read_journal_identity(journal_loc: Path) -> Optional[Tuple[int, int]]:
+        try:
+            with open(journal_loc, "rb") as journal_f:
+                return LookupSingular.read_journal_header(journal_f)
+        except FileNotFoundError:
+            return None
+
+    def replay_journal(self, journal_loc: Path, pickle_loc: Path, size: Optional[int] = None, project_root: Optional[Path] = None) -> Tuple[int, int]:
+        """Apply the records of the journal (up to size bytes), returns the number of records applied and the
+        number of bytes of the journal they used"""
+        look = self
+
+        class JournalUnpickler(CacheUnpickler):
+            def persistent_load(self, key):
+                f_objs = look._f_objs_at(key[0])
+                if key[1] >= len(f_objs):
+                    raise pickle.UnpicklingError(f"journal refers to unknown file {key[0]}")
+                return f_objs[key[1]]
+
+        if not journal_loc.is_file():
+            return 0, 0
+        records = 0
+        end = 0
+        dependency_changes = False
+        with open(journal_loc, "rb") as journal_f:
+            if LookupSingular.read_journal_header(journal_f) != LookupSingular.pickle_identity(pickle_loc):
+                log.info(f"journal {journal_loc} is for a different pickle, ignoring it")
+                return 0, 0
+            end = journal_f.tell()
+            while size is None or journal_f.tell() < size:
+                try:
+                    loc, index, state = JournalUnpickler(journal_f, journal_loc, project_root).load()
+                except EOFError:
+                    break
+                except Exception as e:
+                    # e.g. the tail of a record that was being written, the file is checked again anyway
+                    log.info(f"stopped replaying journal {journal_loc}: {e}")
+                    break
+                f_objs = self._f_objs_at(loc)
+                if index < len(f_objs):
+                    f_obj = f_objs[index]
+                    old = copy.copy(f_obj)
+                    f_obj.__dict__.update(state)
+                    if not f_obj.equivalent(old):
+                        dependency_changes = True
+                    records += 1
+                end = journal_f.tell()
+        log.debug(f"replayed {records} records from {journal_loc}")
+        if dependency_changes:
+            self.register_file_objs_again()
+        return records, end
+
+    @staticmethod
+    def compact_journal_if_needed(journal_loc: Path, pickle_loc: Path, background: bool = True, project_root: Optional[Path] = None):
+        try:
+            journal_size = journal_loc.stat().st_size
+        except FileNotFoundError:
+            return
+        if journal_size < max(LookupSingular.JOURNAL_COMPACT_MIN_SIZE, pickle_loc.stat().st_size * LookupSingular.JOURNAL_COMPACT_RATIO):
+            return
+        if not background:
+            LookupSingular.compact_journal(journal_loc, pickle_loc, project_root=project_root)
+            return
+
+        # not a daemon so it finishes before the process exits, it works on its own copy of the lookup
+        threading.Thread(
+            target=LookupSingular.compact_journal, args=(journal_loc, pickle_loc), kwargs={"project_root": project_root}, name=f"compact {journal_loc}"
+        ).start()
+
+    @staticmethod
+    def journal_loc_to_lock_loc(journal_loc: Path) -> Path:
+        return journal_loc.with_name(journal_loc.name + ".lock")
+
+    @staticmethod
+    def acquire_journal_lock(journal_loc: Path, timeout: float = 0) -> Optional[Path]:
+        """Create the lock file of the journal, returns its location or None if another compaction holds it"""
+        lock_loc = LookupSingular.journal_loc_to_lock_loc(journal_loc)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                os.close(os.open(lock_loc, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock_loc
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - lock_loc.stat().st_mtime > LookupSingular.JOURNAL_LOCK_STALE:
+                    log.warning(f"removing stale lock {lock_loc}")
+                    lock_loc.unlink(missing_ok=True)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    @staticmethod
+    def compact_journal(journal_loc: Path, pickle_loc: Path, lock_timeout: float = 0, project_root: Optional[Path] = None) -> bool:
+        """Fold the journal into the pickle, returns False if it was left as it is (locked, changed or failed)"""
+        lock_loc = LookupSingular.acquire_journal_lock(journal_loc, timeout=lock_timeout)
+        if lock_loc is None:
+            log.info(f"journal {journal_loc} is being compacted by another process")
+            return False
+        try:
+            identity = LookupSingular.pickle_identity(pickle_loc)
+            with open(pickle_loc, "rb") as pickle_f:
+                inst = load_cache(pickle_f, pickle_loc, project_root)
+            records, replayed = inst.replay_journal(journal_loc, pickle_loc, size=journal_loc.stat().st_size, project_root=project_root)
+            if records == 0:
+                return False
+
+            def unchanged() -> bool:
+                # another writer may have saved the pickle (which starts a new journal) meanwhile
+                if LookupSingular.pickle_identity(pickle_loc) == identity:
+                    return True
+                log.info(f"{pickle_loc} changed while compacting its journal, leaving it")
+                return False
+
+            if not unchanged() or not LookupSingular.write_pickle_file(pickle_loc, inst, replace_if=unchanged, project_root=project_root):
+                return False
+            # keep the records appended after the replayed ones, they now apply to the new pickle
+            try:
+                with open(journal_loc, "rb") as journal_f:
+                    if LookupSingular.read_journal_header(journal_f) != identity:
+                        return True  # a writer already started a journal for the new pickle
+                    journal_f.seek(replayed)
+                    tail = journal_f.read()
+            except FileNotFoundError:
+                return True
+            if len(tail) == 0:
+                journal_loc.unlink(missing_ok=True)
+            else:
+                write_bytes_file(journal_loc, LookupSingular.journal_header(LookupSingular.pickle_identity(pickle_loc)) + tail)
+            log.info(f"compacted {records} journal records of {journal_loc} into {pickle_loc}")
+            return True
+        except Exception as e:
+            log.warning(f"could not compact journal {journal_loc}: {e}")
+            return False
+        finally:
+            lock_loc.unlink(missing_ok=True)
+
+    # }}}
+
+    def register_file_objs_again(self):
+        """Rebuild the name dicts from the FileObjs, after their dependencies changed"""
+        # brute force update of dict because resolving a conflict is annoying
+        self.bump_generation()
+        self.vhdl_package_name_2_file_obj = {}
+        self.verilog_package_name_2_file_obj = {}
+        self.entity_name_2_file_obj = {}
+        self.verilog_file_name_2_file_obj = {}
+        for _, f_obj in self.loc_2_file_obj.items():
+            assert isinstance(f_obj, FileObj)
+            f_obj.register_with_lookup(self, skip_loc=True)
+
+    def refresh_modification_times(self, unchanged: Set[str]):
+        """Take the modification times on disk of the files in unchanged (normalised paths of files known to have the
+        content they had when this lookup was cached), e.g. after the cache was unpacked into another checkout
+        """
+        if self.toml_loc is not None and os.path.normpath(self.toml_loc) in unchanged:
+            self.toml_modification_time = get_file_modification_time(self.toml_loc)
+        for loc in self.loc_2_file_obj:
+            for f_obj in self._f_objs_at(loc):
+                if f_obj.exists and os.path.normpath(f_obj.loc) in unchanged:
+                    f_obj.modification_time = f_obj.get_modification_time_on_disk()
+        for sub in getattr(self, "look_subs", []):
+            if isinstance(sub, LazyLookup) and sub.summary is not None:
+                states = sub.summary.source_states
+                for loc, state in states.items():
+                    if state is not None and state.startswith("mtime:") and os.path.normpath(loc) in unchanged:
+                        states[loc] = get_input_state(loc)
+
+    def check_for_src_files_updates(self, changed: Optional[List[FileObj]] = None) -> bool:
+        """Returns True if there where any changes, the changed files are appended to changed"""
+        compile_order_out_of_date = False
+        any_changes = False
+        for _, f_obj_l in self.loc_2_file_obj.items():
+
+            if isinstance(f_obj_l, ConflictFileObj):
+                # temp = ','.join([str(cf_obj.loc) for cf_obj in f_obj.get_f_objs()])
+                # log.warning("Conflicted file objects: "+temp) #HERE
+                # return True
+                f_objs = f_obj_l.get_f_objs()
+            else:
+                f_objs = make_list(f_obj_l)
+
+            for f_obj in f_objs:
+                dependency_changes, changes = f_obj.update()
+
+                if dependency_changes:
+                    compile_order_out_of_date = True
+                if changes:
+                    any_changes = True
+                    if changed is not None:
+                        changed.append(f_obj)
+
+        if compile_order_out_of_date:
+            log.info("Compile order has change")
+            self.register_file_objs_again()
+
+        return any_changes
+
+    @staticmethod
+    def _process_config_opt_lib(config: dict, key: str, callback, with_ver: bool, top_lib: Optional[str]):
+        if top_lib is None:
+            top_lib = LIB_DEFAULT
+
+        ver = None
+
+        def cb(lib, val, ver):
+            if with_ver:
+                callback(lib, val, ver)
+            else:
+                assert ver is None
+                callback(lib, val)
+
+        for config_key in config.keys():
+            if with_ver:
+                k, ver = key_split_opt_ver(config_key)
+            else:
+                k = config_key
+
+            if k != key:
+                continue
+
+            c_val = config[config_key]
             if isinstance(c_val, dict):
                 for lib, val in c_val.items():
                     if isinstance(val, List):
@@ -2270,6 +3197,9 @@ class LookupSingular(Lookup):  # {{{
     def check_if_skip_from_order(self, loc: Path):
         return loc in self.files_2_skip_from_order
 
+    def get_skip_locs(self) -> Set[Path]:
+        return self.files_2_skip_from_order
+
     def register_other_file_list(self, other_file_list: List[Tuple[Path, str]]):
         self.other_file_list = other_file_list
         for loc, ver in other_file_list:
@@ -2279,6 +3209,7 @@ class LookupSingular(Lookup):  # {{{
             f_obj.entities.append(entity_name)
             self.entity_name_2_file_obj[entity_name] = f_obj
             self.loc_2_file_obj[f_obj.loc] = f_obj
+            self.bump_generation()
 
     def register_x_bd_file_list(self, x_bd_file_list: List[Tuple[Path, str]]):
         self.x_bd_file_list = x_bd_file_list
@@ -2367,49 +3298,37 @@ class LookupSingular(Lookup):  # {{{
         assert self.verilog_include_file_list is not None
         return self.verilog_include_file_list
 
-    def get_vhdl_package(self, name: Name, f_obj_required_by: Optional[FileObjVhdl]) -> Optional[FileObjVhdl]:
-        loc_str = "None"
-        if f_obj_required_by is not None:
-            loc_str = str(f_obj_required_by.loc)
+    def _resolve_vhdl_package(self, name: Name) -> ResolveResult:
         if name not in self.vhdl_package_name_2_file_obj:
             if name.lib in self.ignore_set_libs:
                 return None
             if name in self.ignore_set_packages:
                 return None
-            raise KeyError(f"ERROR: Could not find package {name} required by {loc_str}")
+            return ResolveMiss()
 
         item = self.vhdl_package_name_2_file_obj[name]
         if isinstance(item, FileObj):
             assert isinstance(item, FileObjVhdl)
             return item
-        elif isinstance(item, ConflictFileObj):
-            item.log_confict(name)
-            raise KeyError(f"ERROR: confict on package {name} required by {loc_str}")
+        assert isinstance(item, ConflictFileObj)
+        return ResolveMiss("confict on", conflicts=[(name, item)])
 
-    def get_verilog_package(self, name: Name, f_obj_required_by: Optional[FileObjVerilog]) -> Optional[FileObjVerilog]:
-        loc_str = "None"
-        if f_obj_required_by is not None:
-            loc_str = str(f_obj_required_by.loc)
+    def _resolve_verilog_package(self, name: Name) -> ResolveResult:
         if name not in self.verilog_package_name_2_file_obj:
             if name.lib in self.ignore_set_libs:
                 return None
             if name in self.ignore_set_packages:
                 return None
-            raise KeyError(f"ERROR: Could not find package {name} required by {loc_str}")
+            return ResolveMiss()
 
         item = self.verilog_package_name_2_file_obj[name]
         if isinstance(item, FileObj):
             assert isinstance(item, FileObjVerilog)
             return item
-        elif isinstance(item, ConflictFileObj):
-            item.log_confict(name)
-            raise KeyError(f"ERROR: confict on package {name} required by {loc_str}")
-
-    def get_entity(self, name: Name, f_obj_required_by: Optional[FileObj], ignore_lib=False) -> Optional[FileObj]:
-        loc_str = "None"
-        if f_obj_required_by is not None:
-            loc_str = str(f_obj_required_by.loc)
+        assert isinstance(item, ConflictFileObj)
+        return ResolveMiss("confict on", conflicts=[(name, item)])
 
+    def _resolve_entity(self, name: Name, ignore_lib=False) -> ResolveResult:
         item = None
         if name not in self.entity_name_2_file_obj:
             if name.lib in self.ignore_set_libs:
@@ -2425,30 +3344,27 @@ class LookupSingular(Lookup):  # {{{
                 # Special case: Search for X files (XCI/BD) by name only, ignoring library
                 # This is needed because X files are defined in 'work' but may be instantiated
                 # from other libraries
-                x_result = self._get_x_entity_by_name_only(name.name, f_obj_required_by)
+                x_result = self._get_x_entity_by_name_only(name.name, None)
                 if x_result is not None:
                     matched_f_obj, all_matches = x_result
                     if len(all_matches) > 1:
                         # Multiple X files with same name
                         match_info = ", ".join([f"{f.loc} ({f.x_device if hasattr(f, 'x_device') else 'no device'})" for f in all_matches])
-                        raise KeyError(
-                            f"ERROR: Ambiguous entity {name} required by {loc_str}. " f"Found multiple X files with this name: {match_info}. "
-                        )
+                        return ResolveMiss("Ambiguous", detail=f". Found multiple X files with this name: {match_info}. ")
                     log.info(f"Found X file {matched_f_obj.loc} for entity {name} by ignoring library ")
                     return matched_f_obj
 
-                raise KeyError(f"ERROR: Could not find entity {name} required by {loc_str}, {ignore_lib=}")
+                return ResolveMiss(detail=f", {ignore_lib=}")
 
         if item is None:
             item = self.entity_name_2_file_obj[name]
         if isinstance(item, FileObj):
             return item
-        elif isinstance(item, ConflictFileObj):
-            resolved = item.resolve_conflict(x_tool_version=self.x_tool_version, x_device=self.x_device)
-            if isinstance(resolved, FileObj):
-                return resolved
-            item.log_confict(name)
-            raise KeyError(f"ERROR: confict on entity {name} required by {loc_str}, {ignore_lib=}")
+        assert isinstance(item, ConflictFileObj)
+        resolved = item.resolve_conflict(x_tool_version=self.x_tool_version, x_device=self.x_device)
+        if isinstance(resolved, FileObj):
+            return resolved
+        return ResolveMiss("confict on", detail=f", {ignore_lib=}", conflicts=[(name, item)])
 
     def _get_x_entity_by_name_only(self, name: str, f_obj_required_by: Optional[FileObj]) -> Optional[Tuple[FileObj, List[FileObj]]]:
         """
@@ -2462,34 +3378,17 @@ class LookupSingular(Lookup):  # {{{
         """
         matches = []
 
-        for entity_name, item in self.entity_name_2_file_obj.items():
-            # Only check if the entity name matches
-            if entity_name.name != name:
-                continue
-
-            # Get the file object(s)
-            f_objs = []
-            if isinstance(item, FileObj):
-                f_objs = [item]
-            elif isinstance(item, ConflictFileObj):
-                f_objs = list(item.get_f_objs())
-
-            # Filter to only X files (XCI or BD) that match requirements
-            for f_obj in f_objs:
-                # Only consider X files (XCI/BD)
-                if not isinstance(f_obj, FileObjX):
+        for f_obj in self.get_x_entities_by_name().get(name, []):
+            # Check if this X file matches the project requirements
+            if self.x_tool_version and self.x_device:
+                if not f_obj.matches_x_requirements(self.x_tool_version, self.x_device):
+                    log.debug(
+                        f"Skipping X file {f_obj.loc} in library-agnostic search - "
+                        f"doesn't match requirements (file: {f_obj.x_tool_version}/{f_obj.x_device}, "
+                        f"required: {self.x_tool_version}/{self.x_device})"
+                    )
                     continue
-
-                # Check if this X file matches the project requirements
-                if self.x_tool_version and self.x_device:
-                    if not f_obj.matches_x_requirements(self.x_tool_version, self.x_device):
-                        log.debug(
-                            f"Skipping X file {f_obj.loc} in library-agnostic search - "
-                            f"doesn't match requirements (file: {f_obj.x_tool_version}/{f_obj.x_device}, "
-                            f"required: {self.x_tool_version}/{self.x_device})"
-                        )
-                        continue
-                matches.append(f_obj)
+            matches.append(f_obj)
 
         if len(matches) == 0:
             return None
@@ -2497,6 +3396,45 @@ class LookupSingular(Lookup):  # {{{
         # Return first match and all matches for conflict detection
         return (matches[0], matches)
 
+    def resolve_entity(self, name: Name, ignore_lib=False) -> ResolveResult:
+        if not ignore_lib:
+            f_obj = self.get_entity_filter().resolved.get(name)
+            if f_obj is not None:
+                return f_obj
+        return Lookup.resolve_entity(self, name, ignore_lib)
+
+    def get_entity_filter(self) -> EntityFilter:
+        """The EntityFilter of this lookup (and its subs), rebuilt when the name indices change"""
+        generation = self.get_generation()
+        if generation != self._entity_filter_generation:
+            self._entity_filter = self._make_entity_filter()
+            self._entity_filter_generation = generation
+        assert self._entity_filter is not None
+        return self._entity_filter
+
+    def _make_entity_filter(self) -> EntityFilter:
+        names = {name.name for name in self.entity_name_2_file_obj.keys()}
+        resolved = {name: item for name, item in self.entity_name_2_file_obj.items() if isinstance(item, FileObj)}
+        return EntityFilter(
+            names, set(self.ignore_set_libs), set(self.ignore_set_entities), set(self.get_x_entities_by_name().keys()), resolved
+        )
+
+    def get_x_entities_by_name(self) -> Dict[str, List[FileObj]]:
+        """The X files (XCI or BD) of this lookup by entity name only, rebuilt when the name indices change"""
+        if self._generation != self._x_entities_generation:
+            self._x_entities_by_name = {}
+            for entity_name, item in self.entity_name_2_file_obj.items():
+                f_objs = []
+                if isinstance(item, FileObj):
+                    f_objs = [item]
+                elif isinstance(item, ConflictFileObj):
+                    f_objs = list(item.get_f_objs())
+                for f_obj in f_objs:
+                    if isinstance(f_obj, FileObjX):
+                        self._x_entities_by_name.setdefault(entity_name.name, []).append(f_obj)
+            self._x_entities_generation = self._generation
+        return self._x_entities_by_name
+
     def get_top_lib(self):
         return self.top_lib
 
@@ -2513,31 +3451,24 @@ class LookupSingular(Lookup):  # {{{
                 file_list.append(f_obj)
         return file_list
 
-    def write_file_list(self, f_loc, f_type: Optional[FileObjType] = None, lib: Optional[str] = None):
-        file_list = self.get_file_list(lib=lib)
-        with open(f_loc, "w") as f:
-            for f_obj in file_list:
-                if f_type is not None:
-                    if f_obj.f_type != f_type:
-                        continue
-                if lib is None:
-                    f.write(f"{f_obj.lib}\t{f_obj.loc}\n")
-                else:
-                    f.write(str(f_obj.loc) + "\n")
-
-    def write_ext_file_list(self, f_loc: Path, ver_tag: Optional[str] = None):
-        log.debug(f"Called write_ext_file_list(f_loc = {f_loc}, ver_tag = {ver_tag})")
-        log.debug(f"self {self}")
-        with open(f_loc, "w") as f:
-            if ver_tag is None:
-                tag_2_ext = self.get_tag_2_ext_file()
-                for ver_tag, ext_l in tag_2_ext.items():
-                    for ext in ext_l:
-                        f.write(f"{ver_tag}\t{ext}\n")
-            else:
-                ext_l = self.get_ext_files_for_tag(ver_tag)
+    def format_file_list(self, f_type: Optional[FileObjType] = None, lib: Optional[str] = None) -> str:
+        emitter = OutputEmitter(self)
+        out = emitter.add_file_list(None, f_type, lib)
+        emitter.run()
+        return out.text
+
+    def format_ext_file_list(self, ver_tag: Optional[str] = None) -> str:
+        lines = []
+        if ver_tag is None:
+            tag_2_ext = self.get_tag_2_ext_file()
+            for ver_tag, ext_l in tag_2_ext.items():
                 for ext in ext_l:
-                    f.write(f"{ext}\n")
+                    lines.append(f"{ver_tag}\t{ext}\n")
+        else:
+            ext_l = self.get_ext_files_for_tag(ver_tag)
+            for ext in ext_l:
+                lines.append(f"{ext}\n")
+        return "".join(lines)
 
 
 # }}}
@@ -2576,6 +3507,37 @@ class LookupMulti(LookupSingular):  # {{{
                 return f_obj
         return None
 
+    def iter_file_objs(self):
+        yield from LookupSingular.iter_file_objs(self)
+        for sub in self.look_subs:
+            yield from sub.iter_file_objs()
+
+    def iter_entity_names(self):
+        yield from LookupSingular.iter_entity_names(self)
+        for sub in self.look_subs:
+            yield from sub.iter_entity_names()
+
+    def iter_lookups(self):
+        yield self
+        for sub in self.look_subs:
+            yield from sub.iter_lookups()
+
+    def get_input_locs(self) -> Tuple[List[Path], List[Path]]:
+        files, dirs = LookupSingular.get_input_locs(self)
+        for sub in self.look_subs:
+            sub_files, sub_dirs = sub.get_input_locs()
+            files += sub_files
+            dirs += sub_dirs
+        return list(dict.fromkeys(files)), list(dict.fromkeys(dirs))
+
+    def configs_unchanged(self) -> bool:
+        return LookupSingular.configs_unchanged(self) and all(sub.configs_unchanged() for sub in self.look_subs)
+
+    def update_src_files(self):
+        LookupSingular.update_src_files(self)
+        for sub in self.look_subs:
+            sub.update_src_files()
+
     def set_x_tool_version(self, x_tool_version: str):
         for sub in self.look_subs:
             sub.set_x_tool_version(x_tool_version)
@@ -2597,19 +3559,17 @@ class LookupMulti(LookupSingular):  # {{{
 
     def get_tag_2_ext_file(self) -> dict[str, List[Path]]:
         log.debug("LookupMulti.get_tag_2_ext_file called")
-        tag_2_ext = LookupSingular.get_tag_2_ext_file(self).copy()
+        # copy the lists, extending them would change the lookups they came from
+        tag_2_ext = {tag: list(f_l) for tag, f_l in LookupSingular.get_tag_2_ext_file(self).items()}
         for sub in self.look_subs:
             for tag, f_l in sub.get_tag_2_ext_file().items():
-                if tag in tag_2_ext:
-                    tag_2_ext[tag].extend(f_l)
-                else:
-                    tag_2_ext[tag] = f_l
+                tag_2_ext.setdefault(tag, []).extend(f_l)
         return tag_2_ext
 
     def get_ext_files_for_tag(self, tag: str) -> List[Path]:
-        f_l = LookupSingular.get_ext_files_for_tag(self, tag)
+        f_l = list(LookupSingular.get_ext_files_for_tag(self, tag))
         for sub in self.look_subs:
-            f_l.extend(LookupSingular.get_ext_files_for_tag(sub, tag))
+            f_l.extend(sub.get_ext_files_for_tag(tag))
         return f_l
 
     @staticmethod
@@ -2703,6 +3663,12 @@ class LookupMulti(LookupSingular):  # {{{
                 return True
         return False
 
+    def get_skip_locs(self) -> Set[Path]:
+        skip_locs = set(LookupSingular.get_skip_locs(self))
+        for l_common in self.look_subs:
+            skip_locs |= l_common.get_skip_locs()
+        return skip_locs
+
     def get_top_lib(self) -> Optional[str]:
         if super().get_top_lib() is not None:
             return super().get_top_lib()
@@ -2712,18 +3678,37 @@ class LookupMulti(LookupSingular):  # {{{
                 return top_lib
         return None
 
-    def _get_named_item(self, item_ref: str, name: Name, call_back_func_arr, f_obj_required_by: Optional[FileObj]) -> Optional[FileObj]:
-        for call_back in call_back_func_arr:
-            try:
-                result = call_back(name, f_obj_required_by)
-                return result
-            except KeyError:
-                pass
-
+    def get_generation(self) -> int:
+        epoch = Lookup.generation_epoch
+        if epoch != self._generation_sum_epoch:
+            generation = self._generation
+            for sub in self.look_subs:
+                generation += sub.get_generation()
+            self._generation_sum = generation
+            self._generation_sum_epoch = epoch
+        return self._generation_sum
+
+    def miss_to_key_error(self, item_ref: str, name: Name, f_obj_required_by: Optional[FileObj], miss: ResolveMiss) -> KeyError:
+        miss.log_conflicts()
         loc_str = "None"
         if f_obj_required_by is not None:
             loc_str = f"{f_obj_required_by.lib}:{f_obj_required_by.loc}"
-        raise KeyError(f"{item_ref} {name} not found in depndency lookups. required by file {loc_str}")
+        return KeyError(f"{item_ref} {name} not found in depndency lookups. required by file {loc_str}")
+
+    def _resolve_from_subs(self, result: ResolveResult, resolve_sub, entity: Optional[Name] = None) -> ResolveResult:
+        """Resolve from the subs in order if result is a miss, for an entity only the subs that might have it are asked"""
+        if not isinstance(result, ResolveMiss):
+            return result
+        conflicts = list(result.conflicts)
+        sub_filters = None if entity is None else self.get_entity_filter().subs
+        for i, sub in enumerate(self.look_subs):
+            if sub_filters is not None and not sub_filters[i].might_resolve(entity):
+                continue
+            result = resolve_sub(sub)
+            if not isinstance(result, ResolveMiss):
+                return result
+            conflicts += result.conflicts
+        return ResolveMiss(conflicts=conflicts)
 
     def get_verilog_include_dir_list(self) -> List[Path]:
         if self.verilog_include_dir_list_final is not None:
@@ -2749,40 +3734,64 @@ class LookupMulti(LookupSingular):  # {{{
             self.verilog_include_file_list_final += d
         return self.verilog_include_file_list_final
 
-    def get_vhdl_package(self, name: Name, f_obj_required_by: Optional[FileObjVhdl]) -> Optional[FileObjVhdl]:
-        def cb(name: Name, f_obj_required_by: Optional[FileObj]):
-            assert f_obj_required_by is None or isinstance(f_obj_required_by, FileObjVhdl)
-            return LookupSingular.get_vhdl_package(self, name, f_obj_required_by)
-
-        call_back_func_arr = [cb] + [l.get_vhdl_package for l in self.look_subs]
-        f_obj = self._get_named_item("package", name, call_back_func_arr, f_obj_required_by)
-        assert f_obj is None or isinstance(f_obj, FileObjVhdl)
-        return f_obj
-
-    def get_verilog_package(self, name: Name, f_obj_required_by: Optional[FileObjVerilog]) -> Optional[FileObjVerilog]:
-        def cb(name: Name, f_obj_required_by: Optional[FileObj]):
-            assert f_obj_required_by is None or isinstance(f_obj_required_by, FileObjVerilog)
-            return LookupSingular.get_verilog_package(self, name, f_obj_required_by)
-
-        call_back_func_arr = [cb] + [l.get_verilog_package for l in self.look_subs]
-        f_obj = self._get_named_item("package", name, call_back_func_arr, f_obj_required_by)
-        assert f_obj is None or isinstance(f_obj, FileObjVerilog)
-        return f_obj
-
-    def get_entity(self, name: Name, f_obj_required_by: Optional[FileObj], ignore_lib=False) -> Optional[FileObj]:
-        def cb(name: Name, f_obj_required_by: Optional[FileObj]):
-            return LookupSingular.get_entity(self, name, f_obj_required_by, ignore_lib=ignore_lib)
-
-        callbacks = []
-        for l in self.look_subs:
+    def check_summary_sources(self) -> bool:
+        """Check the source files behind the summaries of the subs not loaded, True if a sub was loaded because they
+        changed (the resolve caches are then out of date)
+        """
+        changed = False
+        for sub in self.look_subs:
+            if sub.check_summary_sources():
+                changed = True
+        if changed:
+            self.bump_generation()
+        return changed
+
+    def _resolve_vhdl_package(self, name: Name) -> ResolveResult:
+        result = LookupSingular._resolve_vhdl_package(self, name)
+        result = self._resolve_from_subs(result, lambda sub: sub.resolve_vhdl_package(name))
+        if isinstance(result, ResolveMiss) and self.check_summary_sources():
+            return self._resolve_vhdl_package(name)
+        return result
 
-            def cb2(name: Name, f_obj_required_by):
-                return l.get_entity(name=name, f_obj_required_by=f_obj_required_by, ignore_lib=ignore_lib)
+    def _resolve_verilog_package(self, name: Name) -> ResolveResult:
+        result = LookupSingular._resolve_verilog_package(self, name)
+        result = self._resolve_from_subs(result, lambda sub: sub.resolve_verilog_package(name))
+        if isinstance(result, ResolveMiss) and self.check_summary_sources():
+            return self._resolve_verilog_package(name)
+        return result
 
-            callbacks.append(cb2)
+    def _resolve_entity(self, name: Name, ignore_lib=False) -> ResolveResult:
+        result = LookupSingular._resolve_entity(self, name, ignore_lib)
+        result = self._resolve_from_subs(result, lambda sub: sub.resolve_entity(name, ignore_lib), entity=name)
+        if isinstance(result, ResolveMiss) and self.check_summary_sources():
+            return self._resolve_entity(name, ignore_lib)
+        return result
 
-        call_back_func_arr = [cb] + callbacks
-        return self._get_named_item("entity", name, call_back_func_arr, f_obj_required_by)
+    def _make_entity_filter(self) -> EntityFilter:
+        entity_filter = LookupSingular._make_entity_filter(self)
+        entity_filter.subs = [sub.get_entity_filter() for sub in self.look_subs]
+        for sub_filter in entity_filter.subs:
+            entity_filter.x_names |= sub_filter.x_names
+        # a name a sub resolves is resolved the same here if this lookup does not have it, ignore it or find it as
+        # an X file, and no earlier sub might resolve it (those are asked first)
+        resolved = entity_filter.resolved
+        own = self.entity_name_2_file_obj
+        for sub_filter in entity_filter.subs:
+            for name, f_obj in sub_filter.resolved.items():
+                if (
+                    name in resolved
+                    or name in own
+                    or name.name in entity_filter.x_names
+                    or name.name in entity_filter.names
+                    or name.lib in entity_filter.ignore_libs
+                    or name in entity_filter.ignore_entities
+                ):
+                    continue
+                resolved[name] = f_obj
+            entity_filter.names |= sub_filter.names
+            entity_filter.ignore_libs |= sub_filter.ignore_libs
+            entity_filter.ignore_entities |= sub_filter.ignore_entities
+        return entity_filter
 
     def _get_x_entity_by_name_only(self, name: str, f_obj_required_by: Optional[FileObj]) -> Optional[Tuple[FileObj, List[FileObj]]]:
         """
@@ -2797,8 +3806,10 @@ class LookupMulti(LookupSingular):  # {{{
             _, matches = result
             all_matches.extend(matches)
 
-        # Search in sub-lookups
-        for sub in self.look_subs:
+        # Search in sub-lookups (that have an X file of the name)
+        for sub, sub_filter in zip(self.look_subs, self.get_entity_filter().subs):
+            if name not in sub_filter.x_names:
+                continue
             result = sub._get_x_entity_by_name_only(name, f_obj_required_by)
             if result is not None:
                 _, matches = result
@@ -2826,6 +3837,316 @@ class LookupMulti(LookupSingular):  # {{{
 # }}}
 
 
+# Lazily loaded sub lookups {{{
+class LookupSummary:
+    """Cheap summary of a sub lookup (and its own subs) kept in the parent's pickle. It tells which names the
+    sub could resolve, so a LazyLookup is only loaded when it might have what is being looked for.
+    """
+
+    def __init__(self):
+        self.config_locs: List[Path] = []
+        self.input_states: Dict[Path, Optional[str]] = {}  # config files, file lists and glob directories
+        self.source_states: Dict[Path, Optional[str]] = {}  # source files (and their direct dependencies), only checked when a name is not found
+        self.entity_names: Set[str] = set()
+        self.x_entity_names: Set[str] = set()  # entities of XCI/BD files, which are also searched for by name only
+        self.vhdl_package_names: Set[str] = set()
+        self.verilog_package_names: Set[str] = set()
+        self.ignore_libs: Set[str] = set()
+        self.ignore_packages: Set[Name] = set()
+        self.ignore_entities: Set[Name] = set()
+        self.locs: Set[Path] = set()
+        self.skip_locs: Set[Path] = set()
+        self.own_init_files = False
+        self.top_lib: Optional[str] = None
+
+    @staticmethod
+    def of(look: Lookup) -> "LookupSummary":
+        if isinstance(look, LazyLookup):
+            return look.get_summary()
+        assert isinstance(look, LookupSingular)
+        summary = LookupSummary()
+        summary.top_lib = look.get_top_lib()
+        summary.own_init_files = len(look.init_files) != 0
+        summary._add_own(look)
+        for sub in getattr(look, "look_subs", []):
+            summary._merge(LookupSummary.of(sub))
+        return summary
+
+    def _add_own(self, look: LookupSingular):
+        if look.toml_loc is not None:
+            self.config_locs.append(look.toml_loc)
+        files, dirs = look.get_config_input_locs()
+        self.input_states.update(get_input_states(files + dirs, content=True))
+        for f_obj in LookupSingular.iter_file_objs(look):
+            self.locs.add(f_obj.loc)
+            for loc in [f_obj.loc] + f_obj.direct_deps:
+                self.source_states[loc] = get_input_state(loc)
+        for name, item in look.entity_name_2_file_obj.items():
+            self.entity_names.add(name.name)
+            f_objs = item.get_f_objs() if isinstance(item, ConflictFileObj) else [item]
+            if any(isinstance(f_obj, FileObjX) for f_obj in f_objs):
+                self.x_entity_names.add(name.name)
+        self.vhdl_package_names.update(name.name for name in look.vhdl_package_name_2_file_obj.keys())
+        self.verilog_package_names.update(name.name for name in look.verilog_package_name_2_file_obj.keys())
+        self.ignore_libs.update(look.ignore_set_libs)
+        self.ignore_packages.update(look.ignore_set_packages)
+        self.ignore_entities.update(look.ignore_set_entities)
+        self.skip_locs.update(look.files_2_skip_from_order)
+
+    def _merge(self, other: "LookupSummary"):
+        self.config_locs += other.config_locs
+        self.input_states.update(other.input_states)
+        self.source_states.update(other.source_states)
+        for attr in ["entity_names", "x_entity_names", "vhdl_package_names", "verilog_package_names", "ignore_libs", "ignore_packages", "ignore_entities", "locs", "skip_locs"]:
+            getattr(self, attr).update(getattr(other, attr))
+
+    def is_current(self) -> bool:
+        """True if none of the config inputs the summary was made from have changed. Which files the sub holds
+        comes from these, the source files only add the names declared in them (see sources_current)
+        """
+        return input_states_unchanged(self.input_states)
+
+    def sources_current(self) -> bool:
+        """True if none of the source files of the sub have changed, so the names in the summary are still declared"""
+        return input_states_unchanged(self.source_states)
+
+    def might_resolve_entity(self, name: Name) -> bool:
+        # names are compared without the library to cover ignore_lib and the X file search by name only
+        return name.name in self.entity_names or name.lib in self.ignore_libs or name in self.ignore_entities
+
+    def might_resolve_package(self, name: Name, verilog: bool) -> bool:
+        names = self.verilog_package_names if verilog else self.vhdl_package_names
+        return name.name in names or name.lib in self.ignore_libs or name in self.ignore_packages
+
+
+class LazyLookup:
+    """A sub lookup that is only loaded (from its pickle or config) the first time it is needed.
+
+    While it is not loaded the queries a parent LookupMulti makes are answered from the LookupSummary saved in the
+    parent's pickle, once the summary is checked against the config inputs on disk. The source files are only checked
+    when the project cannot find a name (see check_summary_sources). Any other attribute loads the sub.
+    """
+
+    _OWN_ATTRS = {"toml_loc", "load_top_lib", "load_kwargs", "summary", "look", "summary_checked", "sources_checked", "save_parent", "pending"}
+
+    def __init__(
+        self,
+        toml_loc: Path,
+        summary: Optional[LookupSummary] = None,
+        look: Optional[Lookup] = None,
+        top_lib: Optional[str] = None,
+        save_parent=None,
+        **load_kwargs,
+    ):
+        self.toml_loc = toml_loc
+        self.load_top_lib = top_lib
+        self.load_kwargs = load_kwargs
+        self.summary = summary
+        self.look = look
+        self.summary_checked = False
+        self.sources_checked = False
+        self.save_parent = save_parent  # saves the parent's pickle (with the new summary), None if it is not written
+        self.pending: List[Tuple[str, tuple]] = []  # calls to make on the lookup once it is loaded
+
+    def __getstate__(self):
+        summary = self.summary if self.look is None else self.get_summary()
+        return {"toml_loc": self.toml_loc, "top_lib": self.load_top_lib, "summary": summary}
+
+    def __setstate__(self, state):
+        self.__init__(state["toml_loc"], summary=state["summary"], top_lib=state["top_lib"])
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in LazyLookup._OWN_ATTRS:
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def load(self) -> Lookup:
+        if self.look is None:
+            log.info(f"loading sub config {self.toml_loc}")
+            loads = self.load_kwargs.get("loads")
+            if loads is None:
+                loads = ConfigLoads()
+            kwargs = {key: value for key, value in self.load_kwargs.items() if key != "loads"}
+            look = loads.load_all([self.toml_loc], top_lib=self.load_top_lib, **kwargs)[0]
+            for method, args in self.pending:
+                getattr(look, method)(*args)
+            self.look = look
+            self.summary = None
+            Lookup.generation_epoch += 1  # the generation of the sub is now that of the loaded lookup
+        return self.look
+
+    def _unloaded_summary(self) -> Optional[LookupSummary]:
+        """The summary while the sub is not loaded and the summary is current, otherwise None"""
+        if self.look is not None:
+            return None
+        if not self.summary_checked:
+            self.summary_checked = True
+            if self.summary is not None:
+                # pre_cmds of the sub configs may still be writing their file lists
+                wait_for_pre_cmds(self.summary.config_locs)
+                if not self.summary.is_current():
+                    log.info(f"summary of sub config {self.toml_loc} is out of date")
+                    self.summary = None
+        return self.summary
+
+    def check_summary_sources(self) -> bool:
+        """Check the source files behind the summary once, if they changed the sub is loaded (as a source edit may
+        declare a name the summary does not have) and True is returned
+        """
+        if self.look is not None:
+            return self.look.check_summary_sources()
+        summary = self._unloaded_summary()
+        if summary is None or self.sources_checked:
+            return False
+        self.sources_checked = True
+        if summary.sources_current():
+            return False
+        log.info(f"summary of sub config {self.toml_loc} is out of date (source files changed)")
+        self.summary = None
+        self.load()
+        if self.save_parent is not None:
+            self.save_parent()
+        return True
+
+    def iter_lookups(self):
+        """Loads the sub, for the uses that need every config (e.g. exporting the caches)"""
+        yield from self.load().iter_lookups()
+
+    def configs_unchanged(self) -> bool:
+        """While the sub is not loaded its summary is checked against the config inputs again, a sub whose summary
+        is out of date is loaded (from its config) rather than the whole project being loaded again
+        """
+        if self.look is not None:
+            return self.look.configs_unchanged()
+        self.summary_checked = True
+        if self.summary is not None and self.summary.is_current():
+            return True
+        log.info(f"summary of sub config {self.toml_loc} is out of date")
+        self.summary = None
+        self.load()
+        if self.save_parent is not None:
+            self.save_parent()
+        return True
+
+    def update_src_files(self):
+        if self.look is not None:
+            self.look.update_src_files()
+        else:
+            # the source files behind the summary are checked again the next time a name is not found
+            self.sources_checked = False
+
+    def get_input_locs(self) -> Tuple[List[Path], List[Path]]:
+        """While the sub is not loaded the inputs recorded in its (current) summary"""
+        summary = self._unloaded_summary()
+        if summary is None:
+            return self.load().get_input_locs()
+        files = []
+        dirs = []
+        for loc, state in summary.input_states.items():
+            if state is not None and state.startswith("dir:"):
+                dirs.append(loc)
+            else:
+                files.append(loc)
+        return files + list(summary.source_states), dirs
+
+    def get_summary(self) -> LookupSummary:
+        summary = self._unloaded_summary()
+        if summary is None:
+            if self.summary is None:
+                self.summary = LookupSummary.of(self.load())
+            summary = self.summary
+        return summary
+
+    def _call(self, method: str, *args):
+        if self.look is None:
+            self.pending.append((method, args))
+        else:
+            getattr(self.look, method)(*args)
+
+    def set_x_tool_version(self, x_tool_version: str):
+        self._call("set_x_tool_version", x_tool_version)
+
+    def set_x_device(self, x_device: str):
+        self._call("set_x_device", x_device)
+
+    def filter_x_files_by_requirements(self):
+        self._call("filter_x_files_by_requirements")
+
+    def get_generation(self) -> int:
+        # loading the sub changes the generation which invalidates the parent's caches
+        return 0 if self.look is None else self.look.get_generation()
+
+    def resolve_entity(self, name: Name, ignore_lib=False) -> ResolveResult:
+        summary = self._unloaded_summary()
+        if summary is not None and not summary.might_resolve_entity(name):
+            return ResolveMiss()
+        return self.load().resolve_entity(name, ignore_lib)
+
+    def get_entity_filter(self) -> EntityFilter:
+        summary = self._unloaded_summary()
+        if summary is not None:
+            return EntityFilter(summary.entity_names, summary.ignore_libs, summary.ignore_entities, summary.x_entity_names, {})
+        return self.load().get_entity_filter()
+
+    def resolve_vhdl_package(self, name: Name) -> ResolveResult:
+        summary = self._unloaded_summary()
+        if summary is not None and not summary.might_resolve_package(name, verilog=False):
+            return ResolveMiss()
+        return self.load().resolve_vhdl_package(name)
+
+    def resolve_verilog_package(self, name: Name) -> ResolveResult:
+        summary = self._unloaded_summary()
+        if summary is not None and not summary.might_resolve_package(name, verilog=True):
+            return ResolveMiss()
+        return self.load().resolve_verilog_package(name)
+
+    def _get_x_entity_by_name_only(self, name: str, f_obj_required_by: Optional[FileObj]) -> Optional[Tuple[FileObj, List[FileObj]]]:
+        summary = self._unloaded_summary()
+        if summary is not None and name not in summary.x_entity_names:
+            return None
+        return self.load()._get_x_entity_by_name_only(name, f_obj_required_by)
+
+    def has_loc(self, loc: Path) -> bool:
+        summary = self._unloaded_summary()
+        if summary is not None and resolve_abs_path(loc) not in summary.locs:
+            return False
+        return self.load().has_loc(loc)
+
+    def loc_to_file_obj(self, loc) -> Optional[FileObj]:
+        summary = self._unloaded_summary()
+        if summary is not None and loc not in summary.locs:
+            return None
+        return self.load().loc_to_file_obj(loc)
+
+    def check_if_skip_from_order(self, loc: Path) -> bool:
+        summary = self._unloaded_summary()
+        if summary is not None:
+            return loc in summary.skip_locs
+        return self.load().check_if_skip_from_order(loc)
+
+    def get_skip_locs(self) -> Set[Path]:
+        summary = self._unloaded_summary()
+        if summary is not None:
+            return summary.skip_locs
+        return self.load().get_skip_locs()
+
+    def get_top_lib(self) -> Optional[str]:
+        summary = self._unloaded_summary()
+        if summary is not None:
+            return summary.top_lib
+        return self.load().get_top_lib()
+
+    @property
+    def init_files(self) -> List[FileObj]:
+        summary = self._unloaded_summary()
+        if summary is not None and not summary.own_init_files:
+            return []
+        return self.load().init_files
+
+
+# }}}
+
+
 class LookupPrj(LookupMulti):  # {{{
     TOML_KEYS_OTHER = ["top_entity", "x_tool_version", "x_device"]
     TOML_KEYS_OPT_VER = ["top_vhdl_file", "top_verilog_file", "top_x_bd_file"]
@@ -2835,6 +4156,11 @@ class LookupPrj(LookupMulti):  # {{{
         super().__init__(look_subs)
         self.f_obj_top = None
         self._compile_order = None
+        self._compile_order_graph: Optional[DependencyGraph] = None
+        self._compile_order_ids: List[int] = []  # the ids in _compile_order_graph of the compile order after the init files
+        self._compile_order_generation = -1
+        self._compile_order_waves: List[int] = []
+        self._compile_order_waves_for = None
 
     def set_top_lib(self, top_lib: Optional[str] = None):
         self._compile_order = None
@@ -2959,14 +4285,13 @@ class LookupPrj(LookupMulti):  # {{{
 
     def set_top_entity(self, name, do_not_replace_top_file=True):
         if do_not_replace_top_file and self.f_obj_top is not None:
-            f_obj = self.get_entity(name, f_obj_required_by=None)
+            f_obj = self.find_entity_required(name)
             if f_obj != self.f_obj_top:
                 assert isinstance(self.f_obj_top, FileObj)
                 raise RuntimeError(f"top entity specifed {name} but top file specifed {self.f_obj_top.loc}")
 
         else:
-            f_obj = self.get_entity(name, f_obj_required_by=None)
-            assert f_obj is not None
+            f_obj = self.find_entity_required(name)
             if isinstance(f_obj, FileObjVhdl):
                 log.info(f"top_entity {name} found in vhdl file {f_obj.loc}")
                 self.set_top_file(f_obj.loc, f_type=f_obj.f_type, lib=f_obj.lib, ver=f_obj.ver)
@@ -2977,67 +4302,436 @@ class LookupPrj(LookupMulti):  # {{{
     def has_top_file(self) -> bool:
         return self.f_obj_top is not None
 
+    def clear_top(self):
+        """Forget the top file and any state left behind by its compile order, so the next top starts clean"""
+        self.f_obj_top = None
+        self._compile_order = None
+        self._clear_inherited_libraries()
+
+    def _clear_inherited_libraries(self):
+        for f_obj in self.iter_file_objs():
+            f_obj.clear_inherited_library()
+
+    def set_top_f_obj(self, f_obj: FileObj):
+        """Make an already loaded file the top, clearing any state left from the previous top"""
+        if f_obj is not self.f_obj_top:
+            self.clear_top()
+            self.f_obj_top = f_obj
+
+    def get_affected_tops(self, changed_locs: List[Path], top_patterns: Optional[List[str]] = None) -> List[Tuple[Optional[str], FileObj]]:
+        """Returns the (entity name, file) of every top whose compile order includes a changed file.
+
+        The tops are the entities matching top_patterns, if None every file no other file depends on
+        (and the project top file) is treated as a top.
+        """
+        graph = self.get_dependency_graph()
+        changed_ids = []
+        for loc in changed_locs:
+            changed_ids += graph.ids_of_loc(loc)
+        # init files are compiled before every top but are not part of the dependency graph
+        init_locs = {f_obj.loc for f_obj in self.get_init_files()}
+        init_changed = any(resolve_abs_path(loc) in init_locs for loc in changed_locs)
+        affected = graph.reachable(changed_ids, reverse=True)
+
+        tops: List[Tuple[Optional[str], FileObj]] = []
+        if top_patterns is not None:
+            lib = self.top_lib if self.top_lib is not None else LIB_DEFAULT
+            for name in self.match_entity_names(top_patterns):
+                f_obj = self.resolve_entity(Name(lib, name))
+                if isinstance(f_obj, ResolveMiss) or f_obj is None:
+                    log.warning(f"top entity {name} not found")
+                    continue
+                tops.append((name, f_obj))
+        else:
+            for file_id, f_obj in enumerate(graph.f_objs):
+                if graph.rev_offsets[file_id] != graph.rev_offsets[file_id + 1] or graph.skip[file_id]:
+                    continue
+                if isinstance(f_obj, (FileObjDirect, FileObjVerilogInclude, FileObjOther)) or f_obj.loc in init_locs:
+                    continue
+                name = f_obj.entities[0].name if len(f_obj.entities) > 0 else None
+                tops.append((name, f_obj))
+            if isinstance(self.f_obj_top, FileObj) and all(f_obj is not self.f_obj_top for _, f_obj in tops):
+                tops.append((None, self.f_obj_top))
+
+        return [(name, f_obj) for name, f_obj in tops if init_changed or affected[graph.id_of(f_obj)]]
+
+    def match_entity_names(self, patterns: List[str]) -> List[str]:
+        """Expands entity names / glob patterns (e.g. '*_tb') into the matching entity names, in pattern order"""
+        names = sorted({name.name for name in self.iter_entity_names() if name.name is not None})
+        matched = []
+        for pattern in patterns:
+            pattern = pattern.lower()
+            if glob.has_magic(pattern):
+                found = fnmatch.filter(names, pattern)
+                if len(found) == 0:
+                    log.warning(f"no entities match top entity pattern {pattern}")
+            else:
+                found = [pattern]
+            for name in found:
+                if name not in matched:
+                    matched.append(name)
+        return matched
+
     @property
     def compile_order(self):
+        generation = self.get_generation()
+        if self._compile_order is not None and self._compile_order_generation != generation:
+            # dependencies have changed since the compile order was created
+            self._clear_inherited_libraries()
+            self._compile_order = None
         if self._compile_order is None:
             if self.f_obj_top is None:
                 raise Exception("top_file must be declared in config or on command line")
 
             assert isinstance(self.f_obj_top, FileObj)
-            self._compile_order = self.get_init_files() + self.f_obj_top.get_compile_order(self)
+            graph, order_ids = self.f_obj_top._get_compile_order(self)
+            self._compile_order = self.get_init_files() + [graph.f_objs[file_id] for file_id in order_ids.order]
+            self._compile_order_graph = graph
+            self._compile_order_ids = order_ids.order
+            # subs loaded while resolving change the generation but do not change the order
+            self._compile_order_generation = self.get_generation()
         return self._compile_order
 
+    @property
+    def compile_order_waves(self) -> List[int]:
+        """The wave of each file in the compile order. A file only depends on files in earlier waves,
+        so all the files in one wave can be compiled at the same time.
+        """
+        compile_order = self.compile_order
+        if self._compile_order_waves_for is not compile_order:
+            # init files have no known dependencies so they keep their order, one per wave
+            n_init = len(self.get_init_files())
+            waves = list(range(n_init))
+            assert self._compile_order_graph is not None
+            waves += self._compile_order_graph.waves(self._compile_order_ids, first_wave=n_init)
+            self._compile_order_waves = waves
+            self._compile_order_waves_for = compile_order
+        return self._compile_order_waves
+
+    @property
+    def critical_path_length(self) -> int:
+        """Number of waves, the longest chain of files that have to be compiled one after the other"""
+        waves = self.compile_order_waves
+        if len(waves) == 0:
+            return 0
+        return max(waves) + 1
+
+    @property
+    def compile_order_deps(self) -> List[List[int]]:
+        """For each file in the compile order the positions of the earlier files it has to be compiled after,
+        these are the dependencies compile_order_waves are built from.
+        """
+        self.compile_order  # makes sure _compile_order_graph and _compile_order_ids are current
+        assert self._compile_order_graph is not None
+        n_init = len(self.get_init_files())
+        deps = [[i - 1] if i > 0 else [] for i in range(n_init)]
+        after_init = [n_init - 1] if n_init > 0 else []
+        for file_deps in self._compile_order_graph.order_deps(self._compile_order_ids):
+            deps.append(after_init + [n_init + j for j in file_deps])
+        return deps
+
+    BUILD_TOOL_CMDS: Dict[str, Dict[Tuple[FileObjType, Optional[str]], str]] = {
+        "ghdl": {(FileObjType.VHDL, None): "ghdl -a --std=08 --work={lib} {file}"},
+        "nvc": {(FileObjType.VHDL, None): "nvc --std=2008 --work={lib} -a {file}"},
+        "vcom": {
+            (FileObjType.VHDL, None): "vcom -2008 -work {lib} {file}",
+            (FileObjType.VERILOG, None): "vlog -work {lib} {file}",
+        },
+    }
+    # tools that corrupt a library when several files are analysed into it at the same time
+    BUILD_TOOLS_SERIAL_LIBS = {"ghdl", "vcom"}
+
+    def get_build_steps(self, build_cmds: Dict[Tuple[FileObjType, Optional[str]], str], stamp_dir: Path) -> List["BuildStep"]:
+        """One build step per file in the compile order. Each step creates a stamp file and depends on the file,
+        its include headers and direct dependencies, and the stamps of the files it has to be compiled after.
+        build_cmds maps (file type, library) to a command template, a library of None matches any library.
+        """
+        import shlex
+
+        compile_order = self.compile_order
+        graph = self._compile_order_graph
+        assert graph is not None
+        steps: List[BuildStep] = []
+        for f_obj, file_deps in zip(compile_order, self.compile_order_deps):
+            lib = LIB_DEFAULT if f_obj.lib is None else f_obj.lib
+            key = hashlib.sha1(f"{f_obj.loc}:{f_obj.ver_tag}".encode()).hexdigest()[:8]
+            stamp = stamp_dir / lib / f"{f_obj.loc.name}.{key}.stamp"
+            inputs = [f_obj.loc]
+            if f_obj in graph.f_obj_2_id:
+                inputs += [graph.f_objs[dep_id].loc for dep_id, kind in graph.deps(graph.id_of(f_obj)) if kind == EdgeKind.INCLUDE]
+            inputs += [ddep_loc for ddep_loc in f_obj.direct_deps]
+            cmd_template = build_cmds.get((f_obj.f_type, lib), build_cmds.get((f_obj.f_type, None)))
+            cmd = None
+            if cmd_template is not None:
+                cmd = cmd_template.format(
+                    file=shlex.quote(str(f_obj.loc)),
+                    lib=lib,
+                    ver_tag="" if f_obj.ver_tag is None else f_obj.ver_tag,
+                    stamp=shlex.quote(str(stamp)),
+                )
+            steps.append(BuildStep(f_obj, stamp, list(dict.fromkeys(inputs)), [steps[j].stamp for j in file_deps], cmd))
+        return steps
+
+    def format_build_makefile(self, build_cmds: Dict[Tuple[FileObjType, Optional[str]], str], stamp_dir: Path, serial_libs: bool = False) -> str:
+        """Makefile with a stamp target per file in the compile order, so make -j compiles independent files in parallel.
+        With serial_libs the files of a library are compiled one at a time, in compile order
+        """
+        steps = self.get_build_steps(build_cmds, stamp_dir)
+        lines = ["# Generated by hdldepends, one stamp per file in the compile order\n", ".PHONY: all\n"]
+        lines.append(format_depfile([Path("all")], [step.stamp for step in steps]))
+        prev_stamps: Dict[str, Path] = {}  # last compiled stamp of each library
+        for step in steps:
+            lines.append("\n")
+            lines.append(format_depfile([step.stamp], step.inputs + step.dep_stamps))
+            if serial_libs and step.cmd is not None:
+                lib = LIB_DEFAULT if step.f_obj.lib is None else step.f_obj.lib
+                if lib in prev_stamps:
+                    # order only, so it does not make the file compile again when the previous one did
+                    lines.append(f"{depfile_escape(step.stamp)}: | {depfile_escape(prev_stamps[lib])}\n")
+                prev_stamps[lib] = step.stamp
+            lines.append("\t@mkdir -p $(@D)\n")
+            if step.cmd is not None:
+                lines.append(f"\t{step.cmd.replace('$', '$$')}\n")
+            lines.append("\t@touch $@\n")
+        return "".join(lines)
+
+    def format_build_ninja(self, build_cmds: Dict[Tuple[FileObjType, Optional[str]], str], stamp_dir: Path, serial_libs: bool = False) -> str:
+        """build.ninja with a stamp per file in the compile order, see format_build_makefile.
+        With serial_libs each library has a pool of depth 1 its files are compiled in
+        """
+
+        def esc(loc: Path) -> str:
+            return str(loc).replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+        def pool(step: BuildStep) -> str:
+            lib = LIB_DEFAULT if step.f_obj.lib is None else step.f_obj.lib
+            return "hdl_lib_" + re.sub(r"[^A-Za-z0-9_]", "_", lib)
+
+        steps = self.get_build_steps(build_cmds, stamp_dir)
+        lines = [
+            "# Generated by hdldepends, one stamp per file in the compile order\n",
+            "rule hdl_compile\n  command = $cmd && touch $out\n  description = $desc\n",
+            "rule hdl_stamp\n  command = touch $out\n  description = $desc\n",
+        ]
+        if serial_libs:
+            for name in dict.fromkeys(pool(step) for step in steps if step.cmd is not None):
+                lines.append(f"pool {name}\n  depth = 1\n")
+        for step in steps:
+            implicit = [esc(loc) for loc in step.inputs[1:] + step.dep_stamps]
+            rule = "hdl_stamp" if step.cmd is None else "hdl_compile"
+            build = f"\nbuild {esc(step.stamp)}: {rule} {esc(step.inputs[0])}"
+            if len(implicit) != 0:
+                build += " | " + " ".join(implicit)
+            lines.append(build + "\n")
+            if step.cmd is not None:
+                lines.append(f"  cmd = {step.cmd.replace('$', '$$')}\n")
+                if serial_libs:
+                    lines.append(f"  pool = {pool(step)}\n")
+            lines.append(f"  desc = {step.f_obj.file_type_str} {step.f_obj.lib} {step.f_obj.loc.name}\n")
+        lines.append("\nbuild all: phony " + " ".join(esc(step.stamp) for step in steps) + "\n")
+        lines.append("default all\n")
+        return "".join(lines)
+
     def print_compile_order(self):
         print("compile order:")
         for f_obj in self.compile_order:
             assert isinstance(f_obj.level, int)
             print(f'  {f_obj.file_type_str_w_ver_tag+":":14} {"|---"*f_obj.level}{f_obj.lib}: {f_obj.loc}')
 
-    def write_compile_order(self, compile_order_loc: Path, f_type: Optional[FileObjType] = None):
-        with open(compile_order_loc, "w") as f_order:
-            for f_obj in self.compile_order:
-                if f_type is not None:
-                    if f_obj.f_type != f_type:
-                        continue
-                    f_order.write(f"{f_obj.lib} {f_obj.loc}\n")
-                else:
-                    f_order.write(f"{f_obj.file_type_str_w_ver_tag} {f_obj.lib} {f_obj.loc}\n")
-
-    def write_compile_order_lib(self, compile_order_loc: Path, lib: Optional[str], f_type: Optional[FileObjType] = None):
-        log.debug(f"write_compile_order_lib({compile_order_loc=}, {lib=}, {f_type=}")
-        lines = 0
-        with open(compile_order_loc, "w") as f_order:
-            for f_obj in self.compile_order:
-                if f_type is not None:
-                    if f_obj.f_type != f_type:
-                        continue
-                if (lib is None) or (f_obj.lib is None and lib == LIB_DEFAULT) or (f_obj.lib == lib):
-                    f_order.write(f"{f_obj.loc}\n")
-                    lines += 1
-        if lines == 0:
-            log.warning(f"not files found for libarary {lib}")
-
-    def write_compile_order_json(self, output_loc: Path):
-        """Write complete project compile order to JSON file including both compile order and external files.
-        Args:
-            output_loc: Path to the output JSON file
+    def format_compile_order(self, f_type: Optional[FileObjType] = None, compile_order: Optional[List[FileObj]] = None) -> str:
+        emitter = OutputEmitter(self, compile_order)
+        out = emitter.add_compile_order(None, f_type)
+        emitter.run()
+        return out.text
+
+    def format_compile_order_lib(self, lib: Optional[str], f_type: Optional[FileObjType] = None) -> str:
+        emitter = OutputEmitter(self)
+        out = emitter.add_compile_order_lib(None, lib, f_type)
+        emitter.run()
+        return out.text
+
+    def format_compile_order_waves(self, lib: Optional[str] = None, f_type: Optional[FileObjType] = None) -> str:
+        """Compile order with the wave of each file at the start of the line. Without lib each line
+        also has the file type and library (like format_compile_order), with lib only files of that library are listed.
         """
-        files_list = []
-        seen_external_files = set()  # Track files to deduplicate
+        emitter = OutputEmitter(self)
+        out = emitter.add_compile_order_waves(None, lib, f_type)
+        emitter.run()
+        return out.text
 
-        # Add external files first (same logic as write_ext_file_list)
-        tag_2_ext = self.get_tag_2_ext_file()
-        for ver_tag, ext_l in tag_2_ext.items():
-            for ext_file in ext_l:
-                ext_file_abs = resolve_abs_path(ext_file)
-                if ext_file_abs in seen_external_files:
-                    continue
-                seen_external_files.add(ext_file_abs)
+    RECOMPILE_MANIFEST_VERSION = 2
 
-                # Determine file type from extension
-                file_ext = Path(ext_file).suffix.upper().lstrip(".")
-                if not file_ext:
-                    file_ext = "UNKNOWN"
+    @staticmethod
+    def load_recompile_manifest(manifest_loc: Path) -> Optional[dict]:
+        """The manifest written by the previous run, None if there is no usable manifest"""
+        import json
+
+        try:
+            with open(manifest_loc, "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            log.warning(f"could not read recompile manifest {manifest_loc}, everything will be recompiled")
+            return None
+        if manifest.get("version") != LookupPrj.RECOMPILE_MANIFEST_VERSION:
+            log.info(f"recompile manifest {manifest_loc} is from a different version, everything will be recompiled")
+            return None
+        return manifest
+
+    def _compile_order_file_states(self, manifest: Optional[dict]) -> Dict[Path, dict]:
+        """Manifest entry of each file in the compile order, the hash is reused if the file's size and modification time have not changed"""
+        old_files = {}
+        if manifest is not None:
+            old_files = {Path(entry["path"]): entry for entry in manifest["files"]}
+        states: Dict[Path, dict] = {}
+        for f_obj in self.compile_order:
+            if f_obj.loc in states:
+                continue
+            entry = {"path": str(f_obj.loc), "type": f_obj.file_type_str_w_ver_tag, "library": f_obj.lib, "units": f_obj.interface_fingerprints}
+            try:
+                stat = f_obj.loc.stat()
+            except FileNotFoundError:
+                entry["sha256"] = None
+                states[f_obj.loc] = entry
+                continue
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+            old = old_files.get(f_obj.loc)
+            if old is not None and old.get("size") == entry["size"] and old.get("mtime") == entry["mtime"]:
+                entry["sha256"] = old["sha256"]
+            else:
+                entry["sha256"] = file_sha256(f_obj.loc)
+            states[f_obj.loc] = entry
+        return states
+
+    def get_recompile_order(self, manifest: Optional[dict]) -> Tuple[List[FileObj], dict]:
+        """Files that need compiling again since the manifest was written, in compile order.
+
+        A file is compiled again if it changed (content, type or library) or is new, or if the interface
+        (entity/package declaration or module header) of a design unit it uses from another file changed.
+        Every unit of a file compiled again counts as changed for the files after it, for VHDL files that
+        changed too since analysing a primary unit again makes its users obsolete. So only edits to files
+        holding just architectures or package bodies (or Verilog edits outside the module headers) do not
+        cause the files using them to be compiled again. Files without interface fingerprints (e.g. XCI,
+        include files) change their interface on any edit.
+        Returns the files and the new manifest to save for the next run
+        """
+        states = self._compile_order_file_states(manifest)
+        new_manifest = {"version": LookupPrj.RECOMPILE_MANIFEST_VERSION, "files": list(states.values())}
+        if manifest is None:
+            return list(self.compile_order), new_manifest
+
+        old_files = {Path(entry["path"]): entry for entry in manifest["files"]}
+        changed_locs = set()
+        for loc, entry in states.items():
+            old = old_files.get(loc)
+            if old is None or any(old.get(key) != entry[key] for key in ["sha256", "type", "library"]):
+                changed_locs.add(loc)
+
+        n_init = len(self.get_init_files())
+        if any(f_obj.loc in changed_locs for f_obj in self.compile_order[:n_init]):
+            # everything is compiled after the init files
+            return list(self.compile_order), new_manifest
+
+        graph = self._compile_order_graph
+        assert graph is not None
+        all_units = None  # every unit of a file changed
+
+        def unit_names(units: Optional[Dict[str, Optional[str]]]) -> Optional[Set[str]]:
+            return all_units if units is None else {key.split(":", 1)[1] for key in units}
+
+        def changed_unit_names(f_obj: FileObj) -> Optional[Set[str]]:
+            old, new = old_files.get(f_obj.loc), states[f_obj.loc]
+            if old is None or old.get("type") != new["type"] or old.get("library") != new["library"]:
+                return all_units
+            old_units, new_units = old.get("units"), new["units"]
+            if old_units is None or new_units is None:
+                return all_units
+            # units without a fingerprint change whenever their file is compiled again
+            return {
+                key.split(":", 1)[1]
+                for key in set(old_units) | set(new_units)
+                if old_units.get(key) is None or new_units.get(key) is None or old_units.get(key) != new_units.get(key)
+            }
+
+        # the changed unit names of each file in compile order, files are only stale after the files they use
+        interface_changes: Dict[FileObj, Optional[Set[str]]] = {}
+        recompile = []
+        for f_obj in self.compile_order[n_init:]:
+            if f_obj in interface_changes:
+                continue
+            deps = graph.deps(graph.id_of(f_obj))
+            if f_obj.loc in changed_locs:
+                names = changed_unit_names(f_obj)
+                # a change to an included file can change anything in the file including it
+                if any(kind == EdgeKind.INCLUDE and graph.f_objs[dep].loc in changed_locs for dep, kind in deps):
+                    names = all_units
+                interface_changes[f_obj] = names
+                recompile.append(f_obj)
+                continue
+            stale = False
+            used_names = None
+            for dep, _ in deps:
+                names = interface_changes.get(graph.f_objs[dep], set())
+                if names is all_units:
+                    stale = True
+                    break
+                if len(names) > 0:
+                    if used_names is None:
+                        used_names = f_obj.consumed_unit_names()
+                    if not names.isdisjoint(used_names):
+                        stale = True
+                        break
+            if stale:
+                # compiling a file again can change what its units mean (e.g. constants computed from a changed one)
+                interface_changes[f_obj] = unit_names(states[f_obj.loc]["units"])
+                recompile.append(f_obj)
+            else:
+                interface_changes[f_obj] = set()
+        return recompile, new_manifest
+
+    def write_recompile_order(self, recompile_order_loc: Path, manifest_loc: Path):
+        """Write the files to compile again since the last run (in the --compile-order format) and update the manifest"""
+        import json
+
+        recompile, new_manifest = self.get_recompile_order(LookupPrj.load_recompile_manifest(manifest_loc))
+        log.info(f"{len(recompile)} of {len(self.compile_order)} files need compiling")
+        write_text_file(recompile_order_loc, self.format_compile_order(compile_order=recompile))
+        write_text_file(manifest_loc, json.dumps(new_manifest, indent=2))
+
+    def write_compile_order_json(self, output_loc: Path):
+        """Write complete project compile order to JSON file including both compile order and external files.
+        Args:
+            output_loc: Path to the output JSON file
+        """
+        write_text_file(output_loc, self.format_compile_order_json())
+
+    def format_compile_order_json(self) -> str:
+        """Complete project compile order as JSON, see write_compile_order_json"""
+        emitter = OutputEmitter(self)
+        out = emitter.add_compile_order_json(None)
+        emitter.run()
+        return out.text
+
+    def get_compile_order_json_external(self, xci_f_objs: List["FileObjXXci"]) -> List[dict]:
+        """The external files entries of the compile order JSON, the ext files then the coefficient files of xci_f_objs"""
+        files_list = []
+        seen_external_files = set()  # Track files to deduplicate
+
+        # Add external files first (same logic as format_ext_file_list)
+        tag_2_ext = self.get_tag_2_ext_file()
+        for ver_tag, ext_l in tag_2_ext.items():
+            for ext_file in ext_l:
+                ext_file_abs = resolve_abs_path(ext_file)
+                if ext_file_abs in seen_external_files:
+                    continue
+                seen_external_files.add(ext_file_abs)
+
+                # Determine file type from extension
+                file_ext = Path(ext_file).suffix.upper().lstrip(".")
+                if not file_ext:
+                    file_ext = "UNKNOWN"
 
                 ext_file_entry = {"type": "EXTERNAL", "file_ext": file_ext, "path": str(ext_file)}
                 if ver_tag is not None:
@@ -3045,52 +4739,933 @@ class LookupPrj(LookupMulti):  # {{{
                 files_list.append(ext_file_entry)
 
         # Add coefficient files from XCI files (extracted from direct_deps)
-        for f_obj in self.compile_order:
+        for f_obj in xci_f_objs:
+            for direct_dep in f_obj.direct_deps:
+                if isinstance(direct_dep, FileObjDirect):
+                    coef_file_abs = resolve_abs_path(direct_dep.loc)
+                    if coef_file_abs in seen_external_files:
+                        continue
+                    seen_external_files.add(coef_file_abs)
+
+                    # Determine file type from extension
+                    file_ext = direct_dep.loc.suffix.upper().lstrip(".")
+                    if not file_ext:
+                        file_ext = "UNKNOWN"
+
+                    coef_file_entry = {"type": "EXTERNAL", "file_ext": file_ext, "path": str(direct_dep.loc)}
+                    if direct_dep.ver_tag is not None:
+                        coef_file_entry["ver_tag"] = direct_dep.ver_tag
+                    files_list.append(coef_file_entry)
+        return files_list
+
+    def get_compile_order_json_entry(self, f_obj: FileObj, wave: int) -> dict:
+        """The entry of a compile order file in the compile order JSON"""
+        file_entry = {"type": f_obj.file_type_str, "path": str(f_obj.loc)}
+        if f_obj is self.f_obj_top:
+            file_entry["is_top"] = True
+        if f_obj.lib is not None:
+            file_entry["library"] = f_obj.lib
+        if f_obj.ver_tag is not None:
+            file_entry["ver_tag"] = f_obj.ver_tag
+        file_entry["wave"] = wave
+        return file_entry
+
+
+# }}}
+
+
+class BuildStep:
+    """A file of the compile order in a generated Makefile/build.ninja, see LookupPrj.get_build_steps"""
+
+    def __init__(self, f_obj: FileObj, stamp: Path, inputs: List[Path], dep_stamps: List[Path], cmd: Optional[str]):
+        self.f_obj = f_obj
+        self.stamp = stamp
+        self.inputs = inputs  # the file first, then its include headers and direct dependencies
+        self.dep_stamps = dep_stamps
+        self.cmd = cmd
+
+
+class OutputEmitter:  # {{{
+    """Builds several outputs in one pass over the data.
+    Outputs are registered with the add_* methods (each returns the output, its text is set by run()).
+    run() walks the compile order and the file list once each, handing every file to the outputs in the
+    bucket for its (type, library). write() then writes each output with a location, only if it changed.
+    """
+
+    ANY = object()  # bucket key matching any file type/library
+
+    class Output:
+        def __init__(self, loc: Optional[Path], line, empty_warning: Optional[str] = None):
+            self.loc = loc
+            self.line = line  # function (f_obj, wave) -> str
+            self.empty_warning = empty_warning
+            self.lines: List[str] = []
+            self.text: Optional[str] = None
+
+        def finish(self):
+            if len(self.lines) == 0 and self.empty_warning is not None:
+                log.warning(self.empty_warning)
+            self.text = "".join(self.lines)
+
+    class JsonOutput(Output):
+        """The compile order JSON, its file entries are made in the compile order pass (lines holds dicts)"""
+
+        def __init__(self, loc: Optional[Path], look: "LookupPrj"):
+            super().__init__(loc, self.entry)
+            self.look = look
+            self.xci_f_objs: List[FileObjXXci] = []
+
+        def entry(self, f_obj: "FileObj", wave: int) -> dict:
             if isinstance(f_obj, FileObjXXci):
-                for direct_dep in f_obj.direct_deps:
-                    if isinstance(direct_dep, FileObjDirect):
-                        coef_file_abs = resolve_abs_path(direct_dep.loc)
-                        if coef_file_abs in seen_external_files:
-                            continue
-                        seen_external_files.add(coef_file_abs)
-
-                        # Determine file type from extension
-                        file_ext = direct_dep.loc.suffix.upper().lstrip(".")
-                        if not file_ext:
-                            file_ext = "UNKNOWN"
-
-                        coef_file_entry = {"type": "EXTERNAL", "file_ext": file_ext, "path": str(direct_dep.loc)}
-                        if direct_dep.ver_tag is not None:
-                            coef_file_entry["ver_tag"] = direct_dep.ver_tag
-                        files_list.append(coef_file_entry)
-
-        # Add compile order files (same logic as write_compile_order)
-        for f_obj in self.compile_order:
-            file_entry = {"type": f_obj.file_type_str, "path": str(f_obj.loc)}
-            if f_obj is self.f_obj_top:
-                file_entry["is_top"] = True
-            if f_obj.lib is not None:
-                file_entry["library"] = f_obj.lib
-            if f_obj.ver_tag is not None:
-                file_entry["ver_tag"] = f_obj.ver_tag
-            files_list.append(file_entry)
+                self.xci_f_objs.append(f_obj)
+            return self.look.get_compile_order_json_entry(f_obj, wave)
+
+        def finish(self):
+            import json
+
+            files_list = self.look.get_compile_order_json_external(self.xci_f_objs) + self.lines
+            self.text = json.dumps({"files": files_list, "critical_path": self.look.critical_path_length}, indent=2)
+
+    def __init__(self, look: Lookup, compile_order: Optional[List["FileObj"]] = None):
+        self.look = look
+        self.compile_order = compile_order
+        self.order_buckets: Dict[Tuple[object, object], List[OutputEmitter.Output]] = {}
+        self.file_list_buckets: Dict[Tuple[object, object], List[OutputEmitter.Output]] = {}
+        self.need_waves = False
+        self.outputs: List[OutputEmitter.Output] = []
+        self.deferred: List[Tuple[OutputEmitter.Output, object]] = []  # outputs built by a function of the lookup
+
+    def _add(self, buckets, f_type: Optional[FileObjType], lib: object, out: "OutputEmitter.Output") -> "OutputEmitter.Output":
+        key = (OutputEmitter.ANY if f_type is None else f_type, lib)
+        buckets.setdefault(key, []).append(out)
+        self.outputs.append(out)
+        return out
+
+    def add_compile_order(self, loc: Optional[Path] = None, f_type: Optional[FileObjType] = None) -> "OutputEmitter.Output":
+        """Lines of "type lib loc", or "lib loc" when only files of f_type are listed"""
+        if f_type is None:
+            line = lambda f_obj, wave: f"{f_obj.file_type_str_w_ver_tag} {f_obj.lib} {f_obj.loc}\n"
+        else:
+            line = lambda f_obj, wave: f"{f_obj.lib} {f_obj.loc}\n"
+        return self._add(self.order_buckets, f_type, OutputEmitter.ANY, OutputEmitter.Output(loc, line))
+
+    def add_compile_order_lib(
+        self, loc: Optional[Path], lib: Optional[str], f_type: Optional[FileObjType] = None
+    ) -> "OutputEmitter.Output":
+        """Lines of the file locations only, for library lib (all libraries if None)"""
+        out = OutputEmitter.Output(loc, lambda f_obj, wave: f"{f_obj.loc}\n", f"not files found for libarary {lib}")
+        return self._add(self.order_buckets, f_type, OutputEmitter.ANY if lib is None else lib, out)
+
+    def add_compile_order_waves(
+        self, loc: Optional[Path] = None, lib: Optional[str] = None, f_type: Optional[FileObjType] = None
+    ) -> "OutputEmitter.Output":
+        """Compile order lines prefixed by the wave of each file, see LookupPrj.format_compile_order_waves"""
+        self.need_waves = True
+        if lib is None:
+            line = lambda f_obj, wave: f"{wave} {f_obj.file_type_str_w_ver_tag} {f_obj.lib} {f_obj.loc}\n"
+        else:
+            line = lambda f_obj, wave: f"{wave} {f_obj.loc}\n"
+        out = OutputEmitter.Output(loc, line, f"not files found for libarary {lib}")
+        return self._add(self.order_buckets, f_type, OutputEmitter.ANY if lib is None else lib, out)
+
+    def add_file_list(
+        self, loc: Optional[Path] = None, f_type: Optional[FileObjType] = None, lib: Optional[str] = None
+    ) -> "OutputEmitter.Output":
+        """Lines of "lib<tab>loc" for every file in the project, or only loc when lib is given"""
+        if lib is None:
+            out = OutputEmitter.Output(loc, lambda f_obj, wave: f"{f_obj.lib}\t{f_obj.loc}\n")
+            return self._add(self.file_list_buckets, f_type, OutputEmitter.ANY, out)
+        out = OutputEmitter.Output(loc, lambda f_obj, wave: f"{f_obj.loc}\n")
+        return self._add(self.file_list_buckets, f_type, lib, out)
+
+    def add_ext_file_list(self, loc: Optional[Path] = None, ver_tag: Optional[str] = None) -> "OutputEmitter.Output":
+        return self._add_deferred(loc, lambda look: look.format_ext_file_list(ver_tag))
+
+    def add_compile_order_json(self, loc: Optional[Path] = None) -> "OutputEmitter.Output":
+        """The compile order files with their waves after the external files, see LookupPrj.format_compile_order_json"""
+        self.need_waves = True
+        assert isinstance(self.look, LookupPrj)
+        out = OutputEmitter.JsonOutput(loc, self.look)
+        return self._add(self.order_buckets, None, OutputEmitter.ANY, out)
+
+    def add_build_makefile(self, loc: Optional[Path], build_cmds, stamp_dir: Path, serial_libs: bool = False) -> "OutputEmitter.Output":
+        return self._add_deferred(loc, lambda look: look.format_build_makefile(build_cmds, stamp_dir, serial_libs))
+
+    def add_build_ninja(self, loc: Optional[Path], build_cmds, stamp_dir: Path, serial_libs: bool = False) -> "OutputEmitter.Output":
+        return self._add_deferred(loc, lambda look: look.format_build_ninja(build_cmds, stamp_dir, serial_libs))
+
+    def _add_deferred(self, loc: Optional[Path], build) -> "OutputEmitter.Output":
+        out = OutputEmitter.Output(loc, None)
+        self.outputs.append(out)
+        self.deferred.append((out, build))
+        return out
+
+    @staticmethod
+    def _dispatch(buckets, f_obj: "FileObj", lib: object, wave: Optional[int]):
+        for f_type in {OutputEmitter.ANY, f_obj.f_type}:
+            for key_lib in (OutputEmitter.ANY, lib):
+                for out in buckets.get((f_type, key_lib), ()):
+                    out.lines.append(out.line(f_obj, wave))
+
+    def run(self):
+        """Fill in the text of every registered output"""
+        if len(self.order_buckets) != 0:
+            look = self.look
+            assert isinstance(look, LookupPrj)
+            compile_order = look.compile_order if self.compile_order is None else self.compile_order
+            waves = look.compile_order_waves if self.need_waves else [None] * len(compile_order)
+            for f_obj, wave in zip(compile_order, waves):
+                # compile order outputs treat files without a library as being in the default library
+                self._dispatch(self.order_buckets, f_obj, LIB_DEFAULT if f_obj.lib is None else f_obj.lib, wave)
+        if len(self.file_list_buckets) != 0:
+            for f_obj in self.look.get_file_list():
+                self._dispatch(self.file_list_buckets, f_obj, f_obj.lib, None)
+        for out, build in self.deferred:
+            out.lines = [build(self.look)]
+        for out in self.outputs:
+            out.finish()
+
+    def write(self) -> int:
+        """Run and write every output with a location whose content has changed. Returns the number written"""
+        self.run()
+        written = 0
+        for out in self.outputs:
+            if out.loc is not None:
+                assert out.text is not None
+                if write_text_file(out.loc, out.text):
+                    written += 1
+        log.debug(f"wrote {written} of {len(self.outputs)} outputs")
+        return written
+
+
+# }}}
+
+
+@dataclass
+class CompileOrderIds:
+    """A compile order walked on a DependencyGraph, see DependencyGraph.compile_order_ids"""
+
+    order: List[int]  # the file ids in compile order
+    levels: List[int]  # the level in the hierarchy of each file of order
+    reached: List[int]  # the files walked (those not skipped from the order), in the order they were reached
+    cycles: List[List[int]]  # the dependency cycles found
+
+
+class DependencyGraph:  # {{{
+    """Explicit dependency graph of every file in a loaded lookup.
+
+    Files are given integer ids (f_objs[file_id]). The edges are stored in CSR form, the
+    dependencies of file i are fwd_targets[fwd_offsets[i]:fwd_offsets[i + 1]] with the
+    edge kinds in the same slice of fwd_kinds. rev_* holds the same edges reversed.
+    Compile order, reachability and levelization all work on these arrays.
+    """
+
+    EDGE_KINDS = list(EdgeKind)
+
+    def __init__(self, roots: Optional[List[FileObj]] = None):
+        self.generation = -1
+        self.roots = roots  # the files the graph was built from, None if it has every file of the lookup
+        self.f_objs: List[FileObj] = []
+        self.f_obj_2_id: Dict[FileObj, int] = {}
+        self.skip = bytearray()
+        self.resolved: List[Optional[ResolvedDeps]] = []
+        self.fwd_offsets = array("l", [0])
+        self.fwd_targets = array("l")
+        self.fwd_kinds = array("b")
+        self.rev_offsets = array("l", [0])
+        self.rev_targets = array("l")
+        self.rev_kinds = array("b")
+        self._loc_2_ids: Optional[Dict[Path, List[int]]] = None
+
+    def __len__(self):
+        return len(self.f_objs)
+
+    def _add_node(self, f_obj: FileObj) -> int:
+        file_id = self.f_obj_2_id.get(f_obj)
+        if file_id is None:
+            file_id = len(self.f_objs)
+            self.f_obj_2_id[f_obj] = file_id
+            self.f_objs.append(f_obj)
+        return file_id
+
+    @staticmethod
+    def build(look: Lookup, roots: Optional[List[FileObj]] = None) -> "DependencyGraph":
+        """The graph of every file in look, or with roots of the files they reach"""
+        # the objects made while building are all kept, collecting garbage meanwhile only walks the project again and again
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return DependencyGraph._build(look, roots)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    @staticmethod
+    def _build(look: Lookup, roots: Optional[List[FileObj]]) -> "DependencyGraph":
+        graph = DependencyGraph(roots)
+        f_objs = graph.f_objs
+        f_obj_2_id = graph.f_obj_2_id
+        for f_obj in look.iter_file_objs() if roots is None else roots:
+            if f_obj not in f_obj_2_id:
+                f_obj_2_id[f_obj] = len(f_objs)
+                f_objs.append(f_obj)
+
+        kind_2_idx = {kind: idx for idx, kind in enumerate(DependencyGraph.EDGE_KINDS)}
+        direct_idx = kind_2_idx[EdgeKind.DIRECT]
+        resolve_file_deps = look.resolve_file_deps
+        fwd_offsets = [0]
+        fwd_targets: List[int] = []
+        fwd_kinds: List[int] = []
+        file_id = 0
+        # nodes found while resolving are appended so len(f_objs) can grow in the loop
+        while file_id < len(f_objs):
+            f_obj = f_objs[file_id]
+            resolved = resolve_file_deps(f_obj)
+            graph.resolved.append(resolved)
+            for dep, kind in zip(resolved.f_objs, resolved.kinds):
+                dep_id = f_obj_2_id.get(dep)
+                if dep_id is None:
+                    dep_id = graph._add_node(dep)
+                fwd_targets.append(dep_id)
+                fwd_kinds.append(kind_2_idx[kind])
+            for ddep_loc in f_obj.direct_deps:
+                ddep = look.loc_to_file_obj(ddep_loc)
+                if isinstance(ddep, FileObj):
+                    fwd_targets.append(graph._add_node(ddep))
+                    fwd_kinds.append(direct_idx)
+            fwd_offsets.append(len(fwd_targets))
+            file_id += 1
+        # after resolving, which loads the lazily loaded subs that are needed
+        graph.generation = look.get_generation()
+        skip_locs = look.get_skip_locs()
+        graph.skip = bytearray(f_obj.loc in skip_locs for f_obj in f_objs)
+        graph.fwd_offsets = array("l", fwd_offsets)
+        graph.fwd_targets = array("l", fwd_targets)
+        graph.fwd_kinds = array("b", fwd_kinds)
+
+        # reverse edges by counting sort on the target id
+        n = len(f_objs)
+        counts = [0] * (n + 1)
+        for target in fwd_targets:
+            counts[target + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        graph.rev_offsets = array("l", counts)
+        fill = counts[:n]
+        rev_targets = [0] * len(fwd_targets)
+        rev_kinds = [0] * len(fwd_targets)
+        for source in range(n):
+            for edge in range(fwd_offsets[source], fwd_offsets[source + 1]):
+                target = fwd_targets[edge]
+                rev_targets[fill[target]] = source
+                rev_kinds[fill[target]] = fwd_kinds[edge]
+                fill[target] += 1
+        graph.rev_targets = array("l", rev_targets)
+        graph.rev_kinds = array("b", rev_kinds)
+        return graph
+
+    def id_of(self, f_obj: FileObj) -> int:
+        return self.f_obj_2_id[f_obj]
+
+    def ids_of_loc(self, loc: Path) -> List[int]:
+        """All file ids for a location (a location can hold several versions of a file)"""
+        if self._loc_2_ids is None:
+            self._loc_2_ids = {}
+            for file_id, f_obj in enumerate(self.f_objs):
+                self._loc_2_ids.setdefault(f_obj.loc, []).append(file_id)
+        return self._loc_2_ids.get(resolve_abs_path(loc), [])
+
+    def deps(self, file_id: int) -> List[Tuple[int, EdgeKind]]:
+        start, end = self.fwd_offsets[file_id], self.fwd_offsets[file_id + 1]
+        return [(self.fwd_targets[e], DependencyGraph.EDGE_KINDS[self.fwd_kinds[e]]) for e in range(start, end)]
+
+    def rdeps(self, file_id: int) -> List[Tuple[int, EdgeKind]]:
+        start, end = self.rev_offsets[file_id], self.rev_offsets[file_id + 1]
+        return [(self.rev_targets[e], DependencyGraph.EDGE_KINDS[self.rev_kinds[e]]) for e in range(start, end)]
+
+    def reachable(self, file_ids, reverse: bool = False) -> bytearray:
+        """Flags every file reachable from file_ids following the dependencies, or the dependents if reverse.
+        With reverse these are the files whose compile order includes one of file_ids.
+
+        Files skipped from the compile order are not flagged and are not walked through,
+        as they never reach a compile order.
+        """
+        offsets, targets = (self.rev_offsets, self.rev_targets) if reverse else (self.fwd_offsets, self.fwd_targets)
+        skip = self.skip
+        seen = bytearray(len(self.f_objs))
+        todo = []
+        for file_id in file_ids:
+            if not seen[file_id] and not skip[file_id]:
+                seen[file_id] = 1
+                todo.append(file_id)
+        while todo:
+            file_id = todo.pop()
+            for e in range(offsets[file_id], offsets[file_id + 1]):
+                target = targets[e]
+                if not seen[target] and not skip[target]:
+                    seen[target] = 1
+                    todo.append(target)
+        return seen
+
+    def compile_order_ids(self, top_id: int) -> "CompileOrderIds":
+        """Compile order of top_id, a file is placed after all of its dependencies (and its direct dependencies).
+
+        Files are only visited once, a dependency on a file which is still being visited is a cycle. Cycles are found
+        with Tarjan's strongly connected components algorithm run alongside the search. Direct dependencies are not
+        walked, they are placed before the file using them (once per user). Files skipped from the order are visited
+        but not placed.
+        """
+        direct_idx = DependencyGraph.EDGE_KINDS.index(EdgeKind.DIRECT)
+        offsets, targets, kinds, skip = self.fwd_offsets, self.fwd_targets, self.fwd_kinds, self.skip
+        n = len(self.f_objs)
+        result = CompileOrderIds([], [], [], [])
+        order, levels, reached = result.order, result.levels, result.reached
+        visited = bytearray(n)
+
+        # Tarjan state
+        index = [0] * n
+        lowlink = [0] * n
+        scc_stack: List[int] = []
+        on_scc_stack = bytearray(n)
+
+        # each frame is [file_id, level, next_edge]
+        stack: List[list] = []
+
+        def enter(file_id: int, level: int):
+            visited[file_id] = 1
+            if skip[file_id]:
+                return
+            index[file_id] = lowlink[file_id] = len(reached)
+            reached.append(file_id)
+            scc_stack.append(file_id)
+            on_scc_stack[file_id] = 1
+            stack.append([file_id, level, offsets[file_id]])
+
+        enter(top_id, 0)
+        while stack:
+            frame = stack[-1]
+            file_id, level, edge = frame
+            end = offsets[file_id + 1]
+            while edge < end:
+                target = targets[edge]
+                edge += 1
+                if kinds[edge - 1] == direct_idx or target == file_id:
+                    continue  # a file using a package it declares is not a cycle
+                if not visited[target]:
+                    frame[2] = edge
+                    enter(target, level + 1)
+                    if stack[-1] is not frame:
+                        break
+                elif on_scc_stack[target] and index[target] < lowlink[file_id]:
+                    lowlink[file_id] = index[target]
+            else:
+                stack.pop()
+                for e in range(offsets[file_id], end):
+                    if kinds[e] == direct_idx:
+                        order.append(targets[e])
+                        levels.append(level + 1)
+                order.append(file_id)
+                levels.append(level)
+
+                if stack:
+                    parent = stack[-1][0]
+                    if lowlink[file_id] < lowlink[parent]:
+                        lowlink[parent] = lowlink[file_id]
+                if lowlink[file_id] == index[file_id]:
+                    scc = []
+                    while True:
+                        member = scc_stack.pop()
+                        on_scc_stack[member] = 0
+                        scc.append(member)
+                        if member == file_id:
+                            break
+                    if len(scc) > 1:
+                        result.cycles.append(scc)
+        return result
+
+    def waves(self, order_ids: List[int], first_wave: int = 0) -> List[int]:
+        """Levelize a compile order, the wave of each file is one more than the latest wave of the
+        files it depends on earlier in the order (dependencies later in the order are part of a cycle and ignored).
+        """
+        waves: List[int] = []
+        for file_deps in self.order_deps(order_ids):
+            wave = first_wave
+            for j in file_deps:
+                if waves[j] >= wave:
+                    wave = waves[j] + 1
+            waves.append(wave)
+        return waves
+
+    def order_deps(self, order_ids: List[int]) -> List[List[int]]:
+        """For each file of a compile order the positions of the files earlier in the order it depends on
+        (dependencies later in the order are part of a cycle and ignored).
+        """
+        offsets, targets = self.fwd_offsets, self.fwd_targets
+        deps: List[List[int]] = []
+        pos: Dict[int, int] = {}
+        for i, file_id in enumerate(order_ids):
+            file_deps = []
+            for e in range(offsets[file_id], offsets[file_id + 1]):
+                j = pos.get(targets[e])
+                if j is not None and j not in file_deps:
+                    file_deps.append(j)
+            deps.append(file_deps)
+            pos[file_id] = i
+        return deps
+
+
+# }}}
+
+
+# On disk index {{{
+class ProjectIndex:
+    """SQLite index of a loaded project, next to the (first) configuration file as .<config>.index.sqlite
+
+    It holds the files, the design units they declare, the names they depend on and the resolved dependencies
+    between files, so tools can answer "which file declares entity X" or list the files of a library by reading
+    only the rows they need, without loading the pickle caches. Files have the ids of the DependencyGraph.
+    The inputs table has the state (see get_input_state) of every config input and of the cache files (pickles,
+    journals and snapshot) to check it is current. Every run that loads the project checks the source files and
+    updates the caches, so the sources table (the state of each source file) is only checked when asked to, or
+    when a config had no pickle cache.
+    """
+
+    VERSION = HDL_DEPENDS_VERSION_NUM
+    SCHEMA = """
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE configs (id INTEGER PRIMARY KEY, path TEXT NOT NULL);
+        CREATE TABLE inputs (path TEXT PRIMARY KEY, state TEXT);
+        CREATE TABLE sources (path TEXT PRIMARY KEY, state TEXT);
+        CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL, file_type TEXT NOT NULL, lib TEXT, ver TEXT, config_id INTEGER, skip INTEGER NOT NULL);
+        CREATE TABLE units (kind TEXT NOT NULL, lib TEXT, name TEXT NOT NULL, file_id INTEGER NOT NULL);
+        CREATE TABLE name_deps (file_id INTEGER NOT NULL, kind TEXT NOT NULL, lib TEXT, name TEXT NOT NULL);
+        CREATE TABLE file_deps (file_id INTEGER NOT NULL, dep_id INTEGER NOT NULL, kind TEXT NOT NULL);
+        CREATE INDEX files_path ON files (path);
+        CREATE INDEX files_lib ON files (lib, file_type);
+        CREATE INDEX units_name ON units (name, kind);
+        CREATE INDEX name_deps_name ON name_deps (name, kind);
+        CREATE INDEX file_deps_file ON file_deps (file_id);
+        CREATE INDEX file_deps_dep ON file_deps (dep_id);
+    """
+
+    def __init__(self, loc: Path):
+        self.loc = loc
+        self._connection = None
+
+    @staticmethod
+    def toml_loc_to_index_loc(toml_loc: Path) -> Path:
+        return toml_loc.with_name("." + toml_loc.stem + ".index.sqlite")
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            import sqlite3
+
+            self._connection = sqlite3.connect(self.loc)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def get_meta(self) -> Dict[str, str]:
+        try:
+            return dict(self.connection.execute("SELECT key, value FROM meta"))
+        except Exception:
+            return {}
+
+    @staticmethod
+    def options_meta(top_lib: Optional[str], x_tool_version: Optional[str], x_device: Optional[str]) -> Dict[str, str]:
+        """The options the project was loaded with (not the values from the configs, those are inputs)"""
+        return {"top_lib": top_lib or "", "x_tool_version": x_tool_version or "", "x_device": x_device or ""}
+
+    @staticmethod
+    def cache_state(loc: Path) -> Optional[str]:
+        """State of a cache file, None if it is missing. Any write of the file changes it"""
+        try:
+            size, mtime_ns = LookupSingular.pickle_identity(loc)
+        except FileNotFoundError:
+            return None
+        return f"cache:{size}:{mtime_ns}"
+
+    def is_current(
+        self, top_lib: Optional[str] = None, x_tool_version: Optional[str] = None, x_device: Optional[str] = None, check_sources: bool = False
+    ) -> bool:
+        """True if the index was written by this version, with the same options, and no input changed. The source
+        files are only checked with check_sources (or if a config had no pickle cache), an edit is otherwise seen
+        once a run has loaded the project again
+        """
+        if not self.loc.is_file():
+            return False
+        meta = self.get_meta()
+        if meta.get("version") != str(ProjectIndex.VERSION) or meta.get("cached") not in ["0", "1"]:
+            return False
+        for key, value in ProjectIndex.options_meta(top_lib, x_tool_version, x_device).items():
+            if meta.get(key) != value:
+                return False
+        return len(self.changed_inputs(check_sources or meta["cached"] == "0")) == 0
+
+    def changed_inputs(self, check_sources: bool = True) -> List[Path]:
+        """The config inputs, cache files and (with check_sources) source files that changed (or were removed) since
+        the index was written
+        """
+        changed = []
+        rows = list(self.connection.execute("SELECT path, state FROM inputs"))
+        if check_sources:
+            rows += self.connection.execute("SELECT path, state FROM sources")
+        for path, state in rows:
+            if state is not None and state.startswith("cache:"):
+                if ProjectIndex.cache_state(Path(path)) != state:
+                    changed.append(Path(path))
+                continue
+            content = state is not None and state.startswith("sha1:")
+            if get_input_state(path, content) != state:
+                changed.append(Path(path))
+        return changed
 
-        # Create the final JSON structure
-        project_compile_order_json = {"files": files_list}
+    def write(
+        self,
+        look: "LookupPrj",
+        top_lib: Optional[str] = None,
+        x_tool_version: Optional[str] = None,
+        x_device: Optional[str] = None,
+        snapshot_loc: Optional[Path] = None,
+    ):
+        """Write the index of the project loaded with these options (loads every sub and resolves every file)"""
+        graph = look.get_dependency_graph()
+        configs: List[Path] = []
+        inputs: Dict[Path, Optional[str]] = {}
+        sources: Dict[Path, Optional[str]] = {}
+        cached = True  # every config has a pickle cache, which a run updates when a source file changes
+        f_obj_2_config: Dict[int, int] = {}
+        seen: Set[int] = set()
+        for sub in look.iter_lookups():
+            if id(sub) in seen:
+                continue
+            seen.add(id(sub))
+            if sub.toml_loc is not None:
+                configs.append(resolve_abs_path(sub.toml_loc))
+                pickle_loc = LookupSingular.toml_loc_to_pickle_loc(sub.toml_loc)
+                for loc in [pickle_loc, LookupSingular.pickle_loc_to_journal_loc(pickle_loc)]:
+                    inputs[resolve_abs_path(loc)] = ProjectIndex.cache_state(loc)
+                cached = cached and inputs[resolve_abs_path(pickle_loc)] is not None
+            files, dirs = sub.get_config_input_locs()
+            inputs.update(get_input_states(files + dirs, content=True))
+            for f_obj in LookupSingular.iter_file_objs(sub):
+                f_obj_2_config.setdefault(id(f_obj), len(configs) if sub.toml_loc is not None else None)
+
+        files_rows = []
+        units_rows = []
+        name_deps_rows = []
+        file_deps_rows = []
+        if snapshot_loc is not None:
+            inputs[resolve_abs_path(snapshot_loc)] = ProjectIndex.cache_state(snapshot_loc)
+        for file_id, f_obj in enumerate(graph.f_objs):
+            if f_obj.loc not in inputs and f_obj.loc not in sources:
+                sources[f_obj.loc] = get_input_state(f_obj.loc)
+            files_rows.append((file_id, str(f_obj.loc), f_obj.file_type_str, f_obj.lib, f_obj.ver, f_obj_2_config.get(id(f_obj)), graph.skip[file_id]))
+            for name in f_obj.entities:
+                units_rows.append(("entity", name.lib, name.name, file_id))
+            for name in getattr(f_obj, "vhdl_packages", []):
+                units_rows.append(("package", name.lib, name.name, file_id))
+            for name in getattr(f_obj, "verilog_package", []):
+                units_rows.append(("package", name.lib, name.name, file_id))
+            for name in f_obj.entity_deps:
+                name_deps_rows.append((file_id, "entity", name.lib, name.name))
+            for name in getattr(f_obj, "vhdl_package_deps", []) + getattr(f_obj, "verilog_package_deps", []):
+                name_deps_rows.append((file_id, "package", name.lib, name.name))
+            for component in getattr(f_obj, "vhdl_component_deps", []):
+                name_deps_rows.append((file_id, "component", f_obj.lib, component.lower()))
+            for dep_id, kind in graph.deps(file_id):
+                file_deps_rows.append((file_id, dep_id, kind.name.lower()))
+
+        inputs_rows = [(str(loc), state) for loc, state in inputs.items()]
+        sources_rows = [(str(loc), state) for loc, state in sources.items()]
+        meta = {"version": str(ProjectIndex.VERSION), "cached": "1" if cached else "0", **ProjectIndex.options_meta(top_lib, x_tool_version, x_device)}
+
+        # written to a new database which replaces the old one, so readers never see a half written index
+        import sqlite3
+
+        self.close()
+        temp_loc = self.loc.with_name(self.loc.name + ".tmp")
+        if temp_loc.exists():
+            temp_loc.unlink()
+        log.info(f"writing index {self.loc}")
+        connection = sqlite3.connect(temp_loc)
+        try:
+            connection.executescript(ProjectIndex.SCHEMA)
+            connection.executemany("INSERT INTO meta VALUES (?, ?)", [(key, str(value)) for key, value in meta.items()])
+            connection.executemany("INSERT INTO configs VALUES (?, ?)", [(config_id + 1, str(loc)) for config_id, loc in enumerate(configs)])
+            connection.executemany("INSERT INTO inputs VALUES (?, ?)", inputs_rows)
+            connection.executemany("INSERT INTO sources VALUES (?, ?)", sources_rows)
+            connection.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", files_rows)
+            connection.executemany("INSERT INTO units VALUES (?, ?, ?, ?)", units_rows)
+            connection.executemany("INSERT INTO name_deps VALUES (?, ?, ?, ?)", name_deps_rows)
+            connection.executemany("INSERT INTO file_deps VALUES (?, ?, ?)", file_deps_rows)
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(temp_loc, self.loc)
+
+    def update(
+        self,
+        look: "LookupPrj",
+        top_lib: Optional[str] = None,
+        x_tool_version: Optional[str] = None,
+        x_device: Optional[str] = None,
+        snapshot_loc: Optional[Path] = None,
+    ) -> bool:
+        """Write the index if it is not current, returns True if it was written"""
+        if self.is_current(top_lib, x_tool_version, x_device):
+            return False
+        self.write(look, top_lib, x_tool_version, x_device, snapshot_loc)
+        return True
+
+    @staticmethod
+    def _file_dicts(rows) -> List[dict]:
+        return [{"id": row[0], "path": row[1], "file_type": row[2], "library": row[3], "ver_tag": row[4]} for row in rows]
+
+    def files_declaring(self, kind: str, name: str, lib: Optional[str] = None) -> List[dict]:
+        """The files that declare the design unit, kind is "entity" (including modules) or "package" """
+        query = "SELECT files.id, path, file_type, files.lib, ver FROM units JOIN files ON files.id = units.file_id WHERE name = ? AND kind = ?"
+        params = [name.lower(), kind]
+        if lib is not None:
+            query += " AND units.lib = ?"
+            params.append(lib.lower())
+        return ProjectIndex._file_dicts(self.connection.execute(query, params))
+
+    def files_using(self, kind: str, name: str) -> List[dict]:
+        """The files that depend on the design unit by name, kind is "entity", "package" or "component" """
+        query = "SELECT DISTINCT files.id, path, file_type, files.lib, ver FROM name_deps JOIN files ON files.id = name_deps.file_id WHERE name = ? AND kind = ?"
+        return ProjectIndex._file_dicts(self.connection.execute(query, (name.lower(), kind)))
+
+    def file(self, path: Path) -> List[dict]:
+        """The file (one entry per library/version it is used with)"""
+        query = "SELECT id, path, file_type, lib, ver FROM files WHERE path = ?"
+        return ProjectIndex._file_dicts(self.connection.execute(query, (str(resolve_abs_path(path)),)))
+
+    def file_list(self, lib: Optional[str] = None, file_type: Optional[str] = None) -> List[dict]:
+        """The files of the project, like the file list skipping the files skipped from the compile order"""
+        query = "SELECT id, path, file_type, lib, ver FROM files WHERE skip = 0"
+        params = []
+        if lib is not None:
+            query += " AND lib = ?"
+            params.append(lib)
+        if file_type is not None:
+            query += " AND file_type = ?"
+            params.append(file_type.upper())
+        return ProjectIndex._file_dicts(self.connection.execute(query + " ORDER BY id", params))
+
+    def uses(self, file_id: int) -> List[dict]:
+        """The design units file_id uses by name"""
+        query = "SELECT DISTINCT kind, lib, name FROM name_deps WHERE file_id = ? ORDER BY kind, lib, name"
+        return [{"kind": kind, "library": lib, "name": name} for kind, lib, name in self.connection.execute(query, (file_id,))]
+
+    def deps(self, file_id: int) -> List[dict]:
+        """The files file_id depends on directly"""
+        query = "SELECT DISTINCT files.id, path, file_type, files.lib, ver FROM file_deps JOIN files ON files.id = dep_id WHERE file_id = ?"
+        return ProjectIndex._file_dicts(self.connection.execute(query, (file_id,)))
+
+    def rdeps(self, file_id: int) -> List[dict]:
+        """The files that depend on file_id directly"""
+        query = "SELECT DISTINCT files.id, path, file_type, files.lib, ver FROM file_deps JOIN files ON files.id = file_deps.file_id WHERE dep_id = ?"
+        return ProjectIndex._file_dicts(self.connection.execute(query, (file_id,)))
+
+
+# }}}
+
+
+# Cache bundles {{{
+# The pickle caches of a project packed into one compressed archive (e.g. a CI artifact passed between jobs). The
+# caches are stored relative to the bundle root (the project root or the directory of the config file) with a
+# manifest of sha256 fingerprints: of each cache, the config file it was made from and the source files it holds.
+# Importing checks the fingerprints against the checkout, so only caches made from the same config are used.
+
+CACHE_BUNDLE_MANIFEST = "manifest.json"
+
+
+def get_cache_bundle_root(toml_loc: Path, project_root: Optional[Path] = None) -> Path:
+    if project_root is not None:
+        return project_root
+    return resolve_abs_path(toml_loc.parent)
 
-        # Write to JSON file
-        with open(output_loc, "w") as f:
-            json.dump(project_compile_order_json, f, indent=2)
+
+def _bundle_rel(loc: Path, root: Path) -> str:
+    return Path(os.path.relpath(os.path.normpath(resolve_abs_path(loc)), root)).as_posix()
+
+
+def _bundle_file_matches(loc: Path, sha256: Optional[str]) -> bool:
+    try:
+        return file_sha256(loc) == sha256
+    except FileNotFoundError:
+        return sha256 is None
+
+
+def export_cache_bundle(
+    look: Lookup, bundle_loc: Path, root: Path, snapshot_loc: Optional[Path] = None, project_root: Optional[Path] = None
+) -> int:
+    """Pack the pickle caches of every config of the loaded project (and the snapshot if there is one) into
+    bundle_loc, returns the number of caches packed. project_root is the one the project was loaded with
+    """
+    import json
+    import tarfile
+
+    entries = []
+    members: List[Tuple[str, bytes]] = []
+
+    def add(loc: Path, entry: dict) -> bool:
+        name = _bundle_rel(loc, root)
+        if name.startswith("../"):
+            log.warning(f"not exporting {loc} as it is outside {root}")
+            return False
+        data = loc.read_bytes()
+        entry.update({"cache": name, "sha256": hashlib.sha256(data).hexdigest()})
+        entries.append(entry)
+        members.append((name, data))
+        return True
+
+    seen: Set[str] = set()
+    for sub in look.iter_lookups():
+        if sub.toml_loc is None:  # project of several config files
+            continue
+        pickle_loc = LookupSingular.toml_loc_to_pickle_loc(sub.toml_loc)
+        if _bundle_rel(pickle_loc, root) in seen:  # a sub used by more than one config
+            continue
+        seen.add(_bundle_rel(pickle_loc, root))
+        if not pickle_loc.is_file():
+            log.warning(f"no cache {pickle_loc} to export")
+            continue
+        journal_loc = LookupSingular.pickle_loc_to_journal_loc(pickle_loc)
+        if journal_loc.is_file():
+            # the journal only applies to this exact pickle file, it would not survive being unpacked
+            LookupSingular.compact_journal(journal_loc, pickle_loc, lock_timeout=30, project_root=project_root)
+        files = {}
+        for loc in sub.loc_2_file_obj:
+            for f_obj in sub._f_objs_at(loc):
+                files[_bundle_rel(f_obj.loc, root)] = f_obj.get_content_hash()
+        add(pickle_loc, {"kind": "pickle", "config": _bundle_rel(sub.toml_loc, root), "config_sha256": sub.toml_hash, "files": files})
+
+    if snapshot_loc is not None and snapshot_loc.is_file():
+        # the snapshot checks its own fingerprints (by content) when it is read
+        add(snapshot_loc, {"kind": "snapshot"})
+
+    manifest = {"version": HDL_DEPENDS_VERSION_NUM, "project_root": project_root is not None, "entries": entries}
+    members.insert(0, (CACHE_BUNDLE_MANIFEST, json.dumps(manifest, indent=1).encode()))
+    def write_bundle(bundle_f):
+        with tarfile.open(fileobj=bundle_f, mode="w:gz") as bundle:
+            for name, data in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                bundle.addfile(info, io.BytesIO(data))
+
+    atomic_write(bundle_loc, write_bundle)
+    return len(entries)
+
+
+def import_cache_bundle(bundle_loc: Path, root: Path, project_root: Optional[Path] = None) -> Tuple[int, int]:
+    """Unpack the caches of bundle_loc under root that match the checkout, a cache is skipped if it is damaged or its
+    config file differs from the one it was made from. Source files that differ are parsed again when loading, the
+    others have their modification times in the caches set to those of the checkout so they are not even hashed.
+    The caches are unpickled, only the types a cache is made of are loaded (see CacheUnpickler) but a bundle should
+    still only be imported from a trusted source. project_root is the one the project will be loaded with. Returns the number of caches imported and the number in
+    the bundle
+    """
+    import json
+    import tarfile
+
+    with tarfile.open(bundle_loc, "r:*") as bundle:
+        manifest = json.load(bundle.extractfile(CACHE_BUNDLE_MANIFEST))
+        if manifest.get("version") != HDL_DEPENDS_VERSION_NUM:
+            raise Exception(f"cache bundle {bundle_loc} is from hdldepends version {manifest.get('version')}, this is {HDL_DEPENDS_VERSION_NUM}")
+        if manifest["project_root"] != (project_root is not None):
+            log.warning(f"cache bundle {bundle_loc} was exported {'with' if manifest['project_root'] else 'without'} a project root, use the same here")
+        entries = manifest["entries"]
+        unchanged: Set[str] = set()
+        accepted: List[Tuple[dict, bytes]] = []
+        for entry in entries:
+            name = entry["cache"]
+            if Path(name).is_absolute() or ".." in Path(name).parts:
+                log.warning(f"not importing {name} from {bundle_loc}, it is outside the project")
+                continue
+            data = bundle.extractfile(name).read()
+            if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+                log.warning(f"not importing {name} from {bundle_loc}, it does not match its fingerprint")
+                continue
+            if entry["kind"] == "pickle":
+                config_loc = root / entry["config"]
+                if not _bundle_file_matches(config_loc, entry["config_sha256"]):
+                    log.info(f"not importing {name}, {config_loc} differs from the config it was made from")
+                    continue
+                unchanged.add(os.path.normpath(config_loc))
+                changed = 0
+                for rel, sha256 in entry["files"].items():
+                    if _bundle_file_matches(root / rel, sha256):
+                        unchanged.add(os.path.normpath(root / rel))
+                    else:
+                        changed += 1
+                if changed != 0:
+                    log.info(f"{changed} of the {len(entry['files'])} files in {name} differ, they will be parsed again")
+            accepted.append((entry, data))
+
+    imported = 0
+    for entry, data in accepted:
+        loc = root / entry["cache"]
+        try:
+            inst = load_cache(io.BytesIO(data), loc, project_root)
+        except Exception as e:
+            log.warning(f"not importing {entry['cache']} from {bundle_loc}, it could not be loaded: {e}")
+            continue
+        if entry["kind"] == "pickle":
+            inst.refresh_modification_times(unchanged)
+            LookupSingular.pickle_loc_to_journal_loc(loc).unlink(missing_ok=True)
+        else:
+            for _, look in inst["entries"].values():
+                look.refresh_modification_times(unchanged)
+        log.debug(f"importing {loc}")
+        data_f = io.BytesIO()
+        dump_cache(inst, data_f, loc, project_root)
+        write_bytes_file(loc, data_f.getvalue())
+        imported += 1
+    return imported, len(entries)
 
 
 # }}}
 
 
 # Handling of configuration files {{{
+def import_yaml():
+    """Import the optional yaml module, it is slow to import and most projects do not use YAML configs"""
+    global yaml
+    if yaml is None:
+        try:
+            import yaml  # type: ignore
+        except ModuleNotFoundError:
+            pass
+    return yaml
+
+
+def import_tomllib():
+    """Import tomllib (tomli before Python 3.11), None if neither is installed"""
+    global tomllib
+    if tomllib is None:
+        try:
+            import tomllib
+        except ModuleNotFoundError:
+            try:
+                import tomli as tomllib  # type: ignore
+            except ModuleNotFoundError:
+                pass
+    return tomllib
+
+
 def load_config(toml_loc) -> Dict:
+    import json
+
     is_json = toml_loc.suffix == ".json"
-    is_toml = toml_loc.suffix == ".toml" and tomllib is not None
-    is_yaml = toml_loc.suffix == ".yaml" and yaml is not None
+    is_toml = toml_loc.suffix == ".toml" and import_tomllib() is not None
+    is_yaml = toml_loc.suffix == ".yaml" and import_yaml() is not None
     if sum([is_json, is_toml, is_yaml]) != 1:
         raise RuntimeError("Unexpected file format " + toml_loc.suffix)
 
@@ -3108,11 +5683,22 @@ def load_config(toml_loc) -> Dict:
         raise e
 
 
-def create_lookup_from_toml(
-    toml_loc: Path, work_dir: Optional[Path] = None, attemp_read_pickle=True, write_pickle=True, top_lib: Optional[str] = None
-):
-    log.debug(f"config loc {toml_loc} , work_dir {work_dir}, attemp_read_pickle {attemp_read_pickle}, write_pickle {write_pickle}, top_lib {top_lib}")
+_pre_cmd_executor = None
+
+
+def pre_cmd_executor():
+    """Thread pool running the pre_cmds of the config files, shared so the pre_cmds of different configs run concurrently"""
+    global _pre_cmd_executor
+    if _pre_cmd_executor is None:
+        # the threads mostly wait for the commands, so use the default number of workers not the cpu count
+        _pre_cmd_executor = ThreadPoolExecutor(thread_name_prefix="pre_cmds")
+    return _pre_cmd_executor
 
+
+def find_config_loc(toml_loc: Path, work_dir: Optional[Path] = None) -> Path:
+    """Location of a config file, a relative location not found from the current directory is searched for
+    in work_dir and its parent directories
+    """
     is_json = toml_loc.suffix == ".json"
 
     if not is_json and toml_loc.suffix != ".toml":
@@ -3136,6 +5722,289 @@ def create_lookup_from_toml(
             test = temp_dir / toml_loc
         toml_loc = test
 
+    return toml_loc
+
+
+_pre_cmds_started: Dict[Path, object] = {}  # config location -> Future of its running pre_cmds (None if it has none)
+
+
+def start_pre_cmds(toml_loc: Path, config: Dict):
+    """Start running the pre_cmds of a config and (recursively) its sub configs, so the pre_cmds of different
+    configs run concurrently. create_lookup_from_toml waits for the pre_cmds of a config before reading its files
+    """
+    key = toml_loc.resolve()
+    if key in _pre_cmds_started:
+        return
+    work_dir = toml_loc.parents[0]
+    _pre_cmds_started[key] = None
+    if "pre_cmds" in config:
+        _pre_cmds_started[key] = pre_cmd_executor().submit(run_pre_cmds, make_list(config["pre_cmds"]), work_dir, toml_loc)
+    for loc in make_list(config.get("sub", [])):
+        try:
+            sub_loc = find_config_loc(Path(loc), work_dir)
+            sub_config = load_config(sub_loc)
+        except Exception:
+            continue  # reported when the sub config is loaded
+        start_pre_cmds(sub_loc, sub_config)
+
+
+def wait_for_pre_cmds(toml_locs: List[Path]):
+    """Wait for any running pre_cmds of the configs"""
+    for toml_loc in toml_locs:
+        pre_cmds_done = _pre_cmds_started.get(toml_loc.resolve())
+        if pre_cmds_done is not None:
+            pre_cmds_done.result()
+
+
+def pre_cmd_up_to_date(inputs: List[Path], outputs: List[Path]) -> bool:
+    """True if every output exists and is newer than every input. Inputs may be glob patterns"""
+    if len(outputs) == 0:
+        return False
+    try:
+        oldest_output = min(get_file_modification_time(loc) for loc in outputs)
+    except FileNotFoundError:
+        return False
+    for input_loc in inputs:
+        if glob.has_magic(str(input_loc)):
+            locs = [Path(loc) for loc in glob.glob(str(input_loc), recursive=True)]
+        else:
+            locs = [input_loc]
+        for loc in locs:
+            try:
+                if get_file_modification_time(loc) > oldest_output:
+                    return False
+            except FileNotFoundError:
+                return False
+    return True
+
+
+def run_pre_cmds(pre_cmds: List, work_dir: Path, toml_loc: Path):
+    """Run the pre_cmds of a config in order. An entry is either a command or a dict with the command "cmd" and
+    the files it reads "inputs" and writes "outputs". A command with outputs is skipped when its outputs are newer than
+    its inputs (and the config file). The output of each command is captured and logged if the command fails.
+    """
+    import subprocess
+
+    for pre_cmd in pre_cmds:
+        if isinstance(pre_cmd, dict):
+            unexpected = set(pre_cmd.keys()) - {"cmd", "inputs", "outputs"}
+            if "cmd" not in pre_cmd or unexpected:
+                raise KeyError(f"pre_cmds entry {pre_cmd} in {toml_loc} expects keys cmd, inputs and outputs")
+            cmd = pre_cmd["cmd"]
+            inputs = [toml_loc] + [path_abs_from_dir(work_dir, Path(loc)) for loc in make_list(pre_cmd.get("inputs", []))]
+            outputs = [path_abs_from_dir(work_dir, Path(loc)) for loc in make_list(pre_cmd.get("outputs", []))]
+            if pre_cmd_up_to_date(inputs, outputs):
+                log.info(f"Skipping {cmd=}, outputs are up to date")
+                continue
+        else:
+            cmd = pre_cmd
+        log.info(f"Running {cmd=}")
+        start = time.perf_counter()
+        result = subprocess.run(cmd, shell=True, cwd=work_dir, capture_output=True, text=True)
+        log.debug(f"{cmd=} took {time.perf_counter() - start:.3f}s")
+        if result.returncode != 0:
+            log.error(f"pre_cmd {cmd} of {toml_loc} failed with exit code {result.returncode}")
+            if result.stdout:
+                log.error(f"stdout:\n{result.stdout}")
+            if result.stderr:
+                log.error(f"stderr:\n{result.stderr}")
+            raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+        if result.stdout:
+            log.debug(f"{cmd=} stdout:\n{result.stdout}")
+        if result.stderr:
+            log.debug(f"{cmd=} stderr:\n{result.stderr}")
+
+
+class ConfigLoads:
+    """The configs loaded (or being loaded) while creating one project. A config reachable through several
+    subs is only loaded once and shared, keyed by its location and top_lib. Independent subs load concurrently.
+    The subs each config waits for are recorded, so a cycle through loads running in other threads is an error
+    rather than a deadlock.
+    """
+
+    def __init__(self, snapshot: Optional["ProjectSnapshot"] = None):
+        self.lock = threading.Lock()
+        self.loads: Dict[Tuple[Path, Optional[str]], object] = {}  # -> Future of the lookup
+        self.waits_for: Dict[Path, Set[Path]] = {}  # config -> the sub configs it waits for
+        self.snapshot = snapshot
+
+    def _wait_path(self, start: Path, goal: Path) -> Optional[List[Path]]:
+        """The configs from start to goal following waits_for, None if goal is not reached"""
+        prev: Dict[Path, Optional[Path]] = {start: None}
+        todo = [start]
+        while todo:
+            loc = todo.pop()
+            if loc == goal:
+                path = []
+                while loc is not None:
+                    path.append(loc)
+                    loc = prev[loc]
+                return path[::-1]
+            for sub in self.waits_for.get(loc, ()):
+                if sub not in prev:
+                    prev[sub] = loc
+                    todo.append(sub)
+        return None
+
+    def load_all(
+        self,
+        toml_locs: List[Path],
+        attemp_read_pickle=True,
+        write_pickle=True,
+        top_lib: Optional[str] = None,
+        parents: Tuple[Path, ...] = (),
+        project_root: Optional[Path] = None,
+    ) -> List[Lookup]:
+        """Load each config (or wait for the thread already loading it), all but the last new config load in new threads"""
+        parent_keys = {parent.resolve() for parent in parents}
+        futures = []
+        to_load = []
+        with self.lock:
+            for toml_loc in toml_locs:
+                key = (toml_loc.resolve(), top_lib)
+                if key[0] in parent_keys:
+                    raise Exception(f"ERROR config file {toml_loc} is a sub of itself through {[str(parent) for parent in parents]}")
+                if len(parents) != 0:
+                    # another thread may be loading the sub and waiting (through its subs) for this config
+                    waiter = parents[-1].resolve()
+                    path = self._wait_path(key[0], waiter)
+                    if path is not None:
+                        raise Exception(f"ERROR config file {toml_loc} is a sub of itself through {[str(loc) for loc in path]}")
+                    self.waits_for.setdefault(waiter, set()).add(key[0])
+                future = self.loads.get(key)
+                if future is None:
+                    future = Future()
+                    self.loads[key] = future
+                    to_load.append((toml_loc, future))
+                else:
+                    log.debug(f"config {toml_loc} is already loaded, sharing it")
+                futures.append(future)
+
+        def load(toml_loc, future):
+            try:
+                future.set_result(
+                    create_lookup_from_toml(
+                        toml_loc,
+                        attemp_read_pickle=attemp_read_pickle,
+                        write_pickle=write_pickle,
+                        top_lib=top_lib,
+                        loads=self,
+                        parents=parents,
+                        project_root=project_root,
+                    )
+                )
+            except BaseException as e:
+                future.set_exception(e)
+
+        threads = [threading.Thread(target=load, args=load_args, name=f"load {load_args[0]}") for load_args in to_load[:-1]]
+        for thread in threads:
+            thread.start()
+        if len(to_load) != 0:
+            load(*to_load[-1])
+        for thread in threads:
+            thread.join()
+        return [future.result() for future in futures]
+
+
+class ProjectSnapshot:
+    """Single cache file holding every config lookup of a project, so a warm start is one file read.
+
+    Each lookup is stored with a fingerprint, the state (see get_input_state) of the files and directories its config reads.
+    A lookup whose fingerprint still matches is used as is (after checking its source files like a pickle), a stale
+    one falls back to the per config pickle cache.
+    """
+
+    VERSION = HDL_DEPENDS_VERSION_NUM
+
+    def __init__(self, loc: Path, project_root: Optional[Path] = None):
+        self.loc = loc
+        self.project_root = project_root
+        self.lock = threading.Lock()
+        self.entries: Dict[Tuple[Path, Optional[str]], Tuple[Dict[Path, Optional[str]], Lookup]] = {}
+        self.used: Dict[Tuple[Path, Optional[str]], Tuple[Dict[Path, Optional[str]], Lookup]] = {}
+        self.changed = False
+        self.written = False
+
+    @staticmethod
+    def toml_loc_to_snapshot_loc(toml_loc: Path) -> Path:
+        return toml_loc.with_name("." + toml_loc.stem + ".snapshot.pickle")
+
+    @staticmethod
+    def fingerprint(look: LookupSingular) -> Dict[Path, Optional[str]]:
+        files, dirs = look.get_config_input_locs()
+        return get_input_states(files + dirs, content=True)
+
+    def read(self):
+        if not self.loc.is_file():
+            log.debug(f"no snapshot at {self.loc}")
+            return
+        log.info(f"reading snapshot {self.loc}")
+        try:
+            with open(self.loc, "rb") as snapshot_f:
+                data = load_cache(snapshot_f, self.loc, self.project_root)
+        except Exception as e:
+            log.warning(f"could not read snapshot {self.loc}: {e}")
+            return
+        if data.get("version") != ProjectSnapshot.VERSION:
+            log.info(f"hdldepends version {ProjectSnapshot.VERSION} but snapshot version {data.get('version')} will not use snapshot")
+            return
+        self.entries = data["entries"]
+
+    def get(self, toml_loc: Path, top_lib: Optional[str]) -> Optional[Lookup]:
+        """The lookup of the config if its snapshot entry is current, otherwise None"""
+        key = (toml_loc.resolve(), top_lib)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        fingerprint, inst = entry
+        if not input_states_unchanged(fingerprint):
+            log.info(f"snapshot of {toml_loc} is out of date")
+            self.changed = True
+            return None
+        log.info(f"loaded {toml_loc} from snapshot, updating required files")
+        inst.toml_loc = toml_loc
+        with self.lock:
+            self.used[key] = (fingerprint, inst)
+        if inst.check_for_src_files_updates():
+            self.changed = True
+            if self.written:
+                # a sub loaded after the snapshot was written
+                self.write()
+        return inst
+
+    def add(self, toml_loc: Path, top_lib: Optional[str], look: LookupSingular):
+        """Record a lookup that was not loaded from the snapshot, so it is in the next one"""
+        with self.lock:
+            self.used[(toml_loc.resolve(), top_lib)] = (ProjectSnapshot.fingerprint(look), look)
+            self.changed = True
+
+    def write(self):
+        with self.lock:
+            self.written = True
+            if not self.changed:
+                return
+            # entries not used this run (subs that were not needed) are kept for the next
+            entries = dict(self.entries)
+            entries.update(self.used)
+            log.info(f"writing snapshot {self.loc}")
+            data = {"version": ProjectSnapshot.VERSION, "entries": entries}
+            atomic_write(self.loc, lambda snapshot_f: dump_cache(data, snapshot_f, self.loc, self.project_root))
+            self.changed = False
+
+
+def create_lookup_from_toml(
+    toml_loc: Path,
+    work_dir: Optional[Path] = None,
+    attemp_read_pickle=True,
+    write_pickle=True,
+    top_lib: Optional[str] = None,
+    loads: Optional[ConfigLoads] = None,
+    parents: Tuple[Path, ...] = (),
+    project_root: Optional[Path] = None,
+):
+    log.debug(f"config loc {toml_loc} , work_dir {work_dir}, attemp_read_pickle {attemp_read_pickle}, write_pickle {write_pickle}, top_lib {top_lib}")
+
+    toml_loc = find_config_loc(toml_loc, work_dir)
     pickle_loc = LookupSingular.toml_loc_to_pickle_loc(toml_loc)
     config = load_config(toml_loc)
 
@@ -3146,7 +6015,13 @@ def create_lookup_from_toml(
         if HDL_DEPENDS_VERSION_NUM < min_v:
             raise Exception(f"hdldepends version {HDL_DEPENDS_VERSION_NUM} less the {min_v} required by {toml_loc}")
 
-    look_subs = []
+    # the pre_cmds of this config and all its sub configs run in the background while the subs are loaded
+    pre_cmds_done = _pre_cmds_started.pop(toml_loc.resolve(), False)
+    if pre_cmds_done is False:
+        start_pre_cmds(toml_loc, config)
+        pre_cmds_done = _pre_cmds_started.pop(toml_loc.resolve(), None)
+
+    sub_locs = []
     if "sub" in config:
         c_locs = config["sub"]
         c_locs = make_list(c_locs)
@@ -3154,14 +6029,15 @@ def create_lookup_from_toml(
             loc = Path(loc)
             if loc == toml_loc or (work_dir / loc) == toml_loc:
                 raise Exception(f"ERROR config file {toml_loc} references itself")
-            look_subs.append(
-                create_lookup_from_toml(loc, work_dir, attemp_read_pickle=attemp_read_pickle, write_pickle=write_pickle, top_lib=top_lib)
-            )
+            sub_locs.append(find_config_loc(loc, work_dir))
+    if loads is None:
+        loads = ConfigLoads()
+    sub_kwargs = dict(
+        attemp_read_pickle=attemp_read_pickle, write_pickle=write_pickle, top_lib=top_lib, parents=parents + (toml_loc,), project_root=project_root
+    )
 
-    if "pre_cmds" in config:
-        for cmd in make_list(config["pre_cmds"]):
-            log.info(f"Running {cmd=}")
-            subprocess.check_output(cmd, shell=True, cwd=work_dir)
+    if pre_cmds_done is not None:
+        pre_cmds_done.result()  # raises the error of a failed command
 
     file_lists = FileLists()
     # vhdl_file_list = None
@@ -3172,16 +6048,41 @@ def create_lookup_from_toml(
     # ext_file_list = None
     if attemp_read_pickle:
         # inst, vhdl_file_list, verilog_file_list, other_file_list, x_bd_file_list, x_xci_file_list = LookupSingular.atempt_to_load_from_pickle(pickle_loc, toml_loc, top_lib=top_lib)
-        inst, file_lists = LookupSingular.atempt_to_load_from_pickle(pickle_loc, toml_loc, top_lib=top_lib)
+        inst = None
+        from_snapshot = False
+        if loads.snapshot is not None:
+            inst = loads.snapshot.get(toml_loc, top_lib)
+            from_snapshot = inst is not None
+        if inst is None:
+            inst, file_lists = LookupSingular.atempt_to_load_from_pickle(pickle_loc, toml_loc, top_lib=top_lib, project_root=project_root)
         if inst is not None:
             if hasattr(inst, "look_subs"):
                 assert isinstance(inst, LookupMulti)
-                inst.look_subs = look_subs
-            elif len(look_subs) != 0:
+                # subs are only loaded when needed, using the summaries saved with this pickle
+                summaries = {sub.toml_loc.resolve(): sub.summary for sub in inst.look_subs if isinstance(sub, LazyLookup)}
+                save_parent = None
+                if write_pickle:
+                    save_parent = lambda inst=inst: inst.save_to_pickle(pickle_loc, project_root)
+                inst.look_subs = [
+                    LazyLookup(loc, summary=summaries.get(loc.resolve()), save_parent=save_parent, loads=loads, **sub_kwargs) for loc in sub_locs
+                ]
+                # only the config inputs are checked here, the source files of the subs when a name is not found
+                stale = [sub for sub in inst.look_subs if sub._unloaded_summary() is None]
+                if len(stale) != 0:
+                    # load the changed subs now (concurrently) and save their new summaries
+                    loads.load_all([sub.toml_loc for sub in stale], **sub_kwargs)
+                    for sub in stale:
+                        sub.load()
+                    if write_pickle:
+                        inst.save_to_pickle(pickle_loc, project_root)
+            elif len(sub_locs) != 0:
                 log.warning(f"Config {toml_loc} has look_subs but pickle doesn't will not load from pickle")
                 inst = None
         if inst is not None:
             log.debug("Loading Lookup from pickle")
+            inst.toml_loc = toml_loc
+            if loads.snapshot is not None and not from_snapshot:
+                loads.snapshot.add(toml_loc, top_lib, inst)
             return inst
         # if file_lists.vhdl is not None:
         #     vhdl_file_list = file_lists.vhdl
@@ -3197,6 +6098,8 @@ def create_lookup_from_toml(
         #     ext_file_list = file_lists.ext
 
     # picke_loc = LookupSingular.toml_loc_to_pickle_loc(toml_loc)
+    # creating the lookup needs the subs, so load them all now (concurrently)
+    look_subs = [LazyLookup(loc, look=sub, loads=loads, **sub_kwargs) for loc, sub in zip(sub_locs, loads.load_all(sub_locs, **sub_kwargs))]
     config_keys = config.keys()
     # TODO workout how to typecheck dict_keyes type
     # print(f'config_keys.type {type(config_keys)}')
@@ -3231,132 +6134,525 @@ def create_lookup_from_toml(
         inst = LookupSingular.create_from_config_dict(config, work_dir=work_dir, top_lib=top_lib, file_lists=file_lists)
 
     log.debug(f'toml_loc {toml_loc}')
-    time = get_file_modification_time(toml_loc)
-    assert time is not None
-    inst.toml_modification_time = time
+    toml_modification_time = get_file_modification_time(toml_loc)
+    assert toml_modification_time is not None
+    inst.toml_modification_time = toml_modification_time
+    inst.toml_hash = file_sha256(toml_loc)
+    inst.toml_loc = toml_loc
 
     if write_pickle:
         look_subs = None
         if hasattr(inst, "look_subs"):
             assert isinstance(inst, LookupMulti) or isinstance(inst, LookupPrj)
             look_subs = inst.look_subs
-        inst.save_to_pickle(pickle_loc)
+        inst.save_to_pickle(pickle_loc, project_root)
         if look_subs is not None:
             assert isinstance(inst, LookupMulti) or isinstance(inst, LookupPrj)
             inst.look_subs = look_subs
+    if loads.snapshot is not None:
+        loads.snapshot.add(toml_loc, top_lib, inst)
     return inst
 
 
 # }}}
 
 
-# {{{ Main method handling
-def extract_tuple_str(s) -> Tuple[str, str]:
-    try:
-        lib, f = s.split(":")
-        return lib, f
-    except:
-        raise argparse.ArgumentTypeError("--compile-order-lib expects tuples of lib:path")
+# Python API {{{
+def set_log_level(level: int):
+    """Set how much is logged to stderr: -1 errors only, 0 warnings (the default), 1 info and 2 debug.
+    The level is process wide, it applies to every Project (and the command line functions) in the process
+    """
+    global log_level
+    log_level = level
 
 
-def set_log_level_from_verbose(args):
+@dataclass(frozen=True)
+class HdlFile:
+    """A file of the project as returned by the Project API"""
+
+    path: Path
+    file_type: str  # e.g. "VHDL", "VERILOG", "X_XCI"
+    library: Optional[str]
+    ver_tag: Optional[str]
+
+    @staticmethod
+    def from_f_obj(f_obj: FileObj) -> "HdlFile":
+        return HdlFile(f_obj.loc, f_obj.file_type_str, f_obj.lib, f_obj.ver_tag)
+
+
+class Project:
+    """A loaded hdldepends project that can be queried many times from Python, e.g. from a VUnit/cocotb run.py:
+
+        from hdldepends import Project
+        prj = Project("hdl_deps.toml")
+        for tb in prj.entities(["*_tb"]):
+            files = prj.compile_order(top_entity=tb)
+
+    The project is loaded once (using the pickle caches like the command line). Queries use the lookup as
+    loaded, call revalidate() to pick up changes made on disk since.
+    """
+
+    def __init__(
+        self,
+        config_locs: Union[str, Path, List[Union[str, Path]]],
+        top_lib: Optional[str] = None,
+        use_cache: bool = True,
+        write_cache: bool = True,
+        x_tool_version: Optional[str] = None,
+        x_device: Optional[str] = None,
+        snapshot: bool = False,
+        index: bool = False,
+        project_root: Union[str, Path, None] = None,
+    ):
+        self.config_locs = [Path(c) for c in make_list(config_locs)]
+        self.top_lib = top_lib
+        self.use_cache = use_cache
+        self.write_cache = write_cache
+        self.x_tool_version = x_tool_version
+        self.x_device = x_device
+        self.snapshot = snapshot
+        self.index = index
+        self.project_root = None if project_root is None else Path(project_root)
+        self.look = self._load()
+        self.default_top = self.look.f_obj_top
+
+    def _load(self) -> LookupPrj:
+        return load_lookup_prj(
+            self.config_locs,
+            top_lib=self.top_lib,
+            attemp_read_pickle=self.use_cache,
+            write_pickle=self.write_cache,
+            x_tool_version=self.x_tool_version,
+            x_device=self.x_device,
+            snapshot=self.snapshot,
+            index=self.index,
+            project_root=self.project_root,
+        )
+
+    def revalidate(self) -> bool:
+        """Bring the project up to date with the disk. Changed source files are parsed again and if a
+        config file or file list changed the project is loaded again. Returns True if it was loaded again.
+        """
+        if self.look.revalidate():
+            return False
+        log.info("config changed, loading project again")
+        self.look = self._load()
+        self.default_top = self.look.f_obj_top
+        return True
+
+    def _set_top(self, top_entity: Optional[str], top_file: Union[str, Path, None], lib: Optional[str]):
+        look = self.look
+        if top_entity is not None:
+            if lib is None:
+                lib = LIB_DEFAULT if self.top_lib is None else self.top_lib
+            f_obj = look.find_entity_required(Name(lib, top_entity))
+        elif top_file is not None:
+            f_obj = look.get_loc(Path(top_file))
+        else:
+            f_obj = self.default_top
+        if f_obj is None:
+            raise RuntimeError("no top file in the config, pass top_entity or top_file")
+        look.set_top_f_obj(f_obj)
+
+    def compile_order(
+        self, top_entity: Optional[str] = None, top_file: Union[str, Path, None] = None, lib: Optional[str] = None
+    ) -> List[HdlFile]:
+        """The compile order of a top entity (in library lib) or top file, by default the top of the config"""
+        self._set_top(top_entity, top_file, lib)
+        return [HdlFile.from_f_obj(f_obj) for f_obj in self.look.compile_order]
+
+    def compile_order_waves(
+        self, top_entity: Optional[str] = None, top_file: Union[str, Path, None] = None, lib: Optional[str] = None
+    ) -> List[List[HdlFile]]:
+        """The compile order split into waves, the files of a wave only depend on files in earlier waves"""
+        self._set_top(top_entity, top_file, lib)
+        waves: List[List[HdlFile]] = [[] for _ in range(self.look.critical_path_length)]
+        for f_obj, wave in zip(self.look.compile_order, self.look.compile_order_waves):
+            waves[wave].append(HdlFile.from_f_obj(f_obj))
+        return waves
+
+    def file_list(self, file_type: Optional[str] = None, lib: Optional[str] = None) -> List[HdlFile]:
+        """Every file in the project, optionally only files of a type (e.g. "vhdl") and/or library"""
+        f_type = None if file_type is None else string_to_FileObjType(file_type)
+        return [
+            HdlFile.from_f_obj(f_obj) for f_obj in self.look.get_file_list(lib=lib) if f_type is None or f_obj.f_type == f_type
+        ]
+
+    def ext_files(self, tag: Optional[str] = None) -> Dict[str, List[Path]]:
+        """External files by tag, only the files of tag if it is given"""
+        if tag is not None:
+            return {tag: self.look.get_ext_files_for_tag(tag)}
+        return self.look.get_tag_2_ext_file()
+
+    def entities(self, patterns: Optional[List[str]] = None) -> List[str]:
+        """Names of the entities/modules in the project, only those matching the names / glob patterns if given"""
+        if patterns is None:
+            patterns = ["*"]
+        return self.look.match_entity_names(patterns)
+
+    def entity_location(self, name: str, lib: Optional[str] = None) -> Path:
+        """The file declaring entity/module name, raises KeyError if it cannot be found or is ignored"""
+        return self.look.find_entity_required(Name(LIB_DEFAULT if lib is None else lib, name)).loc
+
+
+# }}}
+
+
+# Resident server {{{
+class LookupServer:
+    """Keeps a project lookup in memory and answers requests for it.
+
+    Each request is a dict with a "cmd" key, the reply is a dict with "ok" and either "text"
+    (the same text the command line writes to the output file) or "error".
+    Before every request the lookup is checked against the disk, changed source files are
+    parsed again and the whole project is loaded again if a config file or file list changed.
+    Connections are served in threads, the requests take turns on the lookup.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.look: Optional[LookupPrj] = None
+        self.default_top: Optional[FileObj] = None
+        self.running = False
+        self.lock = threading.Lock()  # held while a request uses the lookup
+        self.load()
+
+    def load(self):
+        self.look = load_project(self.args)
+        self.default_top = self.look.f_obj_top
+
+    def revalidate(self):
+        assert self.look is not None
+        if not self.look.revalidate():
+            log.info("config changed, loading project again")
+            self.load()
+
+    def set_top(self, request: dict):
+        assert self.look is not None
+        look = self.look
+        if "top_entity" in request:
+            lib = request.get("lib", self.args.top_vhdl_lib)
+            if lib is None:
+                lib = LIB_DEFAULT
+            f_obj = look.find_entity_required(Name(lib, request["top_entity"]))
+        elif "top_file" in request:
+            f_obj = look.get_loc(Path(request["top_file"]))
+        else:
+            f_obj = self.default_top
+        if f_obj is None:
+            raise RuntimeError("no top file in the config, the request needs a top_entity or top_file")
+        look.set_top_f_obj(f_obj)
+
+    def handle(self, request: dict) -> dict:
+        cmd = request.get("cmd")
+        try:
+            if cmd == "ping":
+                return {"ok": True, "text": ""}
+            if cmd == "shutdown":
+                self.running = False
+                return {"ok": True, "text": ""}
+            with self.lock:
+                return self.handle_lookup(cmd, request)
+        except Exception as e:
+            log.error(f"request {request} failed: {e}")
+            return {"ok": False, "error": str(e)}
+
+    def handle_lookup(self, cmd: str, request: dict) -> dict:
+        """Answer a request that uses the lookup, called holding the lock"""
+        self.revalidate()
+        assert self.look is not None
+        look = self.look
+        f_type = None
+        if request.get("type") is not None:
+            f_type = string_to_FileObjType(request["type"])
+        if cmd == "compile-order":
+            self.set_top(request)
+            if "lib" in request or (f_type is not None and f_type != FileObjType.VHDL):
+                lib = request.get("lib", LIB_DEFAULT)
+                return {"ok": True, "text": look.format_compile_order_lib(lib, f_type)}
+            return {"ok": True, "text": look.format_compile_order(f_type)}
+        if cmd == "compile-order-waves":
+            self.set_top(request)
+            return {"ok": True, "text": look.format_compile_order_waves(request.get("lib"), f_type)}
+        if cmd == "compile-order-json":
+            self.set_top(request)
+            return {"ok": True, "text": look.format_compile_order_json()}
+        if cmd == "file-list":
+            return {"ok": True, "text": look.format_file_list(f_type, request.get("lib"))}
+        if cmd == "ext-file-list":
+            return {"ok": True, "text": look.format_ext_file_list(request.get("tag"))}
+        if cmd == "entity-location":
+            f_obj = look.find_entity_required(Name(request.get("lib", LIB_DEFAULT), request["name"]))
+            return {"ok": True, "text": f"{f_obj.loc}\n", "path": str(f_obj.loc), "library": f_obj.lib}
+        return {"ok": False, "error": f"unknown command {cmd}"}
+
+    @staticmethod
+    def remove_stale_socket(socket_loc: Path):
+        """Remove the socket left by a server that stopped, exits if a server is still answering on it"""
+        import socket
+
+        if not stat.S_ISSOCK(socket_loc.lstat().st_mode):
+            log.error(f"{socket_loc} exists and is not a socket")
+            sys.exit(1)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(socket_loc))
+            except ConnectionRefusedError:
+                log.info(f"removing the socket {socket_loc} of a server that stopped")
+                socket_loc.unlink()
+                return
+        log.error(f"a server is already running on {socket_loc}")
+        sys.exit(1)
+
+    def serve(self, socket_loc: Path):
+        import json
+        import socketserver
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        reply = {"ok": False, "error": f"bad request {e}"}
+                    else:
+                        reply = server.handle(request)
+                    self.wfile.write((json.dumps(reply) + "\n").encode())
+                    self.wfile.flush()
+                    if not server.running:
+                        # shutdown() waits for serve_forever() in the main thread to return
+                        self.server.shutdown()
+                        return
+
+        if socket_loc.exists() or socket_loc.is_symlink():
+            LookupServer.remove_stale_socket(socket_loc)
+        unix_server = socketserver.ThreadingUnixStreamServer(str(socket_loc), Handler)
+        unix_server.daemon_threads = True  # open connections do not keep the server from stopping
+        print(f"hdldepends serving {self.args.config_file[0]} on {socket_loc}", flush=True)
+        self.running = True
+        try:
+            unix_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            unix_server.server_close()
+            if socket_loc.exists():
+                socket_loc.unlink()
+
+
+# }}}
+
+
+# {{{ Main method handling
+def extract_tuple_str(s) -> Tuple[str, str]:
+    import argparse
+
+    try:
+        lib, f = s.split(":")
+        return lib, f
+    except:
+        raise argparse.ArgumentTypeError("--compile-order-lib expects tuples of lib:path")
+
+
+def set_log_level_from_verbose(args):
     global log_level
     if args.verbose is not None:
         log_level = args.verbose
 
 
-def hdldepends():
-    parser = argparse.ArgumentParser(description="HDL dependency parser")
+def output_loc(loc_str: str, top: Optional[str] = None) -> Path:
+    """Output paths may contain '{top}' which is replaced by the top entity name in batch mode"""
+    if top is not None:
+        loc_str = loc_str.replace("{top}", top)
+    return Path(loc_str)
+
+
+def add_project_outputs(emitter: OutputEmitter, args):
+    """Add the outputs that do not depend on the top file"""
+    if args.file_list is not None:
+        emitter.add_file_list(Path(args.file_list))
+
+    if args.file_list_type is not None:
+        for f_type_str, file_out_str in args.file_list_type:
+            f_type = string_to_FileObjType(f_type_str)
+            emitter.add_file_list(Path(file_out_str), f_type)
+
+    if args.file_list_vhdl_lib is not None:
+        for lib, f in args.file_list_vhdl_lib:
+            emitter.add_file_list(Path(f), FileObjType.VHDL, lib)
+
+    if args.ext_file_list is not None:
+        emitter.add_ext_file_list(Path(args.ext_file_list))
+
+    if args.ext_file_list_tag is not None:
+        for tag, f in args.ext_file_list_tag:
+            emitter.add_ext_file_list(Path(f), tag)
+
+
+def write_project_outputs(look: Lookup, args):
+    """Write the outputs that do not depend on the top file"""
+    emitter = OutputEmitter(look)
+    add_project_outputs(emitter, args)
+    emitter.write()
+
+
+def top_output_strs(args) -> List[str]:
+    out = [
+        opt
+        for opt in [
+            args.compile_order,
+            args.compile_order_path_only,
+            args.compile_order_json,
+            args.compile_order_waves,
+            args.recompile_order,
+            args.recompile_manifest,
+            args.build_makefile,
+            args.build_ninja,
+        ]
+        if opt is not None
+    ]
+    for opt_list in [args.compile_order_type, args.compile_order_vhdl_lib, args.compile_order_waves_vhdl_lib]:
+        if opt_list is not None:
+            out += [f for _, f in opt_list]
+    return out
+
+
+def add_top_outputs(emitter: OutputEmitter, args, top: Optional[str] = None):
+    """Add the outputs that depend on the top file (compile orders)"""
+    look = emitter.look
+    if top_output_strs(args):
+        assert look.has_top_file()
+        assert isinstance(look, LookupPrj)
+
+    if args.compile_order is not None:
+        emitter.add_compile_order(output_loc(args.compile_order, top))
+
+    if args.compile_order_path_only is not None:
+        emitter.add_compile_order_lib(output_loc(args.compile_order_path_only, top), None)
+
+    if args.compile_order_type is not None:
+        for f_type_str, file_out_str in args.compile_order_type:
+            f_type = string_to_FileObjType(f_type_str)
+            loc = output_loc(file_out_str, top)
+            if f_type == FileObjType.VHDL:
+                emitter.add_compile_order(loc, f_type)
+            else:
+                emitter.add_compile_order_lib(loc, LIB_DEFAULT, f_type)
+
+    if args.compile_order_vhdl_lib is not None:
+        for lib, f in args.compile_order_vhdl_lib:
+            emitter.add_compile_order_lib(output_loc(f, top), lib, FileObjType.VHDL)
+
+    if args.compile_order_json is not None:
+        emitter.add_compile_order_json(output_loc(args.compile_order_json, top))
+
+    if args.compile_order_waves is not None:
+        emitter.add_compile_order_waves(output_loc(args.compile_order_waves, top))
+
+    if args.compile_order_waves_vhdl_lib is not None:
+        for lib, f in args.compile_order_waves_vhdl_lib:
+            emitter.add_compile_order_waves(output_loc(f, top), lib, FileObjType.VHDL)
+
+    if args.build_makefile is not None or args.build_ninja is not None:
+        build_cmds = build_cmds_from_args(args)
+        stamp_dir = output_loc(args.build_stamp_dir, top)
+        serial_libs = args.build_serial_libs or args.build_tool in LookupPrj.BUILD_TOOLS_SERIAL_LIBS
+        if args.build_makefile is not None:
+            emitter.add_build_makefile(output_loc(args.build_makefile, top), build_cmds, stamp_dir, serial_libs)
+        if args.build_ninja is not None:
+            emitter.add_build_ninja(output_loc(args.build_ninja, top), build_cmds, stamp_dir, serial_libs)
+
+
+def build_cmds_from_args(args) -> Dict[Tuple[FileObjType, Optional[str]], str]:
+    """Command templates of --build-tool and --build-cmd, keyed on (file type, library)"""
+    build_cmds: Dict[Tuple[FileObjType, Optional[str]], str] = {}
+    if args.build_tool is not None:
+        build_cmds.update(LookupPrj.BUILD_TOOL_CMDS[args.build_tool])
+    if args.build_cmd is not None:
+        for type_lib, cmd in args.build_cmd:
+            f_type_str, _, lib = type_lib.partition(":")
+            build_cmds[(string_to_FileObjType(f_type_str), lib if lib else None)] = cmd
+    return build_cmds
+
+
+def finish_top_outputs(look: Lookup, args, top: Optional[str] = None):
+    """Outputs of the top file that are not plain text outputs of the emitter"""
+    if args.compile_order_waves is not None or args.compile_order_waves_vhdl_lib is not None:
+        assert isinstance(look, LookupPrj)
+        print(f"compile order waves: {look.critical_path_length} (critical path length)")
+
+    if args.recompile_order is not None:
+        assert isinstance(look, LookupPrj)
+        if args.recompile_manifest is None:
+            raise RuntimeError("--recompile-order requires --recompile-manifest")
+        look.write_recompile_order(output_loc(args.recompile_order, top), output_loc(args.recompile_manifest, top))
+
+
+def write_top_outputs(look: Lookup, args, top: Optional[str] = None):
+    """Write the outputs that depend on the top file (compile orders)"""
+    emitter = OutputEmitter(look)
+    add_top_outputs(emitter, args, top)
+    emitter.write()
+    finish_top_outputs(look, args, top)
+
 
+def write_batch_outputs(look: "LookupPrj", args, top_lib: Optional[str], print_order: bool = True) -> bool:
+    """Write the compile order outputs of every top entity matching --top-entities.
+
+    All tops share the one loaded lookup (and its resolved dependencies), each top starts
+    from a clean state so the outputs are the same as running hdldepends once per top.
+    Returns False if any top failed.
+    """
+    tops = look.match_entity_names(args.top_entities)
+    if len(tops) > 1:
+        for loc_str in top_output_strs(args):
+            if "{top}" not in loc_str:
+                log.error(f"output {loc_str} needs a '{{top}}' placeholder when compiling more than one top entity")
+                return False
+    lib = top_lib
+    if lib is None:
+        lib = LIB_DEFAULT
+    ok = True
+    for top in tops:
+        log.info(f"batch top entity {top}")
+        look.clear_top()
+        try:
+            look.set_top_entity(Name(lib, top), do_not_replace_top_file=False)
+            if print_order:
+                look.print_compile_order()
+            write_top_outputs(look, args, top)
+        except (KeyError, RuntimeError) as e:
+            log.error(f"top entity {top} failed: {e}")
+            ok = False
+    return ok
+
+
+def add_project_args(parser, config_nargs="+"):
+    """Arguments shared by every command that loads a project, added to the argparse parser"""
     parser.add_argument("-v", "--verbose", action="count", help="Verbose level, repeat up to two times")
     parser.add_argument("-c", "--clear-pickle", action="store_true", help="Delete pickle cache files first.")
     parser.add_argument("--no-pickle", action="store_true", help="Do not write or read any pickle caches")
+    parser.add_argument("--snapshot", action="store_true", help="Also cache the whole project in a single snapshot file, read first on the next run")
+    parser.add_argument("--index", action="store_true", help="Keep a SQLite index of the project's files, design units and dependencies")
+    parser.add_argument(
+        "--project-root", type=str, help="Store paths in the caches relative to this directory (default $HDL_DEPENDS_PROJECT_ROOT, else each config's directory)"
+    )
     parser.add_argument(
         "config_file",
-        nargs="+",  # Allows one or more files
+        nargs=config_nargs,  # Allows one or more files
         type=str,
         help="Paths to / File Names of, the config TOML input file(s).",
     )
-    parser.add_argument("--top-file", type=str, help="Location to top level file (expects file to already be added)")
-    parser.add_argument(
-        "--top-file-type", type=extract_tuple_str, help="Expects '<type>:<file>' Location to top level file (will add the file if not already added"
-    )
-    parser.add_argument("--top-entity", type=str, help="Top level entity to use (expects entity to already be added)")
     parser.add_argument("--top-vhdl-lib", type=str, help="Top level VHDL library")
-    parser.add_argument("--compile-order", type=str, help="Path to the compile order output file. Each line of the file contains library and paths")
-    parser.add_argument("--compile-order-path-only", type=str, help="Path to the compile order output file. File contains Paths only")
-    parser.add_argument(
-        "--compile-order-type", nargs="+", type=extract_tuple_str, help="Expects '<type>:<file>' Write compile order of passed  <type> to <file>."
-    )
-    parser.add_argument(
-        "--compile-order-vhdl-lib",
-        nargs="+",
-        type=extract_tuple_str,
-        help="Expects '<lib>:<file>' where 'file' is location to write the VHDL compile order of libary 'lib'.",
-    )
-    parser.add_argument("--file-list", type=str, help="Output full file list of in project")
-    parser.add_argument("--file-list-type", nargs="+", type=extract_tuple_str, help="Output full VHDL file list of in project")
-    parser.add_argument(
-        "--file-list-vhdl-lib",
-        nargs="+",
-        type=extract_tuple_str,
-        help="Expects '<lib>:<file>' where <file> is location to write the file list of VHDL library <lib>.",
-    )
-    parser.add_argument("--ext-file-list", type=str, help="external file list")
-    parser.add_argument("--ext-file-list-tag", nargs="+", type=extract_tuple_str, help="external file list for a given tag, Expects '<tag>:<file>'")
-    parser.add_argument(
-        "--compile-order-json", type=str, help="Create a complete project compile order JSON file including both compile order and external files"
-    )
     parser.add_argument("--x-tool-version", type=str, help="Xilinx tool version (used for choosing x_bd and x_xci files)")
     parser.add_argument("--x-device", type=str, help="Xilinx device (used for choosing x_bd and x_xci files)")
-    args = parser.parse_args()
-
-    set_log_level_from_verbose(args)
-    log.debug(f"{HDL_DEPENDS_VERSION_NUM=}")
-
-    work_dir = Path(".")
-    top_lib = None
-    if args.top_vhdl_lib:
-        top_lib = args.top_vhdl_lib
-
-    attemp_read_pickle = not args.clear_pickle and not args.no_pickle
-    write_pickle = not args.no_pickle
-    look = None
-    if args.config_file:
-        if len(args.config_file) == 1:
-            log.debug("creating top level project toml")
-            look = create_lookup_from_toml(
-                Path(args.config_file[0]), work_dir=work_dir, attemp_read_pickle=attemp_read_pickle, write_pickle=write_pickle, top_lib=top_lib
-            )
-            if not isinstance(look, LookupPrj):
-                assert isinstance(look, LookupSingular)
-                look = LookupPrj([look])
-            # look.x_tool_version = x_tool_version
-            # look.x_device = x_device
-        else:
-            look_subs = []
-            for c_toml in look_subs:
-                look_subs.append(
-                    create_lookup_from_toml(
-                        Path(c_toml), work_dir=work_dir, attemp_read_pickle=attemp_read_pickle, write_pickle=write_pickle, top_lib=top_lib
-                    )
-                )
-            look = LookupPrj(look_subs)
-            # look.x_tool_version = x_tool_version
-            # look.x_device = x_device
-
-    assert look is not None
 
-    x_tool_version = args.x_tool_version
-    if x_tool_version is not None:
-        look.set_x_tool_version(x_tool_version)
-
-    x_device = args.x_device
-    if x_device is not None:
-        look.set_x_device(x_device)
 
-    # Check X files against requirements (warns on mismatches)
-    look.filter_x_files_by_requirements()
+def apply_top_args(look: "LookupPrj", args):
+    """Set the top file from the --top-* command line options"""
+    top_lib = args.top_vhdl_lib
 
     if args.top_file_type:
         f_type_str, file_str = args.file_file_type
@@ -3377,60 +6673,515 @@ def hdldepends():
         name = Name(lib, args.top_entity)
         look.set_top_entity(name, do_not_replace_top_file=True)
 
-    if look.has_top_file():
+
+def write_outputs(look: "LookupPrj", args, print_order: bool = True) -> bool:
+    """Write every output requested on the command line, returns False if any top failed"""
+    if args.top_entities:
+        assert isinstance(look, LookupPrj)
+        write_project_outputs(look, args)
+        ok = write_batch_outputs(look, args, args.top_vhdl_lib, print_order)
+        if args.depfile is not None:
+            write_depfile(look, args, look.match_entity_names(args.top_entities))
+        return ok
+
+    if print_order and look.has_top_file():
         assert isinstance(look, LookupPrj)
         look.print_compile_order()
 
-    if args.file_list is not None:
-        look.write_file_list(Path(args.file_list))
+    emitter = OutputEmitter(look)
+    add_project_outputs(emitter, args)
+    add_top_outputs(emitter, args)
+    emitter.write()
+    finish_top_outputs(look, args)
+    if args.depfile is not None:
+        write_depfile(look, args, [None])
+    return True
+
+
+def project_output_strs(args) -> List[str]:
+    out = [opt for opt in [args.file_list, args.ext_file_list] if opt is not None]
+    for opt_list in [args.file_list_type, args.file_list_vhdl_lib, args.ext_file_list_tag]:
+        if opt_list is not None:
+            out += [f for _, f in opt_list]
+    return out
+
+
+def depfile_escape(loc: Path) -> str:
+    return str(loc).replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def format_depfile(targets: List[Path], deps: List[Path]) -> str:
+    """Makefile/ninja style depfile, one rule making every target depend on every dep"""
+    lines = [" ".join(depfile_escape(target) for target in targets) + ":"]
+    lines += [f"  {depfile_escape(dep)}" for dep in deps]
+    return " \\\n".join(lines) + "\n"
+
+
+def write_depfile(look: Lookup, args, tops: List[Optional[str]]):
+    """Write the --depfile listing every input the outputs were created from as dependencies of the outputs"""
+    targets = [Path(loc_str) for loc_str in project_output_strs(args)]
+    for top in tops:
+        targets += [output_loc(loc_str, top) for loc_str in top_output_strs(args)]
+    targets = list(dict.fromkeys(targets))
+    if len(targets) == 0:
+        log.warning("--depfile without any outputs, using the depfile as the target")
+        targets = [Path(args.depfile)]
+    files, dirs = look.get_input_locs()
+    # inputs that do not exist (e.g. unresolved direct dependencies) would make make/ninja always rerun
+    deps = [loc for loc in files + dirs if loc.exists()]
+    log.info(f"depfile {args.depfile}: {len(targets)} targets, {len(deps)} dependencies")
+    write_text_file(Path(args.depfile), format_depfile(targets, deps))
+
+
+def watch_input_locs(look: "LookupPrj") -> List[Path]:
+    """Every file and directory the project was created from, collected again only after the project is updated"""
+    files, dirs = look.get_input_locs()
+    return files + dirs
+
+
+def watch_snapshot(locs: List[Path]) -> Dict[Path, Optional[float]]:
+    """Modification times of the files and directories locs"""
+    snapshot: Dict[Path, Optional[float]] = {}
+    for loc in locs:
+        try:
+            snapshot[loc] = get_file_modification_time(loc)
+        except FileNotFoundError:
+            snapshot[loc] = None
+    return snapshot
 
-    if args.file_list_type is not None:
-        for f_type_str, file_out_str in args.file_list_type:
-            f_type = string_to_FileObjType(f_type_str)
-            look.write_file_list(Path(file_out_str), f_type)
 
-    if args.file_list_vhdl_lib is not None:
-        for lib, f in args.file_list_vhdl_lib:
-            look.write_file_list(Path(f), FileObjType.VHDL, lib)
+def watch_project(look: "LookupPrj", args):
+    """Poll the project files and write the outputs again whenever they change, until interrupted"""
+    log.warning(f"watching for changes every {args.watch_interval}s (Ctrl-C to stop)")
+    locs = watch_input_locs(look)
+    snapshot = watch_snapshot(locs)
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            new_snapshot = watch_snapshot(locs)
+            if new_snapshot == snapshot:
+                continue
+            # wait for bursts of changes (e.g. git checkout) to finish
+            while True:
+                time.sleep(args.watch_debounce)
+                settled_snapshot = watch_snapshot(locs)
+                if settled_snapshot == new_snapshot:
+                    break
+                new_snapshot = settled_snapshot
+            log.info("changes detected, updating outputs")
+            try:
+                if not look.revalidate():
+                    log.info("config changed, loading project again")
+                    look = load_project(args)
+                    apply_top_args(look, args)
+                write_outputs(look, args, print_order=False)
+            except (KeyError, RuntimeError, OSError) as e:
+                log.error(f"failed to update outputs: {e}")
+            # edits can add or remove inputs (e.g. an include or a file matching a glob)
+            locs = watch_input_locs(look)
+            snapshot = watch_snapshot(locs)
+    except KeyboardInterrupt:
+        pass
 
-    if args.ext_file_list is not None:
-        look.write_ext_file_list(Path(args.ext_file_list))
 
-    if args.ext_file_list_tag is not None:
-        for tag, f in args.ext_file_list_tag:
-            look.write_ext_file_list(Path(f), tag)
+def load_project(args) -> "LookupPrj":
+    """Load the project lookup from the configuration file(s) and apply the Xilinx tool options"""
+    set_log_level_from_verbose(args)
+    log.debug(f"{HDL_DEPENDS_VERSION_NUM=}")
 
-    if args.compile_order is not None:
-        assert look.has_top_file()
-        assert isinstance(look, LookupPrj)
-        look.write_compile_order(Path(args.compile_order))
+    return load_lookup_prj(
+        [Path(c) for c in args.config_file],
+        top_lib=args.top_vhdl_lib,
+        attemp_read_pickle=not args.clear_pickle and not args.no_pickle,
+        write_pickle=not args.no_pickle,
+        x_tool_version=args.x_tool_version,
+        x_device=args.x_device,
+        snapshot=args.snapshot,
+        index=args.index,
+        project_root=None if args.project_root is None else Path(args.project_root),
+    )
 
-    if args.compile_order_path_only is not None:
-        assert look.has_top_file()
-        assert isinstance(look, LookupPrj)
-        look.write_compile_order_lib(Path(args.compile_order_path_only), None)
 
-    if args.compile_order_type is not None:
-        assert look.has_top_file()
-        assert isinstance(look, LookupPrj)
-        for f_type_str, file_out_str in args.compile_order_type:
-            f_type = string_to_FileObjType(f_type_str)
-            loc = Path(file_out_str)
-            if f_type == FileObjType.VHDL:
-                look.write_compile_order(loc, f_type)
-            else:
-                look.write_compile_order_lib(loc, LIB_DEFAULT, f_type)
+def load_lookup_prj(
+    config_locs: List[Path],
+    top_lib: Optional[str] = None,
+    attemp_read_pickle: bool = True,
+    write_pickle: bool = True,
+    x_tool_version: Optional[str] = None,
+    x_device: Optional[str] = None,
+    snapshot: bool = False,
+    index: bool = False,
+    project_root: Optional[Path] = None,
+) -> "LookupPrj":
+    """Create the project lookup from one or more configuration files and apply the Xilinx tool options.
+    With snapshot the lookups of all the configs are also cached in a single file next to the first config file,
+    with index a ProjectIndex of the project is kept there.
+    Paths in the caches are stored relative to project_root (default $HDL_DEPENDS_PROJECT_ROOT, otherwise the
+    directory of each cache file) so they still hit when the project is moved.
+    """
+    _pre_cmds_started.clear()
+    project_root = cache_project_root(project_root)
+    work_dir = Path(".")
+    config_locs = [find_config_loc(c_toml, work_dir) for c_toml in config_locs]
+    loads = ConfigLoads()
+    if snapshot:
+        loads.snapshot = ProjectSnapshot(ProjectSnapshot.toml_loc_to_snapshot_loc(config_locs[0]), project_root)
+        if attemp_read_pickle:
+            loads.snapshot.read()
+    if len(config_locs) == 1:
+        log.debug("creating top level project toml")
+        look = create_lookup_from_toml(
+            config_locs[0],
+            work_dir=work_dir,
+            attemp_read_pickle=attemp_read_pickle,
+            write_pickle=write_pickle,
+            top_lib=top_lib,
+            loads=loads,
+            project_root=project_root,
+        )
+        if not isinstance(look, LookupPrj):
+            assert isinstance(look, LookupSingular)
+            look = LookupPrj([look])
+    else:
+        look_subs = loads.load_all(
+            config_locs, attemp_read_pickle=attemp_read_pickle, write_pickle=write_pickle, top_lib=top_lib, project_root=project_root
+        )
+        look = LookupPrj(look_subs)
+    if loads.snapshot is not None and write_pickle:
+        loads.snapshot.write()
 
-    if args.compile_order_vhdl_lib is not None:
-        assert look.has_top_file()
-        assert isinstance(look, LookupPrj)
-        for lib, f in args.compile_order_vhdl_lib:
-            look.write_compile_order_lib(Path(f), lib, FileObjType.VHDL)
+    if x_tool_version is not None:
+        look.set_x_tool_version(x_tool_version)
 
-    if args.compile_order_json is not None:
-        assert look.has_top_file()
-        assert isinstance(look, LookupPrj)
-        look.write_compile_order_json(Path(args.compile_order_json))
+    if x_device is not None:
+        look.set_x_device(x_device)
+
+    # Check X files against requirements (warns on mismatches)
+    look.filter_x_files_by_requirements()
+
+    if index and write_pickle:
+        snapshot_loc = None if loads.snapshot is None else loads.snapshot.loc
+        ProjectIndex(ProjectIndex.toml_loc_to_index_loc(config_locs[0])).update(look, top_lib, x_tool_version, x_device, snapshot_loc)
+    return look
+
+
+def read_changed_files(changed: List[str]) -> List[Path]:
+    """Changed files from the command line, '-' reads them from stdin (e.g. piped from git diff --name-only)"""
+    locs = []
+    for c in changed:
+        if c == "-":
+            locs += [Path(line.strip()) for line in sys.stdin if line.strip() != ""]
+        else:
+            locs.append(Path(c))
+    return locs
+
+
+def hdldepends_affected(argv: List[str]):
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="hdldepends affected", description="List the top level files affected by changed files")
+    add_project_args(parser, config_nargs=1)
+    parser.add_argument("changed_files", nargs="*", type=str, help="Changed files, '-' reads the list from stdin")
+    parser.add_argument(
+        "--tops", nargs="+", type=str, help="Top entity names or globs (e.g. '*_tb') to check, default is every file nothing else depends on"
+    )
+    parser.add_argument("--json", type=str, help="Write the affected tops to a JSON file, '-' for stdout")
+    args = parser.parse_intermixed_args(argv)
+
+    look = load_project(args)
+    changed = read_changed_files(args.changed_files)
+    affected = look.get_affected_tops(changed, args.tops)
+
+    if args.json is not None:
+        tops_json = [{"entity": name, "path": str(f_obj.loc)} for name, f_obj in affected]
+        if args.json == "-":
+            json.dump({"affected": tops_json}, sys.stdout, indent=2)
+            print()
+        else:
+            write_text_file(Path(args.json), json.dumps({"affected": tops_json}, indent=2) + "\n")
+        return
+
+    for name, f_obj in affected:
+        if args.tops is not None:
+            print(name)
+        else:
+            print(f_obj.loc)
+
+
+def hdldepends_query(argv: List[str]):
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="hdldepends query", description="Answer questions about the project as JSON from its index (see --index), no top file is needed"
+    )
+    add_project_args(parser, config_nargs=1)
+    parser.add_argument(
+        "what",
+        choices=["entity", "package", "file", "deps", "rdeps"],
+        help="entity/package NAME: the files declaring it, file [PATH]: the files (of --lib/--type), deps/rdeps PATH: what the file uses / what uses it",
+    )
+    parser.add_argument("name", nargs="?", type=str, help="Entity/package name or file path")
+    parser.add_argument("--lib", type=str, help="Only this library")
+    parser.add_argument("--type", type=str, help="Only files of this type (vhdl, verilog, x_bd, ...)")
+    parser.add_argument(
+        "--check-sources", action="store_true", help="Also check the source files have not changed since the project was last loaded"
+    )
+    parser.add_argument("-o", "--output", type=str, help="Write the JSON to this file instead of stdout")
+    args = parser.parse_intermixed_args(argv)
+    set_log_level_from_verbose(args)
+
+    if args.name is None and args.what != "file":
+        parser.error(f"query {args.what} needs a name")
+    if args.no_pickle:
+        parser.error("query answers from the cached index, --no-pickle is not supported")
+
+    config_loc = find_config_loc(Path(args.config_file[0]), Path("."))
+    index = ProjectIndex(ProjectIndex.toml_loc_to_index_loc(config_loc))
+    if args.clear_pickle or not index.is_current(args.top_vhdl_lib, args.x_tool_version, args.x_device, args.check_sources):
+        log.info(f"index {index.loc} is out of date, loading the project")
+        # the index is written to a new file replacing this one, an open connection would still read the old one
+        index.close()
+        args.index = True
+        load_project(args)
+
+    def strip_ids(files: List[dict]) -> List[dict]:
+        return [{key: value for key, value in f.items() if key != "id"} for f in files]
+
+    if args.what in ["entity", "package"]:
+        result = {args.what: args.name, "files": strip_ids(index.files_declaring(args.what, args.name, args.lib))}
+    elif args.what == "file" and args.name is None:
+        result = {"files": strip_ids(index.file_list(lib=args.lib, file_type=args.type))}
+    else:
+        files = index.file(Path(args.name))
+        if args.lib is not None:
+            files = [f for f in files if f["library"] == args.lib]
+        if args.what == "deps":
+            for f in files:
+                f["uses"] = index.uses(f["id"])
+                f["deps"] = strip_ids(index.deps(f["id"]))
+        elif args.what == "rdeps":
+            for f in files:
+                f["rdeps"] = strip_ids(index.rdeps(f["id"]))
+        result = {"file": str(resolve_abs_path(Path(args.name))), "files": strip_ids(files)}
+    index.close()
+
+    text = json.dumps(result, indent=2) + "\n"
+    if args.output is not None:
+        write_text_file(Path(args.output), text)
+    else:
+        sys.stdout.write(text)
+
+
+def hdldepends_cache(argv: List[str]):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="hdldepends cache",
+        description="Export the pickle caches of a project to a bundle (e.g. a CI artifact) or import them from one. "
+        "Importing unpickles the caches of the bundle, only import bundles from a trusted source (e.g. your own CI).",
+    )
+    parser.add_argument(
+        "action", choices=["export", "import"], help="export: load the project and pack its caches, import: unpack the caches that match the checkout"
+    )
+    parser.add_argument("bundle", type=str, help="Bundle file (a .tar.gz)")
+    add_project_args(parser, config_nargs=1)
+    args = parser.parse_intermixed_args(argv)
+    set_log_level_from_verbose(args)
+
+    if args.no_pickle:
+        parser.error("cache works on the pickle caches, --no-pickle is not supported")
+
+    config_loc = find_config_loc(Path(args.config_file[0]), Path("."))
+    bundle_loc = Path(args.bundle)
+    project_root = cache_project_root(None if args.project_root is None else Path(args.project_root))
+    root = get_cache_bundle_root(config_loc, project_root)
+    if args.action == "export":
+        look = load_project(args)
+        snapshot_loc = ProjectSnapshot.toml_loc_to_snapshot_loc(config_loc) if args.snapshot else None
+        exported = export_cache_bundle(look, bundle_loc, root, snapshot_loc, project_root)
+        print(f"exported {exported} caches to {bundle_loc}")
+    else:
+        imported, total = import_cache_bundle(bundle_loc, root, project_root)
+        print(f"imported {imported} of {total} caches from {bundle_loc}")
+
+
+def config_loc_to_socket_loc(config_loc: Path) -> Path:
+    return config_loc.with_name("." + config_loc.stem + ".sock")
+
+
+def hdldepends_serve(argv: List[str]):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="hdldepends serve", description="Keep the project loaded and answer requests on a Unix socket")
+    add_project_args(parser, config_nargs=1)
+    parser.add_argument("--socket", type=str, help="Socket location, default is .<config name>.sock next to the config file")
+    args = parser.parse_args(argv)
+
+    socket_loc = Path(args.socket) if args.socket is not None else config_loc_to_socket_loc(Path(args.config_file[0]))
+    LookupServer(args).serve(socket_loc)
+
+
+def hdldepends_client(argv: List[str]):
+    import json
+    import socket
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="hdldepends client", description="Send a request to a running 'hdldepends serve'")
+    parser.add_argument("socket", type=str, help="Socket of the server, or its config file")
+    parser.add_argument(
+        "cmd",
+        choices=["compile-order", "compile-order-waves", "compile-order-json", "file-list", "ext-file-list", "entity-location", "ping", "shutdown"],
+        help="Request to send",
+    )
+    parser.add_argument("--top-entity", type=str, help="Top level entity for compile orders, default is the project top")
+    parser.add_argument("--top-file", type=str, help="Top level file for compile orders, default is the project top")
+    parser.add_argument("--type", type=str, help="Only files of this type (vhdl, verilog, x_bd, ...)")
+    parser.add_argument("--lib", type=str, help="Only files of this library")
+    parser.add_argument("--tag", type=str, help="External file list tag")
+    parser.add_argument("--name", type=str, help="Entity name for entity-location")
+    parser.add_argument("-o", "--output", type=str, help="Write the reply to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    socket_loc = Path(args.socket)
+    if socket_loc.suffix in [".toml", ".json", ".yaml"]:
+        socket_loc = config_loc_to_socket_loc(socket_loc)
+
+    request: Dict[str, str] = {"cmd": args.cmd}
+    if args.top_entity is not None:
+        request["top_entity"] = args.top_entity
+    if args.top_file is not None:
+        request["top_file"] = str(resolve_abs_path(Path(args.top_file)))
+    for key in ["type", "lib", "tag", "name"]:
+        if getattr(args, key) is not None:
+            request[key] = getattr(args, key)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_loc))
+        sock.sendall((json.dumps(request) + "\n").encode())
+        with sock.makefile("rb") as f:
+            reply = json.loads(f.readline())
+
+    if not reply["ok"]:
+        log.error(reply["error"])
+        sys.exit(1)
+    if args.output is not None:
+        write_text_file(Path(args.output), reply["text"])
+    else:
+        sys.stdout.write(reply["text"])
+
+
+HDL_DEPENDS_COMMANDS = {
+    "affected": hdldepends_affected,
+    "cache": hdldepends_cache,
+    "query": hdldepends_query,
+    "serve": hdldepends_serve,
+    "client": hdldepends_client,
+}
+
+
+def hdldepends():
+    import argparse
+
+    if len(sys.argv) > 1 and sys.argv[1] in HDL_DEPENDS_COMMANDS:
+        HDL_DEPENDS_COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="HDL dependency parser")
+
+    add_project_args(parser)
+    parser.add_argument("--top-file", type=str, help="Location to top level file (expects file to already be added)")
+    parser.add_argument(
+        "--top-file-type", type=extract_tuple_str, help="Expects '<type>:<file>' Location to top level file (will add the file if not already added"
+    )
+    parser.add_argument("--top-entity", type=str, help="Top level entity to use (expects entity to already be added)")
+    parser.add_argument(
+        "--top-entities",
+        nargs="+",
+        type=str,
+        help="Batch mode, compile orders for each top entity name or glob (e.g. '*_tb'). Output paths use '{top}' for the entity name",
+    )
+    parser.add_argument("--compile-order", type=str, help="Path to the compile order output file. Each line of the file contains library and paths")
+    parser.add_argument("--compile-order-path-only", type=str, help="Path to the compile order output file. File contains Paths only")
+    parser.add_argument(
+        "--compile-order-type", nargs="+", type=extract_tuple_str, help="Expects '<type>:<file>' Write compile order of passed  <type> to <file>."
+    )
+    parser.add_argument(
+        "--compile-order-vhdl-lib",
+        nargs="+",
+        type=extract_tuple_str,
+        help="Expects '<lib>:<file>' where 'file' is location to write the VHDL compile order of libary 'lib'.",
+    )
+    parser.add_argument(
+        "--compile-order-waves",
+        type=str,
+        help="Path to the compile order output file grouped in waves for parallel compilation. Each line contains wave, type, library and path",
+    )
+    parser.add_argument(
+        "--compile-order-waves-vhdl-lib",
+        nargs="+",
+        type=extract_tuple_str,
+        help="Expects '<lib>:<file>', writes the VHDL compile order of library 'lib' with the wave of each file to 'file'.",
+    )
+    parser.add_argument(
+        "--recompile-order",
+        type=str,
+        help="Path to write only the files in the compile order that changed since the last run, plus the files depending on them. Requires --recompile-manifest",
+    )
+    parser.add_argument(
+        "--recompile-manifest",
+        type=str,
+        help="Manifest (JSON) of the compile order and file hashes used by --recompile-order, updated on every run",
+    )
+    parser.add_argument("--file-list", type=str, help="Output full file list of in project")
+    parser.add_argument("--file-list-type", nargs="+", type=extract_tuple_str, help="Output full VHDL file list of in project")
+    parser.add_argument(
+        "--file-list-vhdl-lib",
+        nargs="+",
+        type=extract_tuple_str,
+        help="Expects '<lib>:<file>' where <file> is location to write the file list of VHDL library <lib>.",
+    )
+    parser.add_argument("--ext-file-list", type=str, help="external file list")
+    parser.add_argument("--ext-file-list-tag", nargs="+", type=extract_tuple_str, help="external file list for a given tag, Expects '<tag>:<file>'")
+    parser.add_argument(
+        "--compile-order-json", type=str, help="Create a complete project compile order JSON file including both compile order and external files"
+    )
+    parser.add_argument("--build-makefile", type=str, help="Write a Makefile with a stamp target per file in the compile order")
+    parser.add_argument("--build-ninja", type=str, help="Write a build.ninja with a stamp per file in the compile order")
+    parser.add_argument(
+        "--build-stamp-dir", type=str, default=".hdl_stamps", help="Directory of the stamp files of --build-makefile/--build-ninja"
+    )
+    parser.add_argument(
+        "--build-tool", choices=sorted(LookupPrj.BUILD_TOOL_CMDS.keys()), help="Compile commands of --build-makefile/--build-ninja for this simulator"
+    )
+    parser.add_argument(
+        "--build-cmd",
+        nargs=2,
+        action="append",
+        metavar=("TYPE[:LIB]", "TEMPLATE"),
+        help="Compile command template for files of TYPE (and library LIB), may use {file}, {lib}, {ver_tag} and {stamp}",
+    )
+    parser.add_argument(
+        "--build-serial-libs",
+        action="store_true",
+        help="Compile the files of a library one at a time in --build-makefile/--build-ninja (always for --build-tool ghdl and vcom)",
+    )
+    parser.add_argument(
+        "--depfile", type=str, help="Write a Makefile/ninja style depfile listing every input file of the outputs"
+    )
+    parser.add_argument("--watch", action="store_true", help="Keep running and write the outputs again whenever the project files change")
+    parser.add_argument("--watch-interval", type=float, default=1.0, help="Seconds between checks for changes in --watch mode")
+    parser.add_argument("--watch-debounce", type=float, default=0.5, help="Seconds the files must be unchanged before updating in --watch mode")
+    args = parser.parse_args()
+
+    look = load_project(args)
+    apply_top_args(look, args)
+    ok = write_outputs(look, args)
+    if args.watch:
+        watch_project(look, args)
+    elif not ok:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+"""Benchmark of the compile order of a deep and of a wide synthetic hierarchy.
+
+    PYTHONPATH=src python test/bench_compile_order.py [--deep 5000] [--depth 20 --width 500]
+
+The deep hierarchy is a chain deeper than Python's recursion limit, the wide one has width entities on each of
+depth levels, each instantiating two entities of the next level.
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+from hdldepends.hdldepends import load_lookup_prj
+from synthetic_project import write_tree
+
+
+def bench(name: str, depth: int, width: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_loc = write_tree(Path(tmp_dir), depth, width)
+        start = time.perf_counter()
+        look = load_lookup_prj([config_loc], attemp_read_pickle=False, write_pickle=False)
+        parsed = time.perf_counter()
+        order = look.compile_order
+        done = time.perf_counter()
+    assert len(order) == depth * width + 1, f"{name}: compile order has {len(order)} files"
+    print(f"{name}: {depth * width + 1} files, parse {parsed - start:.2f} s, compile order {(done - parsed) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deep", type=int, default=5000, help="Depth of the chain")
+    parser.add_argument("--depth", type=int, default=20, help="Levels of the wide hierarchy")
+    parser.add_argument("--width", type=int, default=500, help="Entities per level of the wide hierarchy")
+    args = parser.parse_args()
+
+    print(f"recursion limit {sys.getrecursionlimit()}")
+    bench("deep", args.deep, 1)
+    bench("wide", args.depth, args.width)
+
+
+if __name__ == "__main__":
+    main()
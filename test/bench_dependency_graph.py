@@ -0,0 +1,44 @@
+"""Benchmark of building the DependencyGraph of a large synthetic project once it is parsed.
+
+    PYTHONPATH=src python test/bench_dependency_graph.py [--files 50000] [--budget 1.0]
+
+Exits with an error if building the graph takes longer than the budget (in seconds).
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+from hdldepends.hdldepends import load_lookup_prj, DependencyGraph
+from synthetic_project import write_tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50000, help="Number of files (rounded to a multiple of --depth)")
+    parser.add_argument("--depth", type=int, default=50, help="Levels of the hierarchy")
+    parser.add_argument("--subs", type=int, default=4, help="Number of sub configs the files are spread over")
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds building the graph may take")
+    args = parser.parse_args()
+
+    width = max(1, args.files // args.depth)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_loc = write_tree(Path(tmp_dir), args.depth, width, subs=args.subs)
+        start = time.perf_counter()
+        look = load_lookup_prj([config_loc], attemp_read_pickle=False, write_pickle=False)
+        parsed = time.perf_counter()
+        graph = DependencyGraph.build(look)
+        built = time.perf_counter()
+        DependencyGraph.build(look)  # again, with the names already resolved
+        rebuilt = time.perf_counter() - built
+
+    n_edges = len(graph.fwd_targets)
+    print(f"{len(graph)} files, {n_edges} edges: parse {parsed - start:.1f} s, build graph {built - parsed:.3f} s, build again {rebuilt:.3f} s")
+    if built - parsed > args.budget:
+        print(f"building the graph took longer than the budget of {args.budget} s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
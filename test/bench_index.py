@@ -0,0 +1,105 @@
+"""Benchmark of the --index SQLite index against the pickle caches, for a full load and for point queries.
+
+    PYTHONPATH=src python test/bench_index.py [--files 20000] [--queries 100] [--budget 0.05]
+
+Both caches are written once, then each kind of query is timed starting from the files on disk: the pickles of the
+sub configs a query needs have to be loaded before it can answer, the index only reads the rows it needs.
+The latency of a single query (opening the index, checking it is current and answering) is also timed, in the
+process and as a `hdldepends query` run, which adds starting the interpreter. Exits with an error if the slowest
+single query in the process takes longer than the budget (in seconds).
+"""
+import os
+import sys
+import time
+import subprocess
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+from hdldepends.hdldepends import load_lookup_prj, ProjectIndex, Name
+from synthetic_project import write_tree, entity_name
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20000, help="Number of files (rounded to a multiple of --depth)")
+    parser.add_argument("--depth", type=int, default=20, help="Levels of the hierarchy")
+    parser.add_argument("--subs", type=int, default=4, help="Number of sub configs the files are spread over")
+    parser.add_argument("--queries", type=int, default=100, help="Number of entities looked up")
+    parser.add_argument("--budget", type=float, default=0.05, help="Seconds a single query in the process may take")
+    args = parser.parse_args()
+
+    width = max(1, args.files // args.depth)
+    rng = random.Random(0)
+    names = [entity_name(rng.randrange(args.depth), rng.randrange(width)) for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_loc = write_tree(Path(tmp_dir), args.depth, width, subs=args.subs)
+        t_parse, _ = timed(lambda: load_lookup_prj([config_loc], index=True))
+        print(f"{args.depth * width + 1} files: parse and write the caches {t_parse:.1f} s")
+
+        # point queries, the sub configs are loaded from their pickles when a query needs them
+        def pickle_queries():
+            look = load_lookup_prj([config_loc], write_pickle=False)
+            return [look.get_entity(Name("work", name), None) for name in names]
+
+        t_pickle_q, _ = timed(pickle_queries)
+
+        # full load, listing every file loads every sub config
+        def pickle_file_list():
+            look = load_lookup_prj([config_loc], write_pickle=False)
+            return [f_obj.loc for sub in look.iter_lookups() for f_obj in getattr(sub, "loc_2_file_obj", {}).values()]
+
+        t_pickle, locs = timed(pickle_file_list)
+        index = ProjectIndex(ProjectIndex.toml_loc_to_index_loc(config_loc))
+        t_index, rows = timed(lambda: index.is_current() and index.file_list())
+        index.close()
+        assert rows, "the index is out of date"
+        print(f"file list: pickle load {t_pickle:.3f} s ({len(locs)} files), index {t_index:.3f} s ({len(rows)} files)")
+
+        def index_queries():
+            index = ProjectIndex(ProjectIndex.toml_loc_to_index_loc(config_loc))
+            assert index.is_current()
+            found = [index.files_declaring("entity", name) for name in names]
+            index.close()
+            return found
+
+        t_index_q, found = timed(index_queries)
+        assert all(len(rows) == 1 for rows in found)
+        print(f"{args.queries} entity queries: pickle load + lookups {t_pickle_q:.3f} s, index open + staleness check + lookups {t_index_q:.3f} s")
+
+        def single_query(name):
+            index = ProjectIndex(ProjectIndex.toml_loc_to_index_loc(config_loc))
+            assert index.is_current()
+            rows = index.files_declaring("entity", name)
+            index.close()
+            return rows
+
+        latencies = sorted(timed(lambda: single_query(name))[0] for name in names)
+        median, slowest = latencies[len(latencies) // 2], latencies[-1]
+
+        # run like the hdldepends script, so the bytecode of the module is cached (python -m compiles it every run)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), PYTHONPYCACHEPREFIX=str(Path(tmp_dir) / "pycache"))
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        entry_point = "import sys; from hdldepends.hdldepends import hdldepends; sys.exit(hdldepends())"
+        cmd = [sys.executable, "-c", entry_point, "query", str(config_loc), "entity", names[0]]
+        subprocess.run(cmd, env=env, check=True, capture_output=True)  # writes the bytecode
+        t_interpreter = min(timed(lambda: subprocess.run([sys.executable, "-c", "pass"], check=True))[0] for _ in range(3))
+        t_cli = min(timed(lambda: subprocess.run(cmd, env=env, check=True, capture_output=True))[0] for _ in range(3))
+        print(
+            f"single entity query: median {median * 1000:.1f} ms, slowest {slowest * 1000:.1f} ms in the process, "
+            f"hdldepends query run {t_cli * 1000:.0f} ms (interpreter start {t_interpreter * 1000:.0f} ms)"
+        )
+        if slowest > args.budget:
+            print(f"a single query took longer than the budget of {args.budget} s")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
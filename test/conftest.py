@@ -0,0 +1,35 @@
+"""Fixtures for driving the hdldepends command line on projects in a temporary directory"""
+import os
+import sys
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+
+def run_hdldepends(
+    args: List[str], cwd: Path, check: bool = True, timeout: float = 120, stdin: Optional[str] = None
+) -> subprocess.CompletedProcess:
+    """Run `python -m hdldepends.hdldepends args` in cwd with stdin as its input, the output is returned as text"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(SRC_DIR)] + [p for p in [env.get("PYTHONPATH")] if p])
+    result = subprocess.run(
+        [sys.executable, "-m", "hdldepends.hdldepends"] + [str(arg) for arg in args],
+        cwd=cwd,
+        env=env,
+        input=stdin,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    if check:
+        assert result.returncode == 0, f"hdldepends {args} failed:\n{result.stdout}\n{result.stderr}"
+    return result
+
+
+@pytest.fixture
+def hdldepends_cli():
+    return run_hdldepends
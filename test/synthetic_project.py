@@ -0,0 +1,60 @@
+"""Synthetic VHDL projects for the benchmarks (bench_*.py) and tests"""
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+
+def write_entity(loc: Path, name: str, deps: Sequence[str] = (), packages: Sequence[str] = ()):
+    """An entity instantiating the entities deps and using the packages"""
+    text = "".join(f"library work;\nuse work.{package}.all;\n" for package in packages)
+    text += f"\nentity {name} is\nend entity;\narchitecture a of {name} is\nbegin\n"
+    for i, dep in enumerate(deps):
+        text += f" u{i}: entity work.{dep} port map (a => a);\n"
+    text += "end architecture;\n"
+    loc.write_text(text)
+
+
+def write_project(root: Path, entities: Dict[str, Sequence[str]], top: str = "top", extra_config: str = "") -> Path:
+    """Each entity (name -> the entities it instantiates) in its own file in root and a config p.toml listing the
+    files, with top as its top entity and extra_config appended. The config file is returned
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    for name, deps in entities.items():
+        write_entity(root / f"{name}.vhd", name, deps)
+    vhdl_files = ", ".join(f'"{name}.vhd"' for name in entities)
+    config_loc = root / "p.toml"
+    config_loc.write_text(f'vhdl_files = [{vhdl_files}]\ntop_entity = "{top}"\n{extra_config}')
+    return config_loc
+
+
+def file_names(loc: Path) -> List[str]:
+    """Names of the files listed in a --compile-order or --file-list output"""
+    return [Path(line.split()[-1]).name for line in loc.read_text().splitlines() if line.strip()]
+
+
+def entity_name(level: int, i: int) -> str:
+    return f"e{level}_{i}"
+
+
+def write_tree(root: Path, depth: int, width: int, subs: int = 1) -> Path:
+    """A hierarchy depth levels deep and width entities wide, the config file is returned.
+
+    Entity i of a level instantiates entities i and i + 1 (wrapping) of the next level, the top entity "top"
+    instantiates every entity of the first level. The entities are spread round robin over subs sub configs
+    (directories s0, s1, ...) each globbing its *.vhd files.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    sub_dirs = [root / f"s{s}" for s in range(subs)]
+    for s, sub_dir in enumerate(sub_dirs):
+        sub_dir.mkdir(exist_ok=True)
+        (sub_dir / "s.toml").write_text('vhdl_files_glob = ["*.vhd"]\n')
+    for level in range(depth):
+        for i in range(width):
+            deps = []
+            if level + 1 < depth:
+                deps = sorted({entity_name(level + 1, i), entity_name(level + 1, (i + 1) % width)})
+            write_entity(sub_dirs[i % subs] / f"{entity_name(level, i)}.vhd", entity_name(level, i), deps)
+    write_entity(root / "top.vhd", "top", [entity_name(0, i) for i in range(width)])
+    config_loc = root / "p.toml"
+    sub_list = ", ".join(f'"s{s}/s.toml"' for s in range(subs))
+    config_loc.write_text(f'sub = [{sub_list}]\nvhdl_files = ["top.vhd"]\ntop_entity = "top"\n')
+    return config_loc
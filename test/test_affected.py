@@ -0,0 +1,67 @@
+"""hdldepends affected: the tops whose compile order includes a changed file"""
+import json
+from pathlib import Path
+
+from synthetic_project import write_entity, write_project
+
+ENTITIES = {"leaf": [], "mid": ["leaf"], "other": [], "a_tb": ["mid"], "b_tb": ["leaf"], "c_tb": ["other"], "top": ["mid", "other"]}
+
+
+def make_project(root: Path):
+    write_project(root, ENTITIES)
+    (root / "pkg.vhd").write_text("package pkg is\nend package;\n")
+    write_entity(root / "other.vhd", "other", packages=["pkg"])
+    config = (root / "p.toml").read_text().replace("vhdl_files = [", 'vhdl_files = ["pkg.vhd", ')
+    (root / "p.toml").write_text(config)
+
+
+def affected(hdldepends_cli, root: Path, *args: str, stdin=None) -> list:
+    result = hdldepends_cli(["affected", "p.toml"] + list(args), root, stdin=stdin)
+    return sorted(Path(line).name for line in result.stdout.splitlines() if line.strip())
+
+
+def test_changed_leaf(hdldepends_cli, tmp_path):
+    make_project(tmp_path)
+    # every file nothing depends on is a top
+    assert affected(hdldepends_cli, tmp_path, "leaf.vhd") == ["a_tb.vhd", "b_tb.vhd", "top.vhd"]
+    assert affected(hdldepends_cli, tmp_path, "mid.vhd") == ["a_tb.vhd", "top.vhd"]
+    assert affected(hdldepends_cli, tmp_path, "a_tb.vhd") == ["a_tb.vhd"]
+
+
+def test_changed_package(hdldepends_cli, tmp_path):
+    make_project(tmp_path)
+    assert affected(hdldepends_cli, tmp_path, "pkg.vhd") == ["c_tb.vhd", "top.vhd"]
+
+
+def test_unused_or_unknown_file_affects_nothing(hdldepends_cli, tmp_path):
+    make_project(tmp_path)
+    assert affected(hdldepends_cli, tmp_path, "README.md") == []
+
+
+def test_changed_files_from_stdin(hdldepends_cli, tmp_path):
+    make_project(tmp_path)
+    # as piped from git diff --name-only
+    assert affected(hdldepends_cli, tmp_path, "-", stdin="pkg.vhd\n\nmid.vhd\n") == ["a_tb.vhd", "c_tb.vhd", "top.vhd"]
+    assert affected(hdldepends_cli, tmp_path, "-", "b_tb.vhd", stdin="other.vhd\n") == ["b_tb.vhd", "c_tb.vhd", "top.vhd"]
+
+
+def test_tops_globs(hdldepends_cli, tmp_path):
+    make_project(tmp_path)
+    # the entity names are printed
+    assert affected(hdldepends_cli, tmp_path, "leaf.vhd", "--tops", "*_tb") == ["a_tb", "b_tb"]
+    assert affected(hdldepends_cli, tmp_path, "leaf.vhd", "--tops", "a_*", "top") == ["a_tb", "top"]
+    assert affected(hdldepends_cli, tmp_path, "pkg.vhd", "--tops", "*_tb") == ["c_tb"]
+
+
+def test_json(hdldepends_cli, tmp_path):
+    make_project(tmp_path)
+    hdldepends_cli(["affected", "p.toml", "mid.vhd", "--tops", "*_tb", "top", "--json", "affected.json"], tmp_path)
+    tops = json.loads((tmp_path / "affected.json").read_text())["affected"]
+    assert sorted(tops, key=lambda top: top["entity"]) == [
+        {"entity": "a_tb", "path": str((tmp_path / "a_tb.vhd").resolve())},
+        {"entity": "top", "path": str((tmp_path / "top.vhd").resolve())},
+    ]
+
+    result = hdldepends_cli(["affected", "p.toml", "other.vhd", "--json", "-"], tmp_path)
+    tops = json.loads(result.stdout)["affected"]
+    assert sorted(Path(top["path"]).name for top in tops) == ["c_tb.vhd", "top.vhd"]
@@ -0,0 +1,78 @@
+"""--build-makefile/--build-ninja: running the generated build files with a logging compile command"""
+import shutil
+import subprocess
+from pathlib import Path
+from typing import List
+
+import pytest
+
+PKG_A = "package pkg_a is\n  constant W : integer := {w};\nend package;\n"
+PKG_B = "library work;\nuse work.pkg_a.all;\n\npackage pkg_b is\n  constant W2 : integer := W * 2;\nend package;\n"
+ENTITY_C = "library work;\nuse work.pkg_b.all;\n\nentity c is\nend entity;\narchitecture a of c is\nbegin\nend architecture;\n"
+ENTITY_D = "\nentity d is\nend entity;\narchitecture a of d is\nbegin\nend architecture;\n"
+ENTITY_TOP = (
+    "\nentity top is\nend entity;\narchitecture a of top is\nbegin\n u0: entity work.c port map (a => a);\n u1: entity work.d port map (a => a);\nend architecture;\n"
+)
+BUILD_CMD = ["--build-cmd", "vhdl", "echo {file} >> compile.log"]
+
+
+def write_project(root: Path):
+    (root / "a.vhd").write_text(PKG_A.format(w=8))
+    (root / "b.vhd").write_text(PKG_B)
+    (root / "c.vhd").write_text(ENTITY_C)
+    (root / "d.vhd").write_text(ENTITY_D)
+    (root / "top.vhd").write_text(ENTITY_TOP)
+    (root / "p.toml").write_text('vhdl_files = ["a.vhd", "b.vhd", "c.vhd", "d.vhd", "top.vhd"]\ntop_entity = "top"\n')
+
+
+def build(root: Path, cmd: List[str]) -> List[str]:
+    """Run the build, the names of the files compiled by it are returned in order"""
+    log = root / "compile.log"
+    log.unlink(missing_ok=True)
+    subprocess.run(cmd, cwd=root, check=True, capture_output=True, timeout=60)
+    if not log.exists():
+        return []
+    return [Path(line).name for line in log.read_text().splitlines() if line.strip()]
+
+
+def check_build(hdldepends_cli, root: Path, args: List[str], cmd: List[str]):
+    write_project(root)
+    hdldepends_cli(["p.toml", "--no-pickle"] + args + BUILD_CMD, cwd=root)
+
+    compiled = build(root, cmd)
+    assert sorted(compiled) == ["a.vhd", "b.vhd", "c.vhd", "d.vhd", "top.vhd"]
+    assert compiled.index("a.vhd") < compiled.index("b.vhd") < compiled.index("c.vhd") < compiled.index("top.vhd")
+    assert compiled.index("d.vhd") < compiled.index("top.vhd")
+    assert build(root, cmd) == []
+
+    # b and everything using it compiles again, a and d do not
+    (root / "b.vhd").write_text(PKG_B + "-- comment\n")
+    assert build(root, cmd) == ["b.vhd", "c.vhd", "top.vhd"]
+    (root / "d.vhd").write_text(ENTITY_D + "-- comment\n")
+    assert build(root, cmd) == ["d.vhd", "top.vhd"]
+    assert build(root, cmd) == []
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+@pytest.mark.parametrize("serial", [False, True])
+def test_makefile_builds_in_order_and_incrementally(hdldepends_cli, tmp_path, serial):
+    args = ["--build-makefile", "Makefile"] + (["--build-serial-libs"] if serial else [])
+    check_build(hdldepends_cli, tmp_path, args, ["make", "-j4"])
+
+
+@pytest.mark.skipif(shutil.which("ninja") is None, reason="ninja is not installed")
+@pytest.mark.parametrize("serial", [False, True])
+def test_ninja_builds_in_order_and_incrementally(hdldepends_cli, tmp_path, serial):
+    args = ["--build-ninja", "build.ninja"] + (["--build-serial-libs"] if serial else [])
+    check_build(hdldepends_cli, tmp_path, args, ["ninja", "-j4"])
+
+
+def test_serial_libs_chain_the_files_of_a_library(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    hdldepends_cli(["p.toml", "--no-pickle", "--build-tool", "ghdl", "--build-makefile", "Makefile", "--build-ninja", "build.ninja"], cwd=tmp_path)
+
+    order_only = [line for line in (tmp_path / "Makefile").read_text().splitlines() if ": | " in line]
+    assert len(order_only) == 4  # every file of work after the first waits for the previous one
+    ninja = (tmp_path / "build.ninja").read_text()
+    assert "pool hdl_lib_work\n  depth = 1\n" in ninja
+    assert ninja.count("  pool = hdl_lib_work\n") == 5
@@ -0,0 +1,61 @@
+"""hdldepends cache export/import"""
+import io
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from hdldepends.hdldepends import HDL_DEPENDS_VERSION_NUM, load_cache, import_cache_bundle
+from synthetic_project import write_project, file_names
+
+
+def test_export_and_import_into_another_checkout(hdldepends_cli, tmp_path):
+    write_project(tmp_path / "a", {"top": ["b"], "b": []})
+    result = hdldepends_cli(["cache", "export", tmp_path / "bundle.tar.gz", "p.toml"], cwd=tmp_path / "a")
+    assert "exported 1 caches" in result.stdout
+
+    (tmp_path / "b").mkdir()
+    for name in ["top.vhd", "b.vhd", "p.toml"]:
+        shutil.copy(tmp_path / "a" / name, tmp_path / "b" / name)  # new modification times, like a checkout
+    result = hdldepends_cli(["cache", "import", tmp_path / "bundle.tar.gz", "p.toml"], cwd=tmp_path / "b")
+    assert "imported 1 of 1 caches" in result.stdout
+
+    result = hdldepends_cli(["p.toml", "--compile-order", "order.txt", "-vv"], cwd=tmp_path / "b")
+    assert "loaded from .p.pickle" in result.stdout + result.stderr
+    assert "new modification time" not in result.stdout + result.stderr, "the files are known to be unchanged"
+    assert file_names(tmp_path / "b" / "order.txt") == ["b.vhd", "top.vhd"]
+
+
+class RunsCode:
+    def __init__(self, marker: Path):
+        self.marker = marker
+
+    def __reduce__(self):
+        return os.system, (f"touch {self.marker}",)
+
+
+def test_cache_can_not_call_functions(tmp_path):
+    data = pickle.dumps(RunsCode(tmp_path / "ran"))
+    with pytest.raises(pickle.UnpicklingError, match="not allowed in a cache"):
+        load_cache(io.BytesIO(data), tmp_path / ".p.pickle")
+    assert not (tmp_path / "ran").exists()
+
+
+def test_import_skips_a_cache_that_calls_functions(tmp_path):
+    data = pickle.dumps(RunsCode(tmp_path / "ran"))
+    entry = {"kind": "snapshot", "cache": ".p.snapshot.pickle", "sha256": hashlib.sha256(data).hexdigest()}
+    manifest = json.dumps({"version": HDL_DEPENDS_VERSION_NUM, "project_root": False, "entries": [entry]}).encode()
+    with tarfile.open(tmp_path / "bundle.tar.gz", "w:gz") as bundle:
+        for name, member in [("manifest.json", manifest), (entry["cache"], data)]:
+            info = tarfile.TarInfo(name)
+            info.size = len(member)
+            bundle.addfile(info, io.BytesIO(member))
+
+    assert import_cache_bundle(tmp_path / "bundle.tar.gz", tmp_path) == (0, 1)
+    assert not (tmp_path / "ran").exists()
+    assert not (tmp_path / ".p.snapshot.pickle").exists()
@@ -0,0 +1,52 @@
+"""Pickle caches still hit after the workspace is moved (paths are stored relative to the project)"""
+import os
+import shutil
+from pathlib import Path
+
+from hdldepends.hdldepends import load_lookup_prj
+from synthetic_project import write_entity, write_project
+
+
+def make_project(root: Path):
+    write_project(root, {"top": ["b"], "b": [], "c": []})
+
+
+def run(hdldepends_cli, root: Path):
+    result = hdldepends_cli(["p.toml", "--compile-order", "order.txt", "-vv"], cwd=root)
+    order = [line.split()[-1] for line in (root / "order.txt").read_text().splitlines() if line.strip()]
+    return order, result.stdout + result.stderr
+
+
+def test_moved_and_touched_workspace_hits_the_cache(hdldepends_cli, tmp_path):
+    make_project(tmp_path / "a")
+    run(hdldepends_cli, tmp_path / "a")
+    shutil.move(tmp_path / "a", tmp_path / "b")
+    root = tmp_path / "b"
+    for loc in root.glob("*.vhd"):
+        os.utime(loc)  # as after a checkout
+
+    order, log_text = run(hdldepends_cli, root)
+    assert order == [str(root / "b.vhd"), str(root / "top.vhd")]
+    assert "loaded from .p.pickle" in log_text
+    assert "new modification time but the same content" in log_text
+    assert "dependencies have changed" not in log_text
+
+
+def test_moved_workspace_parses_changed_files_again(hdldepends_cli, tmp_path):
+    make_project(tmp_path / "a")
+    run(hdldepends_cli, tmp_path / "a")
+    shutil.move(tmp_path / "a", tmp_path / "b")
+    root = tmp_path / "b"
+    write_entity(root / "top.vhd", "top", ["c"])
+
+    order, log_text = run(hdldepends_cli, root)
+    assert order == [str(root / "c.vhd"), str(root / "top.vhd")]
+    assert "loaded from .p.pickle" in log_text
+
+
+def test_files_are_only_hashed_for_caches(tmp_path):
+    make_project(tmp_path / "a")
+    look = load_lookup_prj([tmp_path / "a" / "p.toml"], attemp_read_pickle=False, write_pickle=False)
+    f_objs = list(look.iter_file_objs())
+    assert len(f_objs) == 3
+    assert all(f_obj.content_hash is None for f_obj in f_objs)
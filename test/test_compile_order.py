@@ -0,0 +1,24 @@
+"""Compile order of a dependency cycle and of a hierarchy deeper than the recursion limit"""
+import sys
+
+from hdldepends import Project
+from synthetic_project import file_names, write_project, write_tree
+
+
+def test_cycle_is_reported_and_ordered_deterministically(hdldepends_cli, tmp_path):
+    write_project(tmp_path, {"top": ["a"], "a": ["b"], "b": ["a"]})
+    orders = []
+    for i in range(3):
+        result = hdldepends_cli(["p.toml", "--no-pickle", "--compile-order", f"co{i}.txt"], cwd=tmp_path)
+        cycle = f"Dependency cycle, compile order may be incorrect for files: {tmp_path / 'a.vhd'} -> {tmp_path / 'b.vhd'}"
+        assert cycle in result.stderr
+        orders.append(file_names(tmp_path / f"co{i}.txt"))
+    assert orders[0] == ["b.vhd", "a.vhd", "top.vhd"]
+    assert orders[1:] == [orders[0], orders[0]]
+
+
+def test_chain_deeper_than_the_recursion_limit(tmp_path):
+    depth = sys.getrecursionlimit() + 500
+    config_loc = write_tree(tmp_path, depth=depth, width=1)
+    order = [f.path.name for f in Project(config_loc, use_cache=False, write_cache=False).compile_order()]
+    assert order == [f"e{level}_0.vhd" for level in reversed(range(depth))] + ["top.vhd"]
@@ -0,0 +1,20 @@
+"""--compile-order-json, made in the same pass over the compile order as the other outputs"""
+import json
+
+from synthetic_project import write_project, file_names
+
+
+def test_compile_order_json(hdldepends_cli, tmp_path):
+    config_loc = write_project(
+        tmp_path, {"top": ["a", "b"], "a": ["b"], "b": []}, extra_config='ext_files = ["ext/run.tcl"]\n'
+    )
+    hdldepends_cli([config_loc, "--compile-order", "co.txt", "--compile-order-json", "co.json"], tmp_path)
+    out = json.loads((tmp_path / "co.json").read_text())
+
+    ext, *files = out["files"]
+    assert ext == {"type": "EXTERNAL", "file_ext": "TCL", "path": str((tmp_path / "ext" / "run.tcl").resolve())}
+    assert [entry["path"].split("/")[-1] for entry in files] == file_names(tmp_path / "co.txt")
+    assert [entry["wave"] for entry in files] == [0, 1, 2]
+    assert [entry.get("is_top", False) for entry in files] == [False, False, True]
+    assert all(entry["type"] == "VHDL" and entry["library"] == "work" for entry in files)
+    assert out["critical_path"] == 3
@@ -0,0 +1,45 @@
+"""--compile-order-waves: the files of a wave only depend on files in earlier waves"""
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+from synthetic_project import write_project
+
+
+def random_dag(n: int, seed: int) -> Dict[str, List[str]]:
+    """n entities, each instantiating up to 3 of the entities before it, and a top instantiating every entity"""
+    rng = random.Random(seed)
+    entities = {}
+    for i in range(n):
+        entities[f"e{i}"] = sorted({f"e{rng.randrange(i)}" for _ in range(rng.randrange(4))}) if i > 0 else []
+    entities["top"] = list(entities)
+    return entities
+
+
+def longest_chain(entities: Dict[str, List[str]], name: str, memo: Dict[str, int]) -> int:
+    """Number of files in the longest chain of dependencies ending at name"""
+    if name not in memo:
+        memo[name] = 1 + max((longest_chain(entities, dep, memo) for dep in entities[name]), default=0)
+    return memo[name]
+
+
+def test_waves_follow_the_dependencies(hdldepends_cli, tmp_path):
+    for seed in range(3):
+        root = tmp_path / str(seed)
+        entities = random_dag(40, seed)
+        write_project(root, entities)
+        hdldepends_cli(["p.toml", "--compile-order-waves", "waves.txt", "--compile-order-json", "co.json"], root)
+
+        wave_of = {}
+        for line in (root / "waves.txt").read_text().splitlines():
+            wave_of[Path(line.split()[-1]).stem] = int(line.split()[0])
+        assert sorted(wave_of) == sorted(entities)
+        for name, deps in entities.items():
+            # a file is in the wave after the last of its dependencies, so no wave waits longer than it has to
+            assert all(wave_of[dep] < wave_of[name] for dep in deps), name
+            assert wave_of[name] == max((wave_of[dep] + 1 for dep in deps), default=0), name
+
+        critical_path = longest_chain(entities, "top", {})
+        assert len(set(wave_of.values())) == critical_path
+        assert json.loads((root / "co.json").read_text())["critical_path"] == critical_path
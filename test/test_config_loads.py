@@ -0,0 +1,35 @@
+"""Loading the configs of a project with subs"""
+from pathlib import Path
+
+from synthetic_project import write_entity, file_names
+
+
+def write_config(root: Path, name: str, subs=()):
+    write_entity(root / f"{name}.vhd", name)
+    sub_list = ", ".join(f'"{sub}.toml"' for sub in subs)
+    (root / f"{name}.toml").write_text(f'sub = [{sub_list}]\nvhdl_files = ["{name}.vhd"]\n')
+
+
+def test_sub_cycle_through_other_threads_is_an_error(hdldepends_cli, tmp_path):
+    # a and b load in different threads and each waits for the other
+    write_config(tmp_path, "a", ["b"])
+    write_config(tmp_path, "b", ["a"])
+    write_config(tmp_path, "prj", ["a", "b"])
+    for _ in range(5):
+        result = hdldepends_cli(["prj.toml", "--no-pickle", "--file-list", "files.txt"], cwd=tmp_path, check=False, timeout=60)
+        assert result.returncode != 0
+        assert "is a sub of itself" in result.stdout + result.stderr
+
+
+def test_shared_sub_is_not_a_cycle(hdldepends_cli, tmp_path):
+    write_config(tmp_path, "c")
+    write_config(tmp_path, "a", ["c"])
+    write_config(tmp_path, "b", ["c"])
+    write_config(tmp_path, "prj", ["a", "b"])
+    result = hdldepends_cli(["prj.toml", "--no-pickle", "--file-list", "files.txt", "-vv"], cwd=tmp_path)
+    assert set(file_names(tmp_path / "files.txt")) == {"a.vhd", "b.vhd", "c.vhd", "prj.vhd"}
+    # c is loaded once, by the thread of a or of b, the other waits for it
+    log_lines = result.stderr.splitlines()
+    assert len([line for line in log_lines if line.startswith("[DEBUG] config loc c.toml ")]) == 1
+    # the threads write whole lines
+    assert [line for line in log_lines if line.startswith("[") and "][" in line.split(" ")[0]] == []
@@ -0,0 +1,60 @@
+"""The integer id DependencyGraph with its CSR edge arrays"""
+from pathlib import Path
+
+import pytest
+
+from hdldepends import Project
+from hdldepends.hdldepends import EdgeKind, Name
+from synthetic_project import write_entity
+
+
+@pytest.fixture
+def look(tmp_path: Path):
+    # top -> a -> b, top uses pkg, b and pkg are both declared in units.vhd, u is not used
+    write_entity(tmp_path / "top.vhd", "top", ["a"], packages=["pkg"])
+    write_entity(tmp_path / "a.vhd", "a", ["b"])
+    write_entity(tmp_path / "u.vhd", "u", ["a"])
+    (tmp_path / "units.vhd").write_text(
+        "package pkg is\nend package;\n\nentity b is\nend entity;\narchitecture a of b is\nbegin\nend architecture;\n"
+    )
+    (tmp_path / "p.toml").write_text('vhdl_files = ["top.vhd", "a.vhd", "u.vhd", "units.vhd"]\ntop_entity = "top"\n')
+    return Project(tmp_path / "p.toml", use_cache=False, write_cache=False).look
+
+
+def file_id(graph, look, entity: str) -> int:
+    return graph.id_of(look.get_entity(Name("work", entity), f_obj_required_by=None))
+
+
+def test_edges_match_the_resolved_deps(look):
+    graph = look.get_dependency_graph()
+    edges = set()
+    for i, f_obj in enumerate(graph.f_objs):
+        resolved = look.resolve_file_deps(f_obj)
+        expected = [(graph.id_of(dep), kind) for dep, kind in zip(resolved.f_objs, resolved.kinds)]
+        expected += [(graph.ids_of_loc(dep)[0], EdgeKind.DIRECT) for dep in f_obj.direct_deps]
+        assert graph.deps(i) == expected
+        edges.update((i, target, kind) for target, kind in expected)
+    assert len(edges) == len(graph.fwd_targets)
+    assert {(source, i, kind) for i in range(len(graph)) for source, kind in graph.rdeps(i)} == edges
+
+    top, a, b = (file_id(graph, look, name) for name in ["top", "a", "b"])
+    assert sorted(graph.deps(top)) == sorted([(a, EdgeKind.ENTITY), (b, EdgeKind.PACKAGE)])
+    assert sorted(source for source, _ in graph.rdeps(b)) == sorted([top, a])
+
+
+def test_reachable_excludes_unrelated_files(look):
+    graph = look.get_dependency_graph()
+    top, a, b, u = (file_id(graph, look, name) for name in ["top", "a", "b", "u"])
+    assert [i for i, flag in enumerate(graph.reachable([top])) if flag] == sorted([top, a, b])
+    assert [i for i, flag in enumerate(graph.reachable([a])) if flag] == sorted([a, b])
+    assert [i for i, flag in enumerate(graph.reachable([b], reverse=True)) if flag] == sorted([top, a, b, u])
+    assert [i for i, flag in enumerate(graph.reachable([top], reverse=True)) if flag] == [top]
+
+
+def test_ids_of_loc_for_a_file_of_several_units(look, tmp_path):
+    graph = look.get_dependency_graph()
+    b = file_id(graph, look, "b")
+    assert graph.ids_of_loc(tmp_path / "units.vhd") == [b]
+    assert graph.id_of(look.get_vhdl_package(Name("work", "pkg"), f_obj_required_by=None)) == b
+    assert graph.f_objs[b].loc.name == "units.vhd"
+    assert graph.ids_of_loc(tmp_path / "missing.vhd") == []
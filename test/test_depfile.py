@@ -0,0 +1,52 @@
+"""--depfile: the outputs of a run depend on every input they were made from"""
+from pathlib import Path
+from typing import List, Tuple
+
+from synthetic_project import write_entity
+
+
+def write_project(root: Path):
+    """A top config with a glob and a sub config whose files come from a file list"""
+    (root / "src").mkdir(parents=True)
+    (root / "sub").mkdir()
+    write_entity(root / "src" / "top.vhd", "top", ["leaf"], packages=["pkg"])
+    (root / "src" / "pkg.vhd").write_text("package pkg is\nend package;\n")
+    write_entity(root / "sub" / "leaf.vhd", "leaf")
+    write_entity(root / "sub" / "unlisted.vhd", "unlisted")
+    (root / "sub" / "files.txt").write_text("leaf.vhd\n")
+    (root / "sub" / "s.toml").write_text('vhdl_files_file = ["files.txt"]\n')
+    (root / "p.toml").write_text('sub = ["sub/s.toml"]\nvhdl_files_glob = ["src/*.vhd"]\ntop_entity = "top"\n')
+
+
+def read_depfile(loc: Path) -> Tuple[List[str], List[str]]:
+    """The targets and dependencies of the single rule of a depfile"""
+    text = loc.read_text().replace("\\\n", " ")
+    targets, deps = text.split(":", 1)
+    return targets.split(), deps.split()
+
+
+def test_inputs_are_dependencies(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    hdldepends_cli(["p.toml", "--compile-order", "co.txt", "--file-list", "files.out", "--depfile", "co.d"], tmp_path)
+    targets, deps = read_depfile(tmp_path / "co.d")
+    assert sorted(targets) == ["co.txt", "files.out"]
+
+    deps = {Path(dep).resolve() for dep in deps}
+    configs = ["p.toml", "sub/s.toml"]
+    file_lists = ["sub/files.txt"]
+    glob_dirs = ["src"]
+    sources = ["src/top.vhd", "src/pkg.vhd", "sub/leaf.vhd"]
+    expected = configs + file_lists + glob_dirs + sources
+    for loc in expected:
+        assert (tmp_path / loc).resolve() in deps, loc
+    # not an input of the project
+    assert (tmp_path / "sub" / "unlisted.vhd").resolve() not in deps
+
+
+def test_depfile_is_the_target_without_outputs(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    result = hdldepends_cli(["p.toml", "--depfile", "deps.d"], tmp_path)
+    assert "using the depfile as the target" in result.stderr
+    targets, deps = read_depfile(tmp_path / "deps.d")
+    assert targets == ["deps.d"]
+    assert str((tmp_path / "p.toml").resolve()) in [str(Path(dep).resolve()) for dep in deps]
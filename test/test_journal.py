@@ -0,0 +1,103 @@
+"""The journal of changed files appended instead of saving the pickle cache again"""
+import pickle
+from pathlib import Path
+
+from hdldepends.hdldepends import LookupSingular
+from synthetic_project import write_entity, write_project, file_names
+
+
+def compile_order(hdldepends_cli, root: Path, verbose: bool = False):
+    result = hdldepends_cli(["p.toml", "--compile-order", "order.txt"] + (["-vv"] if verbose else []), cwd=root)
+    if verbose:
+        return file_names(root / "order.txt"), result.stdout + result.stderr
+    return file_names(root / "order.txt")
+
+
+def make_project(root: Path):
+    write_project(root, {"top": ["b"], "b": [], "c": []})
+    return root / ".p.pickle", root / ".p.journal"
+
+
+def test_changes_are_journaled_and_replayed(hdldepends_cli, tmp_path):
+    pickle_loc, journal_loc = make_project(tmp_path)
+    assert compile_order(hdldepends_cli, tmp_path) == ["b.vhd", "top.vhd"]
+    pickle_identity = LookupSingular.pickle_identity(pickle_loc)
+    assert not journal_loc.exists()
+
+    write_entity(tmp_path / "top.vhd", "top", ["c"])
+    assert compile_order(hdldepends_cli, tmp_path) == ["c.vhd", "top.vhd"]
+    assert journal_loc.is_file()
+    assert LookupSingular.pickle_identity(pickle_loc) == pickle_identity, "the pickle is not written again"
+
+    # the replayed journal has the change, so nothing is parsed again
+    order, log_text = compile_order(hdldepends_cli, tmp_path, verbose=True)
+    assert order == ["c.vhd", "top.vhd"]
+    assert "replayed 1 records from" in log_text
+    assert "passing VHDL file" not in log_text
+
+
+def test_compact_journal(hdldepends_cli, tmp_path):
+    pickle_loc, journal_loc = make_project(tmp_path)
+    compile_order(hdldepends_cli, tmp_path)
+    write_entity(tmp_path / "top.vhd", "top", ["c"])
+    compile_order(hdldepends_cli, tmp_path)
+
+    assert LookupSingular.compact_journal(journal_loc, pickle_loc)
+    assert not journal_loc.exists()
+    assert not LookupSingular.journal_loc_to_lock_loc(journal_loc).exists()
+    assert compile_order(hdldepends_cli, tmp_path) == ["c.vhd", "top.vhd"]
+
+
+def test_compact_journal_leaves_a_locked_journal(hdldepends_cli, tmp_path):
+    pickle_loc, journal_loc = make_project(tmp_path)
+    compile_order(hdldepends_cli, tmp_path)
+    write_entity(tmp_path / "top.vhd", "top", ["c"])
+    compile_order(hdldepends_cli, tmp_path)
+    pickle_identity = LookupSingular.pickle_identity(pickle_loc)
+
+    lock_loc = LookupSingular.acquire_journal_lock(journal_loc)
+    assert lock_loc is not None
+    assert not LookupSingular.compact_journal(journal_loc, pickle_loc)
+    assert journal_loc.is_file()
+    assert LookupSingular.pickle_identity(pickle_loc) == pickle_identity
+    lock_loc.unlink()
+    assert LookupSingular.compact_journal(journal_loc, pickle_loc)
+
+
+def test_pickle_saved_meanwhile_is_not_replaced(tmp_path):
+    pickle_loc = tmp_path / ".p.pickle"
+    pickle_loc.write_bytes(b"saved by another process")
+    assert not LookupSingular.write_pickle_file(pickle_loc, {"new": "pickle"}, replace_if=lambda: False)
+    assert pickle_loc.read_bytes() == b"saved by another process"
+    assert list(tmp_path.iterdir()) == [pickle_loc]
+
+
+class Touch:
+    """Unpickling this creates the file loc"""
+
+    def __init__(self, loc: Path):
+        self.loc = loc
+
+    def __reduce__(self):
+        return open, (str(self.loc), "w")
+
+
+def test_journal_is_never_unpickled_beyond_the_cache_types(hdldepends_cli, tmp_path):
+    pickle_loc, journal_loc = make_project(tmp_path)
+    compile_order(hdldepends_cli, tmp_path)
+    marker = tmp_path / "unpickled"
+
+    # a pickle where the header should be is not loaded at all
+    journal_loc.write_bytes(pickle.dumps(Touch(marker)))
+    order, log_text = compile_order(hdldepends_cli, tmp_path, verbose=True)
+    assert order == ["b.vhd", "top.vhd"]
+    assert "is for a different pickle" in log_text
+    assert LookupSingular.read_journal_identity(journal_loc) is None
+
+    # a record after a valid header goes through the restricted unpickler
+    header = LookupSingular.journal_header(LookupSingular.pickle_identity(pickle_loc))
+    journal_loc.write_bytes(header + pickle.dumps(Touch(marker)))
+    order, log_text = compile_order(hdldepends_cli, tmp_path, verbose=True)
+    assert order == ["b.vhd", "top.vhd"]
+    assert "is not allowed in a cache" in log_text
+    assert not marker.exists()
@@ -0,0 +1,95 @@
+"""Sub configs are only loaded from their pickles when the project needs them"""
+from pathlib import Path
+from typing import List
+
+from hdldepends import Project
+from hdldepends.hdldepends import LazyLookup
+from synthetic_project import file_names, write_entity
+
+
+def write_project(root: Path):
+    for sub, entity in [("used", "u"), ("unused", "x")]:
+        (root / sub).mkdir()
+        (root / sub / "s.toml").write_text('vhdl_files_glob = ["*.vhd"]\n')
+        write_entity(root / sub / f"{entity}.vhd", entity)
+    write_entity(root / "top.vhd", "top", ["u"])
+    (root / "p.toml").write_text('sub = ["used/s.toml", "unused/s.toml"]\nvhdl_files = ["top.vhd"]\ntop_entity = "top"\n')
+
+
+def sub_log(hdldepends_cli, root: Path) -> List[str]:
+    """The log lines about sub configs of a verbose run"""
+    result = hdldepends_cli(["p.toml", "-v"], cwd=root)
+    return [line for line in (result.stdout + result.stderr).splitlines() if "sub config" in line]
+
+
+def test_unneeded_sub_is_not_loaded(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    sub_log(hdldepends_cli, tmp_path)  # writes the pickles
+
+    lines = sub_log(hdldepends_cli, tmp_path)
+    assert any("loading sub config used" in line for line in lines)
+    assert not any("unused" in line for line in lines)
+
+
+def test_stale_summary_loads_the_sub(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    sub_log(hdldepends_cli, tmp_path)
+
+    # the files of the sub come from its config, so the summary can no longer say what the sub holds
+    (tmp_path / "unused" / "s.toml").write_text('vhdl_files_glob = ["*.vhd"]\n# comment\n')
+    lines = sub_log(hdldepends_cli, tmp_path)
+    assert any("summary of sub config unused" in line and "out of date" in line for line in lines)
+    assert any("loading sub config unused" in line for line in lines)
+
+    # the new summary is current again
+    assert not any("unused" in line for line in sub_log(hdldepends_cli, tmp_path))
+
+
+def test_source_edit_does_not_load_the_sub(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    sub_log(hdldepends_cli, tmp_path)
+
+    (tmp_path / "unused" / "x.vhd").write_text((tmp_path / "unused" / "x.vhd").read_text() + "-- comment\n")
+    assert not any("unused" in line for line in sub_log(hdldepends_cli, tmp_path))
+
+
+def test_name_declared_by_a_source_edit_is_found(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    sub_log(hdldepends_cli, tmp_path)
+
+    # y is not in the summary of the unused sub, not finding it anywhere checks the source files of the subs
+    (tmp_path / "unused" / "x.vhd").write_text((tmp_path / "unused" / "x.vhd").read_text() + "\nentity y is\nend entity;\n")
+    write_entity(tmp_path / "top.vhd", "top", ["u", "y"])
+    lines = sub_log(hdldepends_cli, tmp_path)
+    assert any("summary of sub config unused" in line and "source files changed" in line for line in lines)
+    hdldepends_cli(["p.toml", "--compile-order", "co.txt"], cwd=tmp_path)
+    assert file_names(tmp_path / "co.txt") == ["u.vhd", "x.vhd", "top.vhd"]
+
+    # the parent's pickle was saved with the new summary
+    assert not any("summary of sub config unused" in line for line in sub_log(hdldepends_cli, tmp_path))
+
+
+def unloaded_subs(project: Project) -> List[str]:
+    """The sub configs of the project that are not loaded"""
+    return sorted(str(sub.toml_loc) for sub in project.look.look_subs if isinstance(sub, LazyLookup) and sub.look is None)
+
+
+def test_revalidate_does_not_load_unneeded_subs(hdldepends_cli, tmp_path, monkeypatch):
+    write_project(tmp_path)
+    sub_log(hdldepends_cli, tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    project = Project("p.toml")
+    assert project.revalidate() is False
+    assert unloaded_subs(project) == ["unused/s.toml", "used/s.toml"]
+    assert [f.path.name for f in project.compile_order()] == ["u.vhd", "top.vhd"]
+
+    # a source edit in the unneeded sub is only checked when a name is not found
+    (tmp_path / "unused" / "x.vhd").write_text((tmp_path / "unused" / "x.vhd").read_text() + "-- comment\n")
+    assert project.revalidate() is False
+    assert unloaded_subs(project) == ["unused/s.toml"]
+
+    # a sub whose config changed is loaded, not the whole project
+    (tmp_path / "unused" / "s.toml").write_text('vhdl_files_glob = ["*.vhd"]\n# comment\n')
+    assert project.revalidate() is False
+    assert unloaded_subs(project) == []
@@ -0,0 +1,71 @@
+"""The pre_cmds of a config, skipped when their outputs are up to date"""
+import os
+from pathlib import Path
+
+from synthetic_project import write_entity, file_names
+
+LIST_CMD = "ls src/*.vhd > files.txt && echo run >> runs.log"
+
+
+def write_config(root: Path, pre_cmds: str) -> Path:
+    (root / "src").mkdir(parents=True, exist_ok=True)
+    write_entity(root / "src" / "a.vhd", "a")
+    config_loc = root / "p.toml"
+    config_loc.write_text(f'pre_cmds = {pre_cmds}\nvhdl_files_file = ["files.txt"]\n')
+    return config_loc
+
+
+def runs(root: Path) -> int:
+    return len((root / "runs.log").read_text().splitlines())
+
+
+def file_list(hdldepends_cli, root: Path):
+    result = hdldepends_cli(["p.toml", "--no-pickle", "--file-list", "files.out", "-v"], cwd=root)
+    return result, sorted(file_names(root / "files.out"))
+
+
+def test_up_to_date_pre_cmd_is_skipped(hdldepends_cli, tmp_path):
+    write_config(tmp_path, f'[{{cmd = "{LIST_CMD}", inputs = ["src/*.vhd"], outputs = ["files.txt"]}}]')
+    file_list(hdldepends_cli, tmp_path)
+    result, names = file_list(hdldepends_cli, tmp_path)
+    assert runs(tmp_path) == 1
+    assert "outputs are up to date" in result.stderr
+    assert names == ["a.vhd"]
+
+
+def test_pre_cmd_without_outputs_always_runs(hdldepends_cli, tmp_path):
+    write_config(tmp_path, f'["{LIST_CMD}"]')
+    file_list(hdldepends_cli, tmp_path)
+    file_list(hdldepends_cli, tmp_path)
+    assert runs(tmp_path) == 2
+
+
+def test_new_file_matching_glob_input_reruns_pre_cmd(hdldepends_cli, tmp_path):
+    write_config(tmp_path, f'[{{cmd = "{LIST_CMD}", inputs = ["src/*.vhd"], outputs = ["files.txt"]}}]')
+    file_list(hdldepends_cli, tmp_path)
+    new_loc = tmp_path / "src" / "b.vhd"
+    write_entity(new_loc, "b")
+    newer = os.stat(tmp_path / "files.txt").st_mtime + 10
+    os.utime(new_loc, (newer, newer))
+    _, names = file_list(hdldepends_cli, tmp_path)
+    assert runs(tmp_path) == 2
+    assert names == ["a.vhd", "b.vhd"]
+
+
+def test_edited_config_reruns_pre_cmd(hdldepends_cli, tmp_path):
+    config_loc = write_config(tmp_path, f'[{{cmd = "{LIST_CMD}", inputs = ["src/*.vhd"], outputs = ["files.txt"]}}]')
+    file_list(hdldepends_cli, tmp_path)
+    newer = os.stat(tmp_path / "files.txt").st_mtime + 10
+    os.utime(config_loc, (newer, newer))
+    file_list(hdldepends_cli, tmp_path)
+    assert runs(tmp_path) == 2
+
+
+def test_failed_pre_cmd_shows_its_output(hdldepends_cli, tmp_path):
+    write_config(tmp_path, '["echo to-stdout; echo to-stderr 1>&2; exit 3"]')
+    result = hdldepends_cli(["p.toml", "--no-pickle", "--file-list", "files.out"], cwd=tmp_path, check=False)
+    assert result.returncode != 0
+    output = result.stdout + result.stderr
+    assert "failed with exit code 3" in output
+    assert "to-stdout" in output
+    assert "to-stderr" in output
@@ -0,0 +1,91 @@
+"""The Python API (Project)"""
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from hdldepends import Project
+from synthetic_project import write_entity, write_project
+
+ENTITIES = {"top": ["a", "b"], "a": ["b"], "b": [], "a_tb": ["a"], "b_tb": ["b"]}
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Project:
+    config_loc = write_project(tmp_path, ENTITIES, extra_config='ignore_entities = ["vendor_ip"]\next_files = ["run.tcl"]\n')
+    return Project(config_loc, use_cache=False, write_cache=False)
+
+
+def names(files) -> list:
+    return [f.path.name for f in files]
+
+
+def touch_later(loc: Path):
+    """Move the modification time of loc on, so an edit in the same second is seen"""
+    t = max(time.time(), loc.stat().st_mtime + 1)
+    os.utime(loc, (t, t))
+
+
+def test_compile_order_of_several_tops(project, tmp_path):
+    assert names(project.compile_order()) == ["b.vhd", "a.vhd", "top.vhd"]
+    assert names(project.compile_order(top_entity="a_tb")) == ["b.vhd", "a.vhd", "a_tb.vhd"]
+    assert names(project.compile_order(top_entity="b_tb")) == ["b.vhd", "b_tb.vhd"]
+    assert names(project.compile_order(top_file=tmp_path / "a.vhd")) == ["b.vhd", "a.vhd"]
+    # asking for another top does not change the default top
+    assert names(project.compile_order()) == ["b.vhd", "a.vhd", "top.vhd"]
+    assert all(f.file_type == "VHDL" and f.library == "work" for f in project.compile_order())
+
+
+def test_compile_order_waves(project):
+    assert [names(wave) for wave in project.compile_order_waves()] == [["b.vhd"], ["a.vhd"], ["top.vhd"]]
+    assert [names(wave) for wave in project.compile_order_waves(top_entity="b_tb")] == [["b.vhd"], ["b_tb.vhd"]]
+
+
+def test_file_list(project):
+    assert sorted(names(project.file_list())) == sorted(f"{name}.vhd" for name in ENTITIES)
+    assert sorted(names(project.file_list(file_type="vhdl", lib="work"))) == sorted(f"{name}.vhd" for name in ENTITIES)
+    assert project.file_list(file_type="verilog") == []
+
+
+def test_ext_files(project, tmp_path):
+    assert project.ext_files() == {None: [(tmp_path / "run.tcl").resolve()]}
+
+
+def test_entities(project):
+    assert project.entities(["*_tb"]) == ["a_tb", "b_tb"]
+
+
+def test_revalidate_after_a_source_edit(project, tmp_path):
+    write_entity(tmp_path / "b.vhd", "b", ["b_tb"])
+    touch_later(tmp_path / "b.vhd")
+    assert project.revalidate() is False
+    assert names(project.compile_order(top_entity="a_tb")) == ["b_tb.vhd", "b.vhd", "a.vhd", "a_tb.vhd"]
+
+
+def test_revalidate_after_a_config_edit(project, tmp_path):
+    write_project(tmp_path, dict(ENTITIES, c=[]), extra_config='ignore_entities = ["vendor_ip"]\n')
+    touch_later(tmp_path / "p.toml")
+    assert project.revalidate() is True
+    assert "c.vhd" in names(project.file_list())
+    assert project.ext_files() == {}
+
+
+def test_entity_location(project, tmp_path):
+    assert project.entity_location("top") == (tmp_path / "top.vhd").resolve()
+    assert project.entity_location("TOP", lib="work") == (tmp_path / "top.vhd").resolve()
+
+
+def test_entity_location_of_a_missing_entity_is_a_key_error(project):
+    with pytest.raises(KeyError):
+        project.entity_location("missing")
+
+
+def test_entity_location_of_an_ignored_entity_is_a_key_error(project):
+    with pytest.raises(KeyError, match="ignored"):
+        project.entity_location("vendor_ip")
+
+
+def test_compile_order_of_an_ignored_top_is_a_key_error(project):
+    with pytest.raises(KeyError, match="ignored"):
+        project.compile_order(top_entity="vendor_ip")
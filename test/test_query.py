@@ -0,0 +1,73 @@
+"""hdldepends query: answers from the index of a project"""
+import json
+from pathlib import Path
+
+from synthetic_project import write_entity
+
+
+def write_project(root: Path):
+    (root / "pkg.vhd").write_text("package pkg is\n  constant W : integer := 8;\nend package;\n")
+    write_entity(root / "leaf.vhd", "leaf", packages=["pkg"])
+    write_entity(root / "mid.vhd", "mid", ["leaf"])
+    write_entity(root / "top.vhd", "top", ["mid", "leaf"])
+    (root / "p.toml").write_text('vhdl_files = ["pkg.vhd", "leaf.vhd", "mid.vhd", "top.vhd"]\ntop_entity = "top"\n')
+
+
+def query(hdldepends_cli, root: Path, *args: str):
+    """The JSON answer and whether the project had to be loaded for it"""
+    result = hdldepends_cli(["query", "p.toml"] + list(args) + ["-v"], cwd=root)
+    return json.loads(result.stdout), "out of date" in result.stdout + result.stderr
+
+
+def names(files) -> list:
+    return sorted(Path(f["path"]).name for f in files)
+
+
+def test_entity_and_package(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    answer, loaded = query(hdldepends_cli, tmp_path, "entity", "MID")
+    assert loaded
+    assert names(answer["files"]) == ["mid.vhd"]
+    assert answer["files"][0]["library"] == "work"
+
+    answer, loaded = query(hdldepends_cli, tmp_path, "package", "pkg")
+    assert not loaded  # the index written by the first query is current
+    assert names(answer["files"]) == ["pkg.vhd"]
+
+    answer, _ = query(hdldepends_cli, tmp_path, "entity", "missing")
+    assert answer["files"] == []
+
+
+def test_deps_and_rdeps(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    answer, _ = query(hdldepends_cli, tmp_path, "deps", "top.vhd")
+    (top,) = answer["files"]
+    assert names(top["deps"]) == ["leaf.vhd", "mid.vhd"]
+    assert sorted(use["name"] for use in top["uses"]) == ["leaf", "mid"]
+
+    answer, loaded = query(hdldepends_cli, tmp_path, "rdeps", "leaf.vhd")
+    assert not loaded
+    assert names(answer["files"][0]["rdeps"]) == ["mid.vhd", "top.vhd"]
+    answer, _ = query(hdldepends_cli, tmp_path, "rdeps", "pkg.vhd")
+    assert names(answer["files"][0]["rdeps"]) == ["leaf.vhd"]
+
+    # the index follows the caches, so an edit is only seen by a query checking the sources
+    write_entity(tmp_path / "mid.vhd", "mid")
+    answer, loaded = query(hdldepends_cli, tmp_path, "rdeps", "leaf.vhd")
+    assert not loaded
+    answer, loaded = query(hdldepends_cli, tmp_path, "rdeps", "leaf.vhd", "--check-sources")
+    assert loaded
+    assert names(answer["files"][0]["rdeps"]) == ["top.vhd"]
+
+
+def test_a_run_loading_the_project_makes_the_index_out_of_date(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    query(hdldepends_cli, tmp_path, "rdeps", "leaf.vhd")
+
+    # the run notes the edit in the cache, the next query loads the project and writes the index again
+    write_entity(tmp_path / "mid.vhd", "mid")
+    hdldepends_cli(["p.toml", "--compile-order", "co.txt"], cwd=tmp_path)
+    answer, loaded = query(hdldepends_cli, tmp_path, "rdeps", "leaf.vhd")
+    assert loaded
+    assert names(answer["files"][0]["rdeps"]) == ["top.vhd"]
+    assert not query(hdldepends_cli, tmp_path, "rdeps", "leaf.vhd")[1]
@@ -0,0 +1,58 @@
+"""--recompile-order: which files are compiled again after an edit"""
+import json
+from pathlib import Path
+
+PKG_A = "package pkg_a is\n  constant W : integer := {w};\nend package;\n"
+PKG_B = "library work;\nuse work.pkg_a.all;\n\npackage pkg_b is\n  constant W2 : integer := W * 2;\nend package;\n"
+ENTITY_C = "library work;\nuse work.pkg_b.all;\n\nentity c is\nend entity;\narchitecture a of c is\nbegin\nend architecture;\n"
+
+
+def write_project(root: Path, w: int = 8):
+    (root / "a.vhd").write_text(PKG_A.format(w=w))
+    (root / "b.vhd").write_text(PKG_B)
+    (root / "c.vhd").write_text(ENTITY_C)
+    (root / "p.toml").write_text('vhdl_files = ["a.vhd", "b.vhd", "c.vhd"]\ntop_entity = "c"\n')
+
+
+def recompile(hdldepends_cli, root: Path):
+    hdldepends_cli(["p.toml", "--no-pickle", "--recompile-order", "r.txt", "--recompile-manifest", "m.json"], cwd=root)
+    return [Path(line.split()[-1]).name for line in (root / "r.txt").read_text().splitlines() if line.strip()]
+
+
+def test_interface_change_propagates_through_a_chain(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    assert recompile(hdldepends_cli, tmp_path) == ["a.vhd", "b.vhd", "c.vhd"]
+    assert recompile(hdldepends_cli, tmp_path) == []
+
+    (tmp_path / "a.vhd").write_text(PKG_A.format(w=16))
+    assert recompile(hdldepends_cli, tmp_path) == ["a.vhd", "b.vhd", "c.vhd"]
+
+
+def test_package_declaration_file_edit_makes_users_stale(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    recompile(hdldepends_cli, tmp_path)
+
+    # analysing pkg_a again obsoletes the units using it, even if only a comment changed
+    (tmp_path / "a.vhd").write_text("-- comment\n" + PKG_A.format(w=8))
+    assert recompile(hdldepends_cli, tmp_path) == ["a.vhd", "b.vhd", "c.vhd"]
+
+
+def test_edit_of_the_top_only_recompiles_it(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    recompile(hdldepends_cli, tmp_path)
+
+    (tmp_path / "c.vhd").write_text(ENTITY_C + "-- comment\n")
+    assert recompile(hdldepends_cli, tmp_path) == ["c.vhd"]
+
+
+def test_vhdl_units_have_no_fingerprint(hdldepends_cli, tmp_path):
+    write_project(tmp_path)
+    recompile(hdldepends_cli, tmp_path)
+
+    # their users are compiled again whatever changed, so the declarations are not hashed
+    files = json.loads((tmp_path / "m.json").read_text())["files"]
+    assert {Path(entry["path"]).name: entry["units"] for entry in files} == {
+        "a.vhd": {"package:pkg_a": None},
+        "b.vhd": {"package:pkg_b": None},
+        "c.vhd": {"entity:c": None},
+    }
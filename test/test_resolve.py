@@ -0,0 +1,122 @@
+"""The internal resolution API (Lookup.resolve_*) and the public get_* methods built on it"""
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from hdldepends import Project
+from hdldepends.hdldepends import Name, ResolveMiss
+from synthetic_project import write_entity
+
+
+@pytest.fixture
+def look(tmp_path: Path):
+    write_entity(tmp_path / "a.vhd", "a", packages=["pkg"])
+    (tmp_path / "pkg.vhd").write_text("package pkg is\nend package;\n")
+    (tmp_path / "p.toml").write_text(
+        'vhdl_files = ["a.vhd", "pkg.vhd"]\ntop_entity = "a"\nignore_entities = ["vendor_ip"]\nignore_packages = ["vendor_pkg"]\n'
+    )
+    return Project(tmp_path / "p.toml", use_cache=False, write_cache=False).look
+
+
+def test_unknown_names_are_misses(look):
+    assert isinstance(look.resolve_entity(Name("work", "nope")), ResolveMiss)
+    assert isinstance(look.resolve_entity(Name("work", "nope"), ignore_lib=True), ResolveMiss)
+    assert isinstance(look.resolve_vhdl_package(Name("work", "nope")), ResolveMiss)
+    assert isinstance(look.resolve_verilog_package(Name("work", "nope")), ResolveMiss)
+
+
+def test_known_and_ignored_names(look):
+    assert look.resolve_entity(Name("work", "a")).loc.name == "a.vhd"
+    assert look.resolve_vhdl_package(Name("work", "pkg")).loc.name == "pkg.vhd"
+    assert look.resolve_entity(Name("work", "vendor_ip")) is None
+    assert look.resolve_vhdl_package(Name("work", "vendor_pkg")) is None
+
+
+def test_miss_is_cached_until_the_generation_changes(look, monkeypatch):
+    calls = []
+    resolve = look._resolve_entity
+
+    def counted(name, ignore_lib=False):
+        calls.append(name)
+        return resolve(name, ignore_lib)
+
+    monkeypatch.setattr(look, "_resolve_entity", counted)
+    miss = look.resolve_entity(Name("work", "nope"))
+    assert look.resolve_entity(Name("work", "nope")) is miss
+    assert len(calls) == 1
+
+    look.bump_generation()
+    new_miss = look.resolve_entity(Name("work", "nope"))
+    assert isinstance(new_miss, ResolveMiss)
+    assert new_miss is not miss
+    assert len(calls) == 2
+
+
+def test_public_api_raises_for_unknown_names(look):
+    with pytest.raises(KeyError):
+        look.get_entity(Name("work", "nope"), f_obj_required_by=None)
+    with pytest.raises(KeyError):
+        look.get_vhdl_package(Name("work", "nope"), f_obj_required_by=None)
+    with pytest.raises(KeyError):
+        look.get_verilog_package(Name("work", "nope"), f_obj_required_by=None)
+    # the miss is cached, the public API still raises every time
+    with pytest.raises(KeyError):
+        look.get_entity(Name("work", "nope"), f_obj_required_by=None)
+
+
+def test_public_api_returns_none_for_ignored_names(look):
+    assert look.get_entity(Name("work", "vendor_ip"), f_obj_required_by=None) is None
+    assert look.get_vhdl_package(Name("work", "vendor_pkg"), f_obj_required_by=None) is None
+    assert look.get_entity(Name("work", "a"), f_obj_required_by=None).loc.name == "a.vhd"
+
+
+def test_resolved_deps_are_reused_while_the_generation_is_unchanged(look, monkeypatch):
+    f_obj = look.get_entity(Name("work", "a"), f_obj_required_by=None)
+    calls = []
+    resolve = f_obj._resolve_file_deps
+
+    def counted(lookup):
+        calls.append(lookup)
+        return resolve(lookup)
+
+    monkeypatch.setattr(f_obj, "_resolve_file_deps", counted)
+    resolved = look.resolve_file_deps(f_obj)
+    assert look.resolve_file_deps(f_obj) is resolved
+    assert len(calls) == 1
+    assert [dep.loc.name for dep in resolved.f_objs] == ["pkg.vhd"]
+
+    look.bump_generation()
+    assert look.resolve_file_deps(f_obj) is not resolved
+    assert len(calls) == 2
+
+
+def test_resolved_deps_follow_an_edit(tmp_path):
+    write_entity(tmp_path / "a.vhd", "a", packages=["pkg"])
+    for name in ["pkg", "pkg2"]:
+        (tmp_path / f"{name}.vhd").write_text(f"package {name} is\nend package;\n")
+    (tmp_path / "p.toml").write_text('vhdl_files = ["a.vhd", "pkg.vhd", "pkg2.vhd"]\ntop_entity = "a"\n')
+    project = Project(tmp_path / "p.toml", use_cache=False, write_cache=False)
+    assert [f.path.name for f in project.compile_order()] == ["pkg.vhd", "a.vhd"]
+
+    write_entity(tmp_path / "a.vhd", "a", packages=["pkg", "pkg2"])
+    t = max(time.time(), (tmp_path / "a.vhd").stat().st_mtime + 1)
+    os.utime(tmp_path / "a.vhd", (t, t))
+    assert project.look.check_for_src_files_updates()
+    f_obj = project.look.get_entity(Name("work", "a"), f_obj_required_by=None)
+    assert sorted(dep.loc.name for dep in project.look.resolve_file_deps(f_obj).f_objs) == ["pkg.vhd", "pkg2.vhd"]
+    assert [f.path.name for f in project.compile_order()] == ["pkg.vhd", "pkg2.vhd", "a.vhd"]
+
+
+def test_find_entity_required(look):
+    assert look.find_entity_required(Name("work", "a")).loc.name == "a.vhd"
+    with pytest.raises(KeyError, match="is ignored"):
+        look.find_entity_required(Name("work", "vendor_ip"))
+    with pytest.raises(KeyError):
+        look.find_entity_required(Name("work", "nope"))
+
+
+def test_ignored_top_entity_is_a_key_error(look):
+    with pytest.raises(KeyError, match="is ignored"):
+        look.set_top_entity(Name("work", "vendor_ip"), do_not_replace_top_file=False)
@@ -0,0 +1,135 @@
+"""hdldepends serve / client round trips on a Unix socket"""
+import os
+import sys
+import json
+import socket
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from synthetic_project import write_entity, write_project
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+def start_server(root: Path, config_loc: Path, socket_loc: Path, args=("--no-pickle",)) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(SRC_DIR)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "hdldepends.hdldepends", "serve", str(config_loc), "--socket", str(socket_loc)] + list(args),
+        cwd=root,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    assert "serving" in server.stdout.readline()
+    return server
+
+
+@pytest.fixture
+def served(tmp_path):
+    config_loc = write_project(tmp_path, {"top": ["a"], "a": [], "a_tb": ["a"]}, extra_config='ignore_entities = ["vendor_ip"]\n')
+    socket_loc = tmp_path / "s.sock"
+    server = start_server(tmp_path, config_loc, socket_loc)
+    yield tmp_path, socket_loc, server
+    if server.poll() is None:
+        server.kill()
+    server.communicate()
+
+
+def request(socket_loc: Path, **req) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_loc))
+        sock.sendall((json.dumps(req) + "\n").encode())
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def test_round_trip(hdldepends_cli, served):
+    root, socket_loc, _ = served
+    out = hdldepends_cli(["client", socket_loc, "compile-order", "--top-entity", "a_tb"], root).stdout
+    assert [Path(line.split()[-1]).name for line in out.splitlines()] == ["a.vhd", "a_tb.vhd"]
+    out = hdldepends_cli(["client", socket_loc, "entity-location", "--name", "a"], root).stdout
+    assert out == f"{(root / 'a.vhd').resolve()}\n"
+    assert sorted(Path(line.split()[-1]).name for line in request(socket_loc, cmd="file-list")["text"].splitlines()) == [
+        "a.vhd",
+        "a_tb.vhd",
+        "top.vhd",
+    ]
+
+
+def test_ignored_entity_is_an_error_reply(served):
+    _, socket_loc, _ = served
+    for reply in [request(socket_loc, cmd="entity-location", name="vendor_ip"), request(socket_loc, cmd="compile-order", top_entity="vendor_ip")]:
+        assert reply["ok"] is False
+        assert "ignored" in reply["error"]
+    assert request(socket_loc, cmd="ping")["ok"] is True
+
+
+def test_an_open_connection_does_not_block_others(served):
+    _, socket_loc, _ = served
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+        idle.connect(str(socket_loc))
+        idle.settimeout(10)
+        assert request(socket_loc, cmd="compile-order")["ok"] is True
+
+
+def test_shutdown_removes_the_socket(served):
+    _, socket_loc, server = served
+    assert request(socket_loc, cmd="shutdown")["ok"] is True
+    assert server.wait(timeout=10) == 0
+    assert not socket_loc.exists()
+
+
+def test_a_live_socket_is_not_taken_over(hdldepends_cli, served):
+    root, socket_loc, _ = served
+    result = hdldepends_cli(["serve", "p.toml", "--no-pickle", "--socket", socket_loc], root, check=False)
+    assert result.returncode != 0
+    assert "already running" in result.stderr
+    assert request(socket_loc, cmd="ping")["ok"] is True
+
+
+def test_a_stale_socket_is_replaced(tmp_path):
+    config_loc = write_project(tmp_path, {"top": []})
+    socket_loc = tmp_path / "s.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stopped:
+        stopped.bind(str(socket_loc))  # bound but never listening, like the socket of a killed server
+    server = start_server(tmp_path, config_loc, socket_loc)
+    try:
+        assert request(socket_loc, cmd="ping")["ok"] is True
+        request(socket_loc, cmd="shutdown")
+        assert server.wait(timeout=10) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
+        server.communicate()
+
+
+def test_request_does_not_load_unneeded_subs(hdldepends_cli, tmp_path):
+    for sub, entity in [("used", "u"), ("unused", "x")]:
+        (tmp_path / sub).mkdir()
+        (tmp_path / sub / "s.toml").write_text('vhdl_files_glob = ["*.vhd"]\n')
+        write_entity(tmp_path / sub / f"{entity}.vhd", entity)
+    write_entity(tmp_path / "top.vhd", "top", ["u"])
+    config_loc = tmp_path / "p.toml"
+    config_loc.write_text('sub = ["used/s.toml", "unused/s.toml"]\nvhdl_files = ["top.vhd"]\ntop_entity = "top"\n')
+    hdldepends_cli(["p.toml"], cwd=tmp_path)  # writes the pickles
+
+    socket_loc = tmp_path / "s.sock"
+    server = start_server(tmp_path, config_loc, socket_loc, args=["-v"])
+    try:
+        for _ in range(2):
+            reply = request(socket_loc, cmd="compile-order")
+            assert [Path(line.split()[-1]).name for line in reply["text"].splitlines()] == ["u.vhd", "top.vhd"]
+        request(socket_loc, cmd="shutdown")
+        assert server.wait(timeout=10) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
+        _, err = server.communicate()
+    assert "loading sub config used/s.toml" in err
+    assert "loading sub config unused/s.toml" not in err
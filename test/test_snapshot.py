@@ -0,0 +1,92 @@
+"""The --snapshot cache of a whole project, with a fingerprint per config"""
+import os
+from pathlib import Path
+from typing import List
+
+from synthetic_project import entity_name, file_names, write_entity, write_tree
+
+
+def run_log(hdldepends_cli, root: Path, args: List[str]) -> List[str]:
+    result = hdldepends_cli(["p.toml", "-v"] + args, cwd=root)
+    return (result.stdout + result.stderr).splitlines()
+
+
+def loaded_from_snapshot(lines: List[str]) -> List[str]:
+    """The configs (relative to the project) a run loaded from the snapshot"""
+    return sorted(line.split("loaded ")[1].split(" from snapshot")[0] for line in lines if " from snapshot" in line)
+
+
+def mark_edited(root: Path, locs: List[Path]):
+    """Give the edited files a modification time after every cache, so the edits are seen whatever the file system resolution"""
+    newer = max(os.stat(cache).st_mtime for cache in root.rglob("*.pickle")) + 10
+    for loc in locs:
+        os.utime(loc, (newer, newer))
+
+
+def edit_sub_config(root: Path, sub: str):
+    loc = root / sub / "s.toml"
+    loc.write_text('vhdl_files_glob = ["*.vhd"]\n# comment\n')
+    mark_edited(root, [loc])
+
+
+def test_warm_run_is_served_from_the_snapshot(hdldepends_cli, tmp_path):
+    write_tree(tmp_path, depth=2, width=3, subs=2)
+    run_log(hdldepends_cli, tmp_path, ["--snapshot", "--file-list", "files.txt"])
+    assert (tmp_path / ".p.snapshot.pickle").is_file()
+
+    lines = run_log(hdldepends_cli, tmp_path, ["--snapshot", "--file-list", "files.txt"])
+    assert loaded_from_snapshot(lines) == ["p.toml", "s0/s.toml", "s1/s.toml"]
+    assert not any("atempting to load cache" in line for line in lines)
+    assert not any("writing snapshot" in line for line in lines)
+
+
+def test_stale_sub_entry_falls_back_to_its_pickle(hdldepends_cli, tmp_path):
+    write_tree(tmp_path, depth=2, width=3, subs=2)
+    run_log(hdldepends_cli, tmp_path, ["--snapshot", "--file-list", "files.txt"])
+    # the pickle of s1 is brought up to date by a run without the snapshot, its snapshot entry is not
+    edit_sub_config(tmp_path, "s1")
+    run_log(hdldepends_cli, tmp_path, ["--file-list", "files.txt"])
+
+    lines = run_log(hdldepends_cli, tmp_path, ["--snapshot", "--file-list", "files.txt"])
+    assert any("snapshot of" in line and "s1" in line and "out of date" in line for line in lines)
+    assert any("loaded from" in line and "s1" in line and ".pickle" in line for line in lines)
+    assert loaded_from_snapshot(lines) == ["p.toml", "s0/s.toml"]
+    assert any("writing snapshot" in line for line in lines)
+
+    lines = run_log(hdldepends_cli, tmp_path, ["--snapshot", "--file-list", "files.txt"])
+    assert loaded_from_snapshot(lines) == ["p.toml", "s0/s.toml", "s1/s.toml"]
+
+
+def test_unused_entries_are_kept(hdldepends_cli, tmp_path):
+    for sub, entity in [("used", "u"), ("unused", "x")]:
+        (tmp_path / sub).mkdir()
+        (tmp_path / sub / "s.toml").write_text('vhdl_files_glob = ["*.vhd"]\n')
+        write_entity(tmp_path / sub / f"{entity}.vhd", entity)
+    write_entity(tmp_path / "top.vhd", "top", ["u"])
+    (tmp_path / "p.toml").write_text('sub = ["used/s.toml", "unused/s.toml"]\nvhdl_files = ["top.vhd"]\ntop_entity = "top"\n')
+    run_log(hdldepends_cli, tmp_path, ["--snapshot", "--file-list", "files.txt"])
+
+    # the compile order does not need the unused sub, the snapshot is rewritten for the edited used sub
+    edit_sub_config(tmp_path, "used")
+    lines = run_log(hdldepends_cli, tmp_path, ["--snapshot", "--compile-order", "co.txt"])
+    assert not any("unused/s.toml" in line or "sub config unused" in line for line in lines)
+    assert any("writing snapshot" in line for line in lines)
+
+    lines = run_log(hdldepends_cli, tmp_path, ["--snapshot", "--file-list", "files.txt"])
+    assert loaded_from_snapshot(lines) == ["p.toml", "unused/s.toml", "used/s.toml"]
+
+
+def test_cross_sub_edit_gives_the_no_pickle_order(hdldepends_cli, tmp_path):
+    write_tree(tmp_path, depth=3, width=4, subs=3)
+    run_log(hdldepends_cli, tmp_path, ["--snapshot", "--compile-order", "co.txt"])
+
+    # e1_1 (in s1) now instantiates e2_0 (in s0), which instantiates e2_2 (in s2)
+    write_entity(tmp_path / "s1" / "e1_1.vhd", entity_name(1, 1), [entity_name(2, 0)])
+    write_entity(tmp_path / "s0" / "e2_0.vhd", entity_name(2, 0), [entity_name(2, 2)])
+    mark_edited(tmp_path, [tmp_path / "s1" / "e1_1.vhd", tmp_path / "s0" / "e2_0.vhd"])
+
+    run_log(hdldepends_cli, tmp_path, ["--snapshot", "--compile-order", "co.txt"])
+    run_log(hdldepends_cli, tmp_path, ["--no-pickle", "--compile-order", "co_no_pickle.txt"])
+    order = file_names(tmp_path / "co.txt")
+    assert order == file_names(tmp_path / "co_no_pickle.txt")
+    assert order.index("e2_2.vhd") < order.index("e2_0.vhd") < order.index("e1_1.vhd")
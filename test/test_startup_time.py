@@ -0,0 +1,70 @@
+"""A warm cache `hdldepends <cfg> --compile-order` run stays fast, CI pipelines call it thousands of times"""
+import os
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+from synthetic_project import write_tree
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# milliseconds a warm cache run may take on top of starting the interpreter, about 110 ms on the machine it was set
+# on (interpreter start about 90 ms)
+STARTUP_BUDGET_MS = 300
+
+# imported by the code that needs them, a warm cache run needs none of them
+DEFERRED_MODULES = ["xml.etree.ElementTree", "subprocess", "yaml", "sqlite3", "tarfile", "socketserver"]
+
+# only needed by the command line, some outputs and writing files, importing the module for the Python API needs none
+API_DEFERRED_MODULES = ["argparse", "json", "shlex", "tempfile"]
+
+# the way the hdldepends script calls it, so the bytecode of the module is cached (python -m compiles it every run)
+ENTRY_POINT = "import sys; from hdldepends.hdldepends import hdldepends; sys.exit(hdldepends())"
+
+
+def run_env(tmp_path: Path):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(SRC_DIR)
+    env["PYTHONPYCACHEPREFIX"] = str(tmp_path / "pycache")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def best_run_ms(cmd, cwd: Path, env, runs: int = 3) -> float:
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, env=env, check=True, capture_output=True)
+        ms = (time.perf_counter() - start) * 1000
+        best = ms if best is None else min(best, ms)
+    return best
+
+
+def test_warm_compile_order_time(tmp_path):
+    config_loc = write_tree(tmp_path / "prj", depth=4, width=10, subs=3)
+    env = run_env(tmp_path)
+    cmd = [sys.executable, "-c", ENTRY_POINT, str(config_loc), "--compile-order", str(tmp_path / "co.txt")]
+    subprocess.run(cmd, cwd=tmp_path, env=env, check=True, capture_output=True)  # write the caches and the bytecode
+
+    interpreter_ms = best_run_ms([sys.executable, "-c", "pass"], tmp_path, env)
+    warm_ms = best_run_ms(cmd, tmp_path, env)
+    assert warm_ms - interpreter_ms < STARTUP_BUDGET_MS, f"warm run took {warm_ms:.0f} ms (interpreter start {interpreter_ms:.0f} ms)"
+
+
+def test_warm_compile_order_imports(tmp_path):
+    config_loc = write_tree(tmp_path / "prj", depth=2, width=4)
+    env = run_env(tmp_path)
+    cmd = [sys.executable, "-X", "importtime", "-c", ENTRY_POINT, str(config_loc), "--compile-order", str(tmp_path / "co.txt")]
+    subprocess.run(cmd, cwd=tmp_path, env=env, check=True, capture_output=True)
+    result = subprocess.run(cmd, cwd=tmp_path, env=env, check=True, capture_output=True, text=True)
+    modules = {line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+    imported = [module for module in DEFERRED_MODULES if module in modules]
+    assert imported == [], f"{imported} are imported by a warm cache run"
+
+
+def test_import_does_not_import_deferred_modules(tmp_path):
+    modules = DEFERRED_MODULES + API_DEFERRED_MODULES
+    code = f"import sys, hdldepends.hdldepends; print([module for module in {modules!r} if module in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=run_env(tmp_path), check=True, capture_output=True, text=True)
+    assert result.stdout.strip() == "[]", f"{result.stdout.strip()} are imported by import hdldepends.hdldepends"
@@ -0,0 +1,38 @@
+"""--top-entities: a compile order per top in one run, the same as a --top-entity run for each top"""
+from synthetic_project import write_entity, write_project
+
+ENTITIES = {
+    "a": ["c"],
+    "b": ["c", "d"],
+    "c": ["d"],
+    "d": [],
+    "a_tb": ["a"],
+    "b_tb": ["b", "a"],
+    "d_tb": ["d"],
+    "top": ["a", "b"],
+}
+
+
+def test_batch_matches_single_runs(hdldepends_cli, tmp_path):
+    write_project(tmp_path, ENTITIES)
+    # a package, and a sub config, shared by the tops
+    (tmp_path / "pkg.vhd").write_text("package pkg is\nend package;\n")
+    write_entity(tmp_path / "d.vhd", "d", packages=["pkg"])
+    (tmp_path / "sub").mkdir()
+    write_entity(tmp_path / "sub" / "e.vhd", "e")
+    write_entity(tmp_path / "c.vhd", "c", ["d", "e"])
+    (tmp_path / "sub" / "s.toml").write_text('vhdl_files = ["e.vhd"]\n')
+    vhdl_files = ", ".join(f'"{name}.vhd"' for name in ["pkg"] + list(ENTITIES))
+    # no top_entity, a --top-entity run would have to match it
+    (tmp_path / "p.toml").write_text(f'sub = ["sub/s.toml"]\nvhdl_files = [{vhdl_files}]\n')
+
+    outputs = ["--compile-order", "{top}.txt", "--compile-order-json", "{top}.json"]
+    hdldepends_cli(["p.toml", "--top-entities", "*_tb"] + outputs, tmp_path)
+    # only the tops matching the glob are written
+    assert sorted(loc.name for loc in tmp_path.glob("*.txt")) == ["a_tb.txt", "b_tb.txt", "d_tb.txt"]
+
+    for top in ["a_tb", "b_tb", "d_tb"]:
+        single = [option.replace("{top}", f"single_{top}") for option in outputs]
+        hdldepends_cli(["p.toml", "--top-entity", top] + single, tmp_path)
+        for ext in ["txt", "json"]:
+            assert (tmp_path / f"{top}.{ext}").read_text() == (tmp_path / f"single_{top}.{ext}").read_text(), f"{top}.{ext}"
@@ -0,0 +1,59 @@
+"""--watch writes the outputs again when the project changes"""
+import os
+import sys
+import time
+import signal
+import subprocess
+from pathlib import Path
+
+from synthetic_project import file_names, write_entity, write_project
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+
+def bump_mtime(loc: Path):
+    """Move the modification time of loc on, so an edit in the same tick as the last poll is seen"""
+    t = loc.stat().st_mtime + 2
+    os.utime(loc, (t, t))
+
+
+def wait_for_order(loc: Path, expected, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    names = None
+    while time.monotonic() < deadline:
+        if loc.exists():
+            names = file_names(loc)
+            if names == expected:
+                return
+        time.sleep(0.05)
+    assert names == expected
+
+
+def test_watch_updates_the_compile_order(tmp_path):
+    write_project(tmp_path, {"top": ["a"], "a": [], "b": []})
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(SRC_DIR)
+    cmd = ["p.toml", "--no-pickle", "--compile-order", "co.txt", "--watch", "--watch-interval", "0.05", "--watch-debounce", "0.05"]
+    watch = subprocess.Popen(
+        [sys.executable, "-m", "hdldepends.hdldepends"] + cmd, cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        co_loc = tmp_path / "co.txt"
+        wait_for_order(co_loc, ["a.vhd", "top.vhd"])
+
+        # a source edit
+        write_entity(tmp_path / "a.vhd", "a", ["b"])
+        bump_mtime(tmp_path / "a.vhd")
+        wait_for_order(co_loc, ["b.vhd", "a.vhd", "top.vhd"])
+
+        # a config edit adding files, then an edit of a file only watched since the project was loaded again
+        write_project(tmp_path, {"top": ["a", "c"], "a": ["b"], "b": [], "c": [], "d": []})
+        bump_mtime(tmp_path / "p.toml")
+        wait_for_order(co_loc, ["b.vhd", "a.vhd", "c.vhd", "top.vhd"])
+        write_entity(tmp_path / "c.vhd", "c", ["d"])
+        bump_mtime(tmp_path / "c.vhd")
+        wait_for_order(co_loc, ["b.vhd", "a.vhd", "d.vhd", "c.vhd", "top.vhd"])
+    finally:
+        watch.send_signal(signal.SIGINT)
+        _, stderr = watch.communicate(timeout=20)
+    assert watch.returncode == 0, stderr